@@ -2,12 +2,11 @@ import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import ValidationError
-from tortoise.exceptions import DoesNotExist
 
 from app import schemas
 from app.core import security
 from app.core.config import get_settings
-from app.models.user import UserModel, User
+from app.utils.principals import Principal, principals
 
 settings = get_settings()
 
@@ -16,7 +15,7 @@ auth_scheme = HTTPBearer()
 
 async def get_current_user(
     token: HTTPAuthorizationCredentials = Depends(auth_scheme),
-) -> User:
+) -> Principal:
     try:
         payload = jwt.decode(
             token.credentials, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -27,28 +26,35 @@ async def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    try:
-        return await User.get(id=token_data.sub)
-    except DoesNotExist:
+    principal = None
+    if settings.AUTH_TOKEN_CLAIMS:
+        principal = await principals.from_claims(token_data)
+    if principal is None and token_data.sub is not None:
+        principal = await principals.get(token_data.sub)
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User does not exist"
         )
+    return principal
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user),
-) -> UserModel:
+    current_user: Principal = Depends(get_current_user),
+) -> Principal:
     if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
-    return await UserModel.from_tortoise_orm(current_user)
+    return current_user
 
 
 async def get_current_super_user(
-    current_user: UserModel = Depends(get_current_user),
-) -> UserModel:
-    if not current_user.is_superuser:
+    current_user: Principal = Depends(get_current_user),
+) -> Principal:
+    if current_user.is_superuser:
+        # not the token's word for it: a demotion must not wait for it to expire
+        current_user = await principals.get(current_user.id)
+    if current_user is None or not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User is not super user"
         )
@@ -1,21 +1,26 @@
 from typing import Any
+from uuid import UUID
 
 from fastapi import (
     APIRouter,
     status,
     Depends,
     HTTPException,
+    Query,
+    Request,
 )
-from fastapi_pagination import Page
-from fastapi_pagination import PaginationParams
 from fastapi_versioning import version
 
 from app import schemas
 from app.api import deps
 from app.core.config import get_settings
-from app.models.comment import Comment, CommentModel, CommentCreateModel
+from app.models.comment import Comment, CommentModel
 from app.models.video import Video
-from app.utils.paginator import comments_paginate
+from app.utils.comments import add_comment, with_replies
+from app.utils.counts import CountStrategy
+from app.utils.paginator import CursorPage, CursorParams, paginate
+from app.utils.projection import FastJSONResponse
+from app.utils.response_cache import response_cache
 
 settings = get_settings()
 
@@ -24,35 +29,93 @@ router = APIRouter()
 
 @router.get(
     "/{video_id}/",
-    response_model=Page[CommentModel],
+    response_model=CursorPage[schemas.CommentThread],
 )
 @version(1)
 async def get_comments(
-    video_id: str,
-    params: PaginationParams = Depends(),
+    request: Request,
+    video_id: UUID,
+    params: CursorParams = Depends(),
+    replies: int = Query(
+        settings.COMMENT_PREVIEW_REPLIES,
+        ge=0,
+        le=settings.COMMENT_MAX_PREVIEW_REPLIES,
+        description="Newest replies shown with each comment",
+    ),
 ) -> Any:
-    return await comments_paginate(Comment.filter(video_id=video_id), params)
+    """
+    Top-level comments of the video, newest first, each with its reply
+    count and newest replies; `replies_next` pages the rest of them from
+    the replies endpoint.
+    """
+
+    async def threads():
+        page = await paginate(
+            Comment.filter(video_id=video_id, reply_to_id__isnull=True),
+            params,
+            CommentModel,
+            count_strategy=CountStrategy.CACHED,
+        )
+        return await with_replies(page, replies)
+
+    return await response_cache.respond(
+        request, "comments", [f"comments:{video_id}"], threads
+    )
+
+
+@router.get(
+    "/{comment_id}/replies/",
+    response_model=CursorPage[CommentModel],
+)
+@version(1)
+async def get_replies(
+    comment_id: int,
+    params: CursorParams = Depends(),
+) -> Any:
+    """Replies to the comment, newest first."""
+    return FastJSONResponse(
+        await paginate(
+            Comment.filter(reply_to_id=comment_id),
+            params,
+            CommentModel,
+            count_strategy=CountStrategy.CACHED,
+        )
+    )
 
 
 @router.post(
     "/",
     response_model=CommentModel,
     responses={
+        status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest},
         status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+        status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound},
     },
 )
 @version(1)
 async def create_comment(
-    comment: CommentCreateModel,
+    comment: schemas.CommentCreate,
     user=Depends(deps.get_current_user),
 ) -> Any:
-    if await Video.filter(id=comment.video_id).exists():
-        comment_obj = await Comment.create(
-            **comment.dict(exclude_unset=True), user=user
-        )
-    else:
+    if not await Video.filter(id=comment.video_id).exists():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Video {comment.video_id} not found",
         )
+    if (
+        comment.reply_to_id is not None
+        and not await Comment.filter(
+            id=comment.reply_to_id, video_id=comment.video_id
+        ).exists()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Comment {comment.reply_to_id} is not on this video",
+        )
+    comment_obj = await add_comment(
+        user.id, comment.video_id, comment.text, comment.reply_to_id
+    )
+    await response_cache.invalidate(
+        f"comments:{comment.video_id}", f"video:{comment.video_id}"
+    )
     return await CommentModel.from_tortoise_orm(comment_obj)
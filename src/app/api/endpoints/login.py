@@ -21,8 +21,13 @@ router = APIRouter()
 @version(1)
 async def login(form_data: schemas.UserLogin) -> Any:
     user = await User.get_or_none(email=form_data.email)
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await security.verify_password(
+            form_data.password, user.password_hash
+        )
 
-    if not user or not security.verify_password(form_data.password, user.password_hash):
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password",
@@ -31,9 +36,13 @@ async def login(form_data: schemas.UserLogin) -> Any:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
+    if new_hash:
+        await User.filter(id=user.id).update(password_hash=new_hash)
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        user.id, expires_delta=access_token_expires
+        user.id,
+        expires_delta=access_token_expires,
+        claims={"is_active": user.is_active, "is_superuser": user.is_superuser},
     )
     return schemas.Token(access_token=access_token)
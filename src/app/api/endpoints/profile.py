@@ -1,19 +1,25 @@
-from typing import Any, Optional
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Any, List, Optional
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from fastapi_versioning import version
+from tortoise.exceptions import DoesNotExist
 
 from app import schemas
 from app.api import deps
 from app.core.config import get_settings
-from app.models.user import User, UserModel, UserFollowing
-from fastapi_pagination import Page
-from fastapi_pagination import PaginationParams
+from app.models.user import User, UserModel
 from app.models.video import VideoModel, Video
-from app.utils.paginator import video_paginate, users_paginate
+from app.utils.counts import CountStrategy
+from app.utils.feed import feed_sources
+from app.utils.follows import followed_ids
+from app.utils.paginator import CursorPage, CursorParams, paginate, paginate_merged
+from app.utils.projection import FastJSONResponse
 
 settings = get_settings()
 router = APIRouter()
 
+# the largest page size of the user lists
+MAX_CHECK_IDS = 100
+
 
 @router.get(
     "/my",
@@ -27,70 +33,114 @@ router = APIRouter()
 )
 @version(1)
 async def read_user(
-    current_user: UserModel = Depends(deps.get_current_active_user),
+    current_user=Depends(deps.get_current_active_user),
 ) -> Any:
-    return current_user
+    try:
+        return await UserModel.from_queryset_single(User.get(id=current_user.id))
+    except DoesNotExist:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="User does not exist"
+        )
 
 
 @router.get(
     "/my/videos",
-    response_model=Page[VideoModel],
+    response_model=CursorPage[VideoModel],
     responses={
         status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
     },
 )
 @version(1)
 async def all_videos(
-    params: PaginationParams = Depends(),
+    params: CursorParams = Depends(),
     current_user=Depends(deps.get_current_user),
 ) -> Any:
-    return await video_paginate(
-        Video.filter(user=current_user).order_by("-created"),
-        params,
+    return FastJSONResponse(
+        await paginate(Video.filter(user_id=current_user.id), params, VideoModel)
+    )
+
+
+@router.get(
+    "/my/feed",
+    response_model=CursorPage[VideoModel],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+    },
+)
+@version(1)
+async def feed(
+    params: CursorParams = Depends(),
+    current_user=Depends(deps.get_current_user),
+) -> Any:
+    """Videos of the users you follow, newest first. Totals are not available."""
+    return FastJSONResponse(
+        await paginate_merged(await feed_sources(current_user.id), params, VideoModel)
     )
 
 
 @router.get(
     "/my/followings",
-    response_model=Page[UserModel],
+    response_model=CursorPage[UserModel],
     responses={
         status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
     },
 )
 @version(1)
 async def followings(
-    params: PaginationParams = Depends(),
+    params: CursorParams = Depends(),
     current_user=Depends(deps.get_current_user),
 ) -> Any:
-    followings = (
-        await UserFollowing.filter(user=current_user)
-        .order_by("-created")
-        .values_list("following_user_id", flat=True)
+    return FastJSONResponse(
+        await paginate(
+            User.filter(followers__user_id=current_user.id),
+            params,
+            UserModel,
+            through="followers",
+            count_strategy=CountStrategy.CACHED,
+        )
     )
 
-    return await users_paginate(
-        User.filter(id__in=followings),
-        params,
-    )
+
+@router.get(
+    "/my/followings/check",
+    response_model=List[int],
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest},
+        status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+    },
+)
+@version(1)
+async def check_followings(
+    ids: List[int] = Query(..., description="Users of the page being rendered"),
+    current_user=Depends(deps.get_current_user),
+) -> Any:
+    """Those of the users `ids` you follow."""
+    if len(ids) > MAX_CHECK_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_CHECK_IDS} ids per request",
+        )
+    return await followed_ids(current_user.id, ids)
 
 
 @router.get(
     "/my/followers",
-    response_model=Page[UserModel],
+    response_model=CursorPage[UserModel],
     responses={
         status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
     },
 )
 @version(1)
 async def followers(
-    params: PaginationParams = Depends(),
+    params: CursorParams = Depends(),
     current_user=Depends(deps.get_current_user),
 ) -> Any:
-    followings = await UserFollowing.filter(following_user=current_user).values_list(
-        "user_id", flat=True
-    )
-
-    return await users_paginate(
-        User.filter(id__in=followings),
-        params,
+    return FastJSONResponse(
+        await paginate(
+            User.filter(following__following_user_id=current_user.id),
+            params,
+            UserModel,
+            through="following",
+            count_strategy=CountStrategy.CACHED,
+        )
     )
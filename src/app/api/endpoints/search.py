@@ -0,0 +1,40 @@
+from typing import Any
+
+from fastapi import APIRouter, Query
+from fastapi_versioning import version
+
+from app import schemas
+from app.core.config import get_settings
+from app.utils.projection import FastJSONResponse
+from app.utils.search import SearchKind, autocomplete, search
+
+settings = get_settings()
+router = APIRouter()
+
+
+@router.get(
+    "/",
+    response_model=schemas.SearchResults,
+)
+@version(1)
+async def search_all(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: SearchKind = SearchKind.ALL,
+    limit: int = Query(20, ge=1, le=50),
+) -> Any:
+    """Videos by title, tags by name and users by username or full name."""
+    return FastJSONResponse(await search(q, kind, limit))
+
+
+@router.get(
+    "/suggest/",
+    response_model=schemas.Suggestions,
+)
+@version(1)
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=settings.SEARCH_TRIE_TOP),
+) -> Any:
+    """Typeahead completions of tag names and usernames starting with `q`."""
+    tags, users = await autocomplete.suggest(q, limit)
+    return {"tags": tags, "users": users}
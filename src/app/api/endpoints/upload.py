@@ -0,0 +1,145 @@
+from typing import Any
+
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    Form,
+    Header,
+    HTTPException,
+    Request,
+)
+from fastapi_versioning import version
+from tortoise.timezone import now
+
+from app import schemas
+from app.api import deps
+from app.core.config import get_settings
+from app.models.video import UploadSession, UploadSessionModel
+from app.utils.video import (
+    UploadSizeExceeded,
+    create_video_with_tags,
+    finish_upload,
+    parse_tags,
+    upload_session_expiry,
+    upload_session_path,
+    write_upload_chunk,
+)
+
+settings = get_settings()
+router = APIRouter()
+
+
+async def _get_session(upload_id: str, user) -> UploadSession:
+    session = await UploadSession.get_or_none(id=upload_id, user_id=user.id)
+    if not session or (not session.completed and session.expires < now()):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return session
+
+
+@router.post(
+    "/",
+    response_model=UploadSessionModel,
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest},
+        status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+    },
+)
+@version(1)
+async def create_upload(
+    title: str = Form(...),
+    tags: str = Form(...),
+    content_type: str = Form(...),
+    size: int = Form(..., gt=0),
+    user=Depends(deps.get_current_user),
+) -> Any:
+    if content_type not in settings.UPLOAD_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect file type",
+        )
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes",
+        )
+    video_obj = await create_video_with_tags(
+        parse_tags(tags), title=title, user_id=user.id
+    )
+    session = await UploadSession.create(
+        user_id=user.id,
+        video=video_obj,
+        content_type=content_type,
+        size=size,
+        expires=upload_session_expiry(),
+    )
+    open(upload_session_path(session), "wb").close()
+    return await UploadSessionModel.from_tortoise_orm(session)
+
+
+@router.get(
+    "/{upload_id}/",
+    response_model=UploadSessionModel,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+        status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound},
+    },
+)
+@version(1)
+async def get_upload(upload_id: str, user=Depends(deps.get_current_user)) -> Any:
+    return await UploadSessionModel.from_tortoise_orm(
+        await _get_session(upload_id, user)
+    )
+
+
+@router.put(
+    "/{upload_id}/",
+    response_model=UploadSessionModel,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest},
+        status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
+        status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound},
+        status.HTTP_409_CONFLICT: {"model": schemas.HTTPBadRequest},
+    },
+)
+@version(1)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    user=Depends(deps.get_current_user),
+) -> Any:
+    """
+    Append the raw request body to the upload starting at `Upload-Offset`.
+
+    The offset must match the committed offset of the session (see GET), so a
+    client resumes a dropped upload by asking for the offset and sending the
+    rest. An encoding job is queued once the last byte has been committed.
+    """
+    session = await _get_session(upload_id, user)
+    if session.completed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Upload already completed"
+        )
+    if upload_offset != session.offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload offset mismatch, expected {session.offset}",
+        )
+
+    try:
+        await write_upload_chunk(session, upload_offset, request.stream())
+    except UploadSizeExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Upload exceeds declared size of {session.size} bytes",
+        )
+
+    if session.offset == session.size:
+        session.completed = now()
+        await session.save(update_fields=["completed"])
+        await finish_upload(session, "videos")
+    return await UploadSessionModel.from_tortoise_orm(session)
@@ -7,7 +7,16 @@ from tortoise.exceptions import DoesNotExist
 from app import schemas
 from app.api import deps
 from app.core import security
-from app.models.user import UserModel, User, UserFollowing
+from app.models.user import UserModel, User
+from app.models.comment import Comment
+from app.models.video import Video
+from app.utils.comments import remove_comments
+from app.utils.counts import invalidate_counts
+from app.utils.feed import backfill, forget_author
+from app.utils.follows import follow, remove_follows, unfollow
+from app.utils.principals import principals
+from app.utils.reactions import remove_reactions
+from app.utils.search import autocomplete
 
 router = APIRouter()
 
@@ -22,16 +31,19 @@ router = APIRouter()
 )
 @version(1)
 async def create(form_data: schemas.UserCreate) -> Any:
+    # hashed first: a busy hashing pool must not leave a user without password
+    password_hash = await security.get_password_hash(form_data.password)
     user, created = await User.get_or_create(
-        email=form_data.email, username=form_data.username
+        email=form_data.email,
+        username=form_data.username,
+        defaults={"password_hash": password_hash},
     )
     if not created:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"User with email: {form_data.email} already exists",
         )
-    user.password_hash = security.get_password_hash(form_data.password)
-    await user.save()
+    autocomplete.users.insert(user.username)
     return Response(status_code=status.HTTP_201_CREATED)
 
 
@@ -73,21 +85,17 @@ async def follow_user(
     user_id: int,
     current_user=Depends(deps.get_current_user),
 ) -> Any:
-    try:
-        print(current_user)
-        user, created = await UserFollowing.get_or_create(
-            user=current_user, following_user_id=user_id
-        )
-    except DoesNotExist:
+    if not await User.exists(id=user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"The user you want to subscribe to no longer exists",
         )
-    if not created:
+    if not await follow(current_user.id, user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"You are already subscribed to the user",
         )
+    await backfill(current_user.id, user_id)
 
 
 @router.delete(
@@ -105,7 +113,8 @@ async def un_follow_user(
     user_id: int,
     current_user=Depends(deps.get_current_user),
 ) -> Any:
-    await UserFollowing.filter(user=current_user, following_user_id=user_id).delete()
+    await unfollow(current_user.id, user_id)
+    await forget_author(current_user.id, user_id)
 
 
 @router.delete(
@@ -120,7 +129,14 @@ async def un_follow_user(
 )
 @version(1)
 async def delete_user(user_id: int, _=Depends(deps.get_current_super_user)):
+    await remove_reactions(user_id)
+    await remove_comments(user_id)
+    await remove_follows(user_id)
     deleted_count = await User.filter(id=user_id).delete()
+    await principals.invalidate(user_id)
+    # the user's videos and comments went with them
+    for model in (Video, Comment):
+        invalidate_counts(model)
     if not deleted_count:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"User {user_id} not found"
@@ -1,5 +1,5 @@
-import os
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
+from uuid import UUID
 
 from fastapi import (
     APIRouter,
@@ -10,60 +10,92 @@ from fastapi import (
     File,
     Form,
     HTTPException,
+    Path,
+    Query,
+    Request,
 )
-from fastapi.responses import FileResponse, StreamingResponse
-from fastapi_pagination import Page
-from fastapi_pagination import PaginationParams
+from fastapi.responses import RedirectResponse
 from fastapi_versioning import version
 from tortoise.exceptions import DoesNotExist
-from tortoise.expressions import F
 
 from app import schemas
 from app.api import deps
 from app.core.config import Storages
 from app.core.config import get_settings
-from app.models.video import VideoModel, Video, Tag
-from app.utils.paginator import video_paginate
-from app.utils.video import write_video, remove_video, video_streamer
+from app.core.s3 import presigned_url
+from app.core.storage import StorageNotFound, get_storage
+from app.models.video import VideoModel, Video, Tag, Reaction
+from app.utils.cache import TTLCache
+from app.utils.media_cache import video_cache
+from app.utils.counters import counter_buffer
+from app.utils.counts import CountStrategy
+from app.utils.paginator import CursorPage, CursorParams, paginate
+from app.utils.projection import FastJSONResponse
+from app.utils.reactions import react, user_reactions
+from app.utils.response_cache import response_cache
+from app.utils.streaming import MediaRequestHeaders, conditional_response
+from app.utils.tag_index import TagMatch, tag_index, tagged_page
+from app.utils.trending import trending_page
+from app.utils.video import (
+    create_video_with_tags,
+    import_videos,
+    parse_tags,
+    remove_stored_video,
+    write_video,
+)
 
 settings = get_settings()
 router = APIRouter()
 
+HLS_PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+HLS_SEGMENT_TYPE = "video/mp2t"
+# the largest page size of the feeds
+MAX_REACTION_IDS = 100
+
+# tag ids of the videos served by `get_video`, as long as their cached pages
+_video_tags = TTLCache(
+    maxsize=settings.RESPONSE_CACHE_SIZE,
+    ttl=settings.RESPONSE_CACHE_TTLS.get("video", 0) + settings.RESPONSE_CACHE_STALE,
+)
+
 
 @router.get(
     "/",
-    response_model=Page[VideoModel],
+    response_model=CursorPage[VideoModel],
     responses={
         status.HTTP_401_UNAUTHORIZED: {"model": schemas.HTTPUnauthorized},
     },
 )
 @version(1)
 async def all_videos(
-    tag: Optional[str] = None,
-    params: PaginationParams = Depends(),
+    request: Request,
+    tags: Optional[str] = Query(None, description="Comma separated tag names"),
+    mode: TagMatch = Query(TagMatch.ALL, description="Match all or any of `tags`"),
+    tag: Optional[str] = Query(None, deprecated=True, description="Use `tags`"),
+    params: CursorParams = Depends(),
 ) -> Any:
-    if tag is not None:
-        tag_obj = await Tag.get_or_none(name=tag.strip())
-        if tag_obj is not None:
-            return await video_paginate(
-                tag_obj.videos.filter(
-                    loading_status=Video.LoadingStatus.SUCCESS
-                ).order_by("-created"),
-                params,
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Video by tag not found"
-            )
-    return await video_paginate(
-        Video.filter(loading_status=Video.LoadingStatus.SUCCESS).order_by("-created"),
-        params,
-    )
+    names = [name.strip() for name in (tags or tag or "").split(",") if name.strip()]
+    if len(names) > settings.TAG_QUERY_MAX_TAGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.TAG_QUERY_MAX_TAGS} tags per query",
+        )
+
+    async def page():
+        if names:
+            return await tagged_page(names, mode, params)
+        return await paginate(
+            Video.filter(loading_status=Video.LoadingStatus.SUCCESS),
+            params,
+            VideoModel,
+            count_strategy=CountStrategy.ESTIMATE,
+        )
+
+    return await response_cache.respond(request, "videos", ["videos"], page)
 
 
 @router.post("/", status_code=status.HTTP_202_ACCEPTED)
 async def create_video(
-    tasks: BackgroundTasks,
     title: str = Form(...),
     tags: str = Form(...),
     file: UploadFile = File(...),
@@ -75,19 +107,83 @@ async def create_video(
             detail="Incorrect file type",
         )
     upload_to = "videos"
-    video_obj = await Video.create(
-        title=title,
-        user=user,
+    video_obj = await create_video_with_tags(
+        parse_tags(tags), title=title, user_id=user.id
     )
-    tag_objs = []
+    await write_video(video_obj, upload_to, file)
+    return await VideoModel.from_tortoise_orm(video_obj)
 
-    for tag in tags.strip().split(","):
-        obj, _ = await Tag.get_or_create(name=tag)
-        tag_objs.append(obj)
 
-    await video_obj.tags.add(*tag_objs)
-    tasks.add_task(write_video, video_obj, upload_to, file)
-    return await VideoModel.from_tortoise_orm(video_obj)
+@router.post(
+    "/import/",
+    response_model=schemas.VideoImportResult,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest}},
+)
+async def import_video_list(
+    videos: List[schemas.VideoImport], _=Depends(deps.get_current_super_user)
+):
+    """
+    Register already stored and encoded videos, e.g. from another service.
+    Everything is created in one transaction: all the videos or none.
+    """
+    if len(videos) > settings.VIDEO_IMPORT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.VIDEO_IMPORT_MAX_ITEMS} videos per request",
+        )
+    ids = await import_videos(videos)
+    await response_cache.invalidate("videos")
+    return {"ids": ids}
+
+
+@router.get(
+    "/cache/",
+    response_model=schemas.CacheStats,
+    responses={status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest}},
+)
+async def media_cache_stats(_=Depends(deps.get_current_super_user)):
+    """Hit, miss and byte counters of the S3 disk cache of this process."""
+    return video_cache.stats()
+
+
+@router.get(
+    "/trending/",
+    response_model=CursorPage[VideoModel],
+)
+@version(1)
+async def trending_videos(
+    tag: Optional[str] = None,
+    category: Optional[int] = None,
+    params: CursorParams = Depends(),
+) -> Any:
+    """
+    The most engaging recent videos, of a tag or a category if given.
+    Rankings are refreshed every minute or so; totals are not available.
+    """
+    return FastJSONResponse(
+        await trending_page(
+            params, tag=None if tag is None else tag.strip(), category=category
+        )
+    )
+
+
+@router.get(
+    "/reactions/",
+    response_model=Dict[str, Reaction.Kind],
+    responses={status.HTTP_400_BAD_REQUEST: {"model": schemas.HTTPBadRequest}},
+)
+async def my_reactions(
+    ids: List[UUID] = Query(..., description="Videos of the page being rendered"),
+    user=Depends(deps.get_current_active_user),
+):
+    """The current user's reactions to the videos `ids`, missing where there is none."""
+    if len(ids) > MAX_REACTION_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_REACTION_IDS} ids per request",
+        )
+    return await user_reactions(user.id, ids)
 
 
 @router.get(
@@ -96,54 +192,157 @@ async def create_video(
     responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
 )
 async def get_video(
+    request: Request,
+    video_id: UUID,
+):
+    """
+    The video, from the response cache: its `views` may lag by the route's
+    TTL, but every request is counted.
+    """
+
+    async def load():
+        try:
+            video = await VideoModel.from_queryset_single(Video.get(id=video_id))
+        except DoesNotExist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Video file not found"
+            )
+        _video_tags.set(video_id, [tag.id for tag in video.tags])
+        for tag in video.tags:
+            counter_buffer.overlay(Tag, tag)
+        return counter_buffer.overlay(Video, video)
+
+    response = await response_cache.respond(
+        request, "video", [f"video:{video_id}"], load
+    )
+    counter_buffer.incr(Video, video_id, "views")
+    tag_ids = _video_tags.get(video_id)
+    if tag_ids is None:
+        # the page was cached by another process
+        tag_ids = await Tag.filter(videos__id=video_id).values_list("id", flat=True)
+        _video_tags.set(video_id, tag_ids)
+    for tag_id in tag_ids:
+        counter_buffer.incr(Tag, tag_id, "views")
+    return response
+
+
+@router.get(
+    "/{video_id}/play/",
+    responses={
+        status.HTTP_200_OK: {"model": schemas.PlayURL},
+        status.HTTP_307_TEMPORARY_REDIRECT: {},
+        status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound},
+    },
+)
+async def play_video(
     video_id: str,
+    headers: MediaRequestHeaders = Depends(),
 ):
+    """
+    Stream the video, or with `S3_PLAY_MODE` "redirect"/"json" hand out a
+    short-lived presigned url for S3 videos so the bucket serves the bytes.
+    """
     try:
-        await Video.filter(id=video_id).update(views=F("views") + 1)
-        video = await Video.get(id=video_id)
-        tags = await video.tags.all().values_list("id", flat=True)
-        await Tag.filter(id__in=tags).update(views=F("views") + 1)
-        return await VideoModel.from_tortoise_orm(video)
+        video_obj = await Video.get(id=video_id)
     except DoesNotExist:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Video file not found"
+            status_code=status.HTTP_404_NOT_FOUND, detail="Video not found"
+        )
+    if video_obj.storage == Storages.AWS_S3 and settings.S3_PLAY_MODE != "proxy":
+        url, expires_in = await presigned_url(video_obj.path)
+        if settings.S3_PLAY_MODE == "json":
+            return schemas.PlayURL(url=url, expires_in=expires_in)
+        return RedirectResponse(
+            url,
+            status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+            headers={"Cache-Control": f"private, max-age={expires_in}"},
         )
+    return await _media_response(video_obj.storage, video_obj.path, headers)
 
 
 @router.get(
-    "/{video_id}/play/",
+    "/{video_id}/hls/master.m3u8",
     responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
 )
-async def play_video(
+async def hls_master_playlist(
+    video_id: str,
+    headers: MediaRequestHeaders = Depends(),
+):
+    video_obj = await _get_hls_video(video_id)
+    return await _media_response(
+        video_obj.storage,
+        f"{video_obj.hls_path}/master.m3u8",
+        headers,
+        HLS_PLAYLIST_TYPE,
+    )
+
+
+@router.get(
+    "/{video_id}/hls/{rendition}/{filename}",
+    responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
+)
+async def hls_rendition_file(
     video_id: str,
+    rendition: str = Path(..., regex=r"^\d+p$"),
+    filename: str = Path(..., regex=r"^(index\.m3u8|segment_\d+\.ts)$"),
+    headers: MediaRequestHeaders = Depends(),
+):
+    video_obj = await _get_hls_video(video_id)
+    media_type = HLS_PLAYLIST_TYPE if filename.endswith(".m3u8") else HLS_SEGMENT_TYPE
+    return await _media_response(
+        video_obj.storage,
+        f"{video_obj.hls_path}/{rendition}/{filename}",
+        headers,
+        media_type,
+    )
+
+
+async def _get_hls_video(video_id: str) -> Video:
+    video_obj = await Video.get_or_none(id=video_id)
+    if video_obj is None or not video_obj.hls_path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Video stream not found"
+        )
+    return video_obj
+
+
+async def _media_response(
+    storage: Storages,
+    key: Optional[str],
+    headers: MediaRequestHeaders,
+    media_type: str = "video/mp4",
 ):
     try:
-        video_obj = await Video.get(id=video_id)
-    except DoesNotExist:
+        if not key:
+            raise StorageNotFound(key)
+        stat, streamer = await get_storage(storage).open(key)
+    except StorageNotFound:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Video not found"
+            status_code=status.HTTP_404_NOT_FOUND, detail="Video file not found"
         )
-    if video_obj.storage == Storages.AWS_S3:
-        return StreamingResponse(video_streamer(video_obj.path), media_type="video/mp4")
-    elif video_obj.storage == Storages.LOCAL:
-        file_path = os.path.join(settings.MEDIA_ROOT, video_obj.path)
-        return FileResponse(file_path)
+    return conditional_response(
+        headers, streamer, stat.size, stat.etag, stat.last_modified, media_type
+    )
 
 
 @router.delete(
     "/{video_id}/",
     responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
 )
-async def remove_video(
+async def delete_video(
     tasks: BackgroundTasks, video_id: str, user=Depends(deps.get_current_user)
 ):
-    video = await Video.get_or_none(id=video_id, user=user)
+    video = await Video.get_or_none(id=video_id, user_id=user.id)
     if not video:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"Video not found"
         )
-    tasks.add_task(remove_video, video.path)
+    tasks.add_task(remove_stored_video, video)
     await video.delete()
+    tag_index.discard(video.id)
+    await response_cache.invalidate(
+        "videos", f"video:{video.id}", f"comments:{video.id}"
+    )
 
 
 @router.patch(
@@ -151,14 +350,9 @@ async def remove_video(
     response_model=VideoModel,
     responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
 )
-async def like_video(video_id: str, _=Depends(deps.get_current_active_user)):
-    try:
-        await Video.filter(id=video_id).update(likes=F("likes") + 1)
-        return await VideoModel.from_queryset_single(Video.get(id=video_id))
-    except DoesNotExist:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Video file not found"
-        )
+async def like_video(video_id: str, user=Depends(deps.get_current_active_user)):
+    """Like the video, or take the like back when it is already liked."""
+    return await _react(video_id, user, Reaction.Kind.LIKE)
 
 
 @router.patch(
@@ -166,11 +360,17 @@ async def like_video(video_id: str, _=Depends(deps.get_current_active_user)):
     response_model=VideoModel,
     responses={status.HTTP_404_NOT_FOUND: {"model": schemas.HTTPNotFound}},
 )
-async def dislike_video(video_id: str, _=Depends(deps.get_current_active_user)):
-    try:
-        await Video.filter(id=video_id).update(dislikes=F("dislikes") + 1)
-        return await VideoModel.from_queryset_single(Video.get(id=video_id))
-    except DoesNotExist:
+async def dislike_video(video_id: str, user=Depends(deps.get_current_active_user)):
+    """Dislike the video, or take the dislike back when it is already disliked."""
+    return await _react(video_id, user, Reaction.Kind.DISLIKE)
+
+
+async def _react(video_id: str, user, kind: Reaction.Kind):
+    if not await Video.filter(id=video_id).exists():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Video file not found"
         )
+    await react(user.id, video_id, kind)
+    await response_cache.invalidate(f"video:{UUID(video_id)}")
+    video = await VideoModel.from_queryset_single(Video.get(id=video_id))
+    return counter_buffer.overlay(Video, video)
@@ -27,16 +27,158 @@ class Settings(BaseSettings):
     MEDIA_DIR: str = "../media"
     MEDIA_ROOT: str = os.path.join(BASE_DIR, MEDIA_DIR)
     MEDIA_URL: str = "/media/"
+    # Encoded files are never rewritten in place, so clients may keep them
+    MEDIA_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60
 
     # Storage conf
     STORAGE: IntEnum = Storages.LOCAL
     STORAGE_ENDPOINT_URL: str = "https://storage.yandexcloud.net"
     BUCKET_NAME: str = ""
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_MULTIPART_THRESHOLD: int = 16 * 1024 * 1024
+    S3_MULTIPART_CHUNK_SIZE: int = 8 * 1024 * 1024
+    S3_MULTIPART_CONCURRENCY: int = 4
+    # How /videos/{id}/play/ serves S3 videos: "proxy" streams the bytes through
+    # the app, "redirect" and "json" hand out a presigned url instead
+    S3_PLAY_MODE: str = "proxy"
+    S3_PRESIGN_EXPIRES: int = 15 * 60
+    S3_PRESIGN_REFRESH_MARGIN: int = 60
+    S3_PRESIGN_CACHE_SIZE: int = 10000
+    # Read-through disk cache under MEDIA_ROOT/cache for proxied S3 objects
+    S3_CACHE: bool = False
+    S3_CACHE_MAX_SIZE: int = 10 * 1024 * 1024 * 1024
+    S3_CACHE_MAX_OBJECT_SIZE: int = 512 * 1024 * 1024
+
+    # Paginated totals (app.utils.counts)
+    COUNT_CACHE_TTL: int = 60
+    COUNT_CACHE_SIZE: int = 10000
+
+    # Write-behind view/like counters (app.utils.counters)
+    COUNTER_FLUSH_INTERVAL: float = 5.0
+    COUNTER_MAX_PENDING: int = 1000
+
+    # Following feed (app.utils.feed): authors with more followers than
+    # FEED_FANOUT_MAX_FOLLOWERS are merged into the feeds at read time
+    FEED_FANOUT_MAX_FOLLOWERS: int = 10000
+    FEED_FANOUT_BATCH: int = 1000
+    FEED_INBOX_SIZE: int = 1000
+    # Videos copied into an inbox on follow
+    FEED_BACKFILL_SIZE: int = 50
+
+    # Trending feed (app.utils.trending): engagement weights, the half-life
+    # of a video's score, how old videos still get rescored, how often and
+    # how many of the top videos are served per slice
+    TRENDING_VIEW_WEIGHT: float = 1.0
+    TRENDING_LIKE_WEIGHT: float = 10.0
+    TRENDING_DISLIKE_WEIGHT: float = 10.0
+    TRENDING_HALF_LIFE: int = 24 * 60 * 60
+    TRENDING_WINDOW: int = 7 * 24 * 60 * 60
+    TRENDING_INTERVAL: int = 60
+    TRENDING_SIZE: int = 1000
+    TRENDING_SLICES: int = 1000
+
+    # Tag inverted index (app.utils.tag_index)
+    TAG_INDEX_REFRESH: int = 30
+    TAG_INDEX_REBUILD: int = 10 * 60
+    TAG_QUERY_CACHE_SIZE: int = 1000
+    TAG_QUERY_MAX_TAGS: int = 10
+
+    # Search (app.utils.search): matches ranked per kind, and the bounded
+    # typeahead tries of tag names and usernames
+    SEARCH_CANDIDATES: int = 200
+    SEARCH_MAX_WORDS: int = 5
+    SEARCH_TRIE_SIZE: int = 100_000
+    SEARCH_TRIE_DEPTH: int = 16
+    SEARCH_TRIE_TOP: int = 10
+    SEARCH_TRIE_REFRESH: int = 5 * 60
+
+    # Response cache of the public pages (app.utils.response_cache): seconds
+    # a page is fresh per route (0 turns it off), then served stale for
+    # RESPONSE_CACHE_STALE more while it is recomputed. With a Redis-protocol
+    # RESPONSE_CACHE_URL the pages and invalidations are shared by processes
+    RESPONSE_CACHE_TTLS: Dict[str, float] = {"videos": 5, "video": 30, "comments": 10}
+    RESPONSE_CACHE_STALE: float = 30
+    RESPONSE_CACHE_SIZE: int = 1000
+    RESPONSE_CACHE_URL: Optional[str] = None
+
+    # Password hashing (app.core.security): the bcrypt cost, changing it
+    # rehashes passwords at their next login. Hashes run in
+    # PASSWORD_HASH_WORKERS threads with at most PASSWORD_HASH_QUEUE more
+    # waiting, beyond that logins and sign-ups get a 503
+    PASSWORD_HASH_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 32
+
+    # Authenticated users (app.utils.principals): whether a token's user is
+    # active or a superuser is read once per AUTH_CACHE_TTL seconds, ids of no
+    # user once per AUTH_CACHE_NEGATIVE_TTL. With AUTH_TOKEN_CLAIMS the claims
+    # tokens carry are trusted instead, superuser endpoints still check them.
+    # Invalidations reach other processes through the RESPONSE_CACHE_URL
+    # server: without one, only turn the claims on for a single process
+    AUTH_CACHE_TTL: float = 30
+    AUTH_CACHE_NEGATIVE_TTL: float = 5
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CLAIMS: bool = False
+
+    # Comment threads (app.utils.comments): replies shown with each comment
+    COMMENT_PREVIEW_REPLIES: int = 3
+    COMMENT_MAX_PREVIEW_REPLIES: int = 10
+
+    # Streaming conf
+    STREAM_CHUNK_SIZE: int = 64 * 1024
+    STREAM_MAX_RANGES: int = 16
 
     # Encoding conf
     FFPROBE_COMMAND: str = "ffprobe"
     FFMPEG_COMMAND: str = "ffmpeg"
     UPLOAD_TYPES: list = ["video/mp4"]
+    TAGS_MAX_PER_VIDEO: int = 20
+    VIDEO_IMPORT_MAX_ITEMS: int = 1000
+    # Sources within these limits (H.264/AAC, yuv420p) are remuxed, not encoded
+    REMUX_MAX_BITRATE: int = 2_500_000
+    REMUX_MAX_DIMENSION: int = 1280
+    # Long sources are split at keyframes and the parts encoded concurrently
+    PARALLEL_ENCODE: bool = False
+    PARALLEL_ENCODE_MIN_DURATION: int = 120
+    PARALLEL_ENCODE_SEGMENT_SECONDS: int = 30
+    PARALLEL_ENCODE_PROCESSES: int = os.cpu_count() or 2
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_MAX_SIZE: int = 512 * 1024 * 1024
+    # Unfinished upload sessions idle for longer than this are removed
+    UPLOAD_SESSION_TTL: int = 24 * 60 * 60
+
+    # Adaptive bitrate (HLS) conf
+    ENCODE_HLS: bool = False
+    HLS_SEGMENT_SECONDS: int = 4
+    HLS_RENDITIONS: List[dict] = [
+        {
+            "height": 240,
+            "video_bitrate": "400k",
+            "maxrate": "600k",
+            "audio_bitrate": "64k",
+        },
+        {
+            "height": 480,
+            "video_bitrate": "1M",
+            "maxrate": "1.5M",
+            "audio_bitrate": "96k",
+        },
+        {
+            "height": 720,
+            "video_bitrate": "2.5M",
+            "maxrate": "3.5M",
+            "audio_bitrate": "128k",
+        },
+    ]
+
+    # Encoding worker conf
+    JOB_CONCURRENCY: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF: int = 30
+    JOB_TIMEOUT: int = 60 * 60
+    JOB_POLL_INTERVAL: float = 2.0
+    JOB_HEARTBEAT_INTERVAL: int = 30
+    JOB_STALE_TIMEOUT: int = 5 * 60
 
     # DB conf
     MODELS: List[str] = ["app.models.video", "app.models.user", "app.models.comment"]
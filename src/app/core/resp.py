@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Any, Optional
+from urllib.parse import unquote, urlparse
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+class RespError(Exception):
+    """An error reply of the server."""
+
+
+class RespClient:
+    """
+    A minimal client of the Redis protocol (RESP2), enough for shared caches:
+    Redis, KeyDB, Valkey, Dragonfly and the like all speak it.
+
+    One connection, opened on first use and reopened after a failure;
+    commands are sent one at a time. `url` is redis://[:password@]host[:port][/db].
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # created on first use, in the loop that runs the commands
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def execute(self, *args) -> Any:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._execute(args), self.timeout)
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncio.IncompleteReadError,
+                asyncio.CancelledError,
+            ):
+                # the connection may be out of step with the replies
+                self._drop()
+                raise
+
+    async def _execute(self, args) -> Any:
+        if self._writer is None:
+            await self._connect()
+        self._writer.write(_command(args))
+        await self._writer.drain()
+        return await self._reply()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                self._writer.write(_command(("AUTH", self.password)))
+                await self._reply()
+            if self.db:
+                self._writer.write(_command(("SELECT", self.db)))
+                await self._reply()
+        except RespError:
+            self._drop()
+            raise
+        logger.debug(f"Connected to {self.host}:{self.port}")
+
+    async def _reply(self) -> Any:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self._reply() for _ in range(length)]
+        raise RespError(f"Unexpected reply {line!r}")
+
+    def _drop(self) -> Optional[asyncio.StreamWriter]:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+        return writer
+
+    async def close(self):
+        writer = self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def _command(args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Tuple
+
+import aioboto3
+import aiofiles
+from botocore.config import Config
+
+from app.core.config import get_settings
+from app.utils.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+_client = None
+_client_context = None
+
+# key -> (url, expires at, in time.time() seconds)
+_presigned_urls = TTLCache(
+    maxsize=settings.S3_PRESIGN_CACHE_SIZE,
+    ttl=settings.S3_PRESIGN_EXPIRES - settings.S3_PRESIGN_REFRESH_MARGIN,
+)
+
+
+def _new_client():
+    return aioboto3.client(
+        service_name="s3",
+        endpoint_url=settings.STORAGE_ENDPOINT_URL,
+        config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS),
+    )
+
+
+async def open_s3_client():
+    """
+    Open the process-wide S3 client.
+
+    The client keeps its HTTP connection pool, credentials and TLS sessions
+    for the lifetime of the application instead of per request.
+    """
+    global _client, _client_context
+    if _client is None:
+        _client_context = _new_client()
+        _client = await _client_context.__aenter__()
+        logger.debug("S3 client opened")
+    return _client
+
+
+async def close_s3_client():
+    global _client, _client_context
+    if _client_context is not None:
+        await _client_context.__aexit__(None, None, None)
+        logger.debug("S3 client closed")
+    _client, _client_context = None, None
+
+
+@asynccontextmanager
+async def s3_client():
+    """The shared client when the app opened one, a short-lived one otherwise."""
+    if _client is not None:
+        yield _client
+    else:
+        async with _new_client() as s3:
+            yield s3
+
+
+async def upload_file(s3, bucket: str, key: str, path: str, size: int):
+    """
+    Upload `path` to `bucket/key`, as a multipart upload with
+    `S3_MULTIPART_CONCURRENCY` parts in flight for files above
+    `S3_MULTIPART_THRESHOLD`. Memory use is bounded by
+    concurrency * part size.
+    """
+    if size < settings.S3_MULTIPART_THRESHOLD:
+        async with aiofiles.open(path, mode="rb") as f:
+            await s3.put_object(Bucket=bucket, Key=key, Body=await f.read())
+        return
+
+    part_size = settings.S3_MULTIPART_CHUNK_SIZE
+    upload = await s3.create_multipart_upload(Bucket=bucket, Key=key)
+    upload_id = upload["UploadId"]
+    slots = asyncio.Semaphore(settings.S3_MULTIPART_CONCURRENCY)
+
+    async def upload_part(number: int, offset: int):
+        async with slots:
+            async with aiofiles.open(path, mode="rb") as f:
+                await f.seek(offset)
+                body = await f.read(part_size)
+            part = await s3.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+        return {"PartNumber": number, "ETag": part["ETag"]}
+
+    tasks = [
+        asyncio.ensure_future(upload_part(number, offset))
+        for number, offset in enumerate(range(0, size, part_size), start=1)
+    ]
+    try:
+        parts = await asyncio.gather(*tasks)
+        await s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        await s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+async def presigned_url(key: str) -> Tuple[str, int]:
+    """
+    A presigned GET url for `key` and the number of seconds it stays valid.
+
+    Urls are cached and handed out again until `S3_PRESIGN_REFRESH_MARGIN`
+    seconds before they expire, so clients never get an almost-dead url.
+    """
+    cached = _presigned_urls.get(key)
+    if cached is None:
+        async with s3_client() as s3:
+            url = await s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": settings.BUCKET_NAME, "Key": key},
+                ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+            )
+        cached = (url, time.time() + settings.S3_PRESIGN_EXPIRES)
+        _presigned_urls.set(key, cached)
+    url, expires = cached
+    return url, int(expires - time.time())
@@ -1,35 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 import jwt
+from fastapi import HTTPException, status
 
 from app.core.config import get_settings
 
 settings = get_settings()
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hashes of any other cost are rehashed at the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
 ALGORITHM = "HS256"
 
 
+class HashingPool:
+    """
+    Runs password hashing off the event loop, in `workers` threads (bcrypt
+    releases the GIL), with at most `queue` calls waiting for one. Calls
+    beyond that get a 503 instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int, queue: int):
+        self.limit = workers + queue
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+        # running or waiting calls, counted until their thread is done with them
+        self._pending = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self._pending >= self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many logins at once, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        loop = asyncio.get_event_loop()
+        self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._done))
+        return await asyncio.wrap_future(future)
+
+    def _done(self):
+        self._pending -= 1
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
+
+
 def create_access_token(
-    subject: Union[str, Any], expires_delta: timedelta = None
+    subject: Union[str, Any],
+    expires_delta: timedelta = None,
+    claims: Dict[str, Any] = None,
 ) -> str:
+    issued = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = issued + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(
-            minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
-        )
-    to_encode = {"exp": expire, "sub": str(subject)}
+        expire = issued + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {**(claims or {}), "exp": expire, "iat": issued, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
 
     return encoded_jwt
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Whether the password matches, and its new hash when the stored one
+    should be replaced (e.g. PASSWORD_HASH_ROUNDS changed).
+    """
+    return await hashing_pool.run(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await hashing_pool.run(pwd_context.hash, password)
@@ -0,0 +1,273 @@
+import hashlib
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
+from stat import S_ISREG
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from botocore.exceptions import ClientError
+
+from app.core.config import Storages, get_settings
+from app.core.s3 import s3_client, upload_file
+from app.utils.media_cache import CacheBypass, video_cache
+from app.utils.streaming import RangeStreamer, file_streamer
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+class StorageNotFound(Exception):
+    pass
+
+
+@dataclass
+class ObjectStat:
+    size: int
+    last_modified: datetime
+    etag: str
+
+
+def make_stat(key: str, size: int, mtime: float) -> ObjectStat:
+    """
+    Stat with a strong ETag derived from the key, size and modification time.
+
+    Stored media is never rewritten under the same key, so these identify the
+    content. Every backend (and the S3 disk cache) derives the same tag for
+    the same object, whichever process serves it.
+    """
+    mtime = int(mtime)
+    digest = hashlib.md5(f"{key}:{size}:{mtime}".encode()).hexdigest()
+    return ObjectStat(
+        size=size,
+        last_modified=datetime.fromtimestamp(mtime, tz=timezone.utc),
+        etag=f'"{digest}"',
+    )
+
+
+class StorageBackend(ABC):
+    """
+    Where stored media lives. Keys are "/"-separated paths such as
+    `videos/<name>.mp4`, relative to the root of the storage.
+    """
+
+    kind: Storages
+
+    @abstractmethod
+    async def put(self, key: str, path: str):
+        """Store the local file `path` under `key`."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """The whole content of `key`."""
+
+    @abstractmethod
+    def stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield the bytes `start..end` (inclusive) of `key`."""
+
+    @abstractmethod
+    async def stat(self, key: str) -> ObjectStat:
+        """Raises `StorageNotFound` for missing keys."""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove `key`; missing keys are ignored."""
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str):
+        """Remove every key under `prefix/`."""
+
+    async def open(self, key: str) -> Tuple[ObjectStat, RangeStreamer]:
+        """Stat of `key` and a `RangeStreamer` serving it, for `ranged_response`."""
+        return await self.stat(key), partial(self.stream, key)
+
+
+class LocalStorage(StorageBackend):
+    kind = Storages.LOCAL
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, key))
+        if os.path.commonpath([root, path]) != root:
+            raise StorageNotFound(key)
+        return path
+
+    async def put(self, key: str, path: str):
+        target = self.path(key)
+        # encoders write straight into MEDIA_ROOT
+        if os.path.realpath(path) != target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+
+    async def get(self, key: str) -> bytes:
+        try:
+            async with aiofiles.open(self.path(key), mode="rb") as f:
+                return await f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            raise StorageNotFound(key)
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None):
+        return file_streamer(self.path(key), start, end)
+
+    async def stat(self, key: str) -> ObjectStat:
+        try:
+            result = os.stat(self.path(key))
+        except FileNotFoundError:
+            raise StorageNotFound(key)
+        if not S_ISREG(result.st_mode):
+            raise StorageNotFound(key)
+        return make_stat(key, result.st_size, result.st_mtime)
+
+    async def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    async def delete_prefix(self, prefix: str):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+
+class S3Storage(StorageBackend):
+    kind = Storages.AWS_S3
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    async def put(self, key: str, path: str):
+        async with s3_client() as s3:
+            await upload_file(s3, self.bucket, key, path, os.path.getsize(path))
+        logger.debug(f"Stored {key} in {self.bucket}")
+
+    async def get(self, key: str) -> bytes:
+        async with s3_client() as s3:
+            try:
+                s3_ob = await s3.get_object(Bucket=self.bucket, Key=key)
+            except ClientError as e:
+                raise _not_found(key, e)
+            async with s3_ob["Body"] as stream:
+                return await stream.read()
+
+    async def stream(self, key: str, start: int = 0, end: Optional[int] = None):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        async with s3_client() as s3:
+            logger.debug(f"Serving {self.bucket} {key} {byte_range}")
+            s3_ob = await s3.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+            async with s3_ob["Body"] as stream:
+                while True:
+                    chunk = await stream.read(settings.STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    async def stat(self, key: str) -> ObjectStat:
+        async with s3_client() as s3:
+            try:
+                head = await s3.head_object(Bucket=self.bucket, Key=key)
+            except ClientError as e:
+                raise _not_found(key, e)
+        return make_stat(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    async def delete(self, key: str):
+        async with s3_client() as s3:
+            await s3.delete_object(Bucket=self.bucket, Key=key)
+        video_cache.discard(key)
+
+    async def delete_prefix(self, prefix: str):
+        async with s3_client() as s3:
+            paginator = s3.get_paginator("list_objects_v2")
+            async for page in paginator.paginate(
+                Bucket=self.bucket, Prefix=f"{prefix}/"
+            ):
+                keys = [obj["Key"] for obj in page.get("Contents", [])]
+                if keys:
+                    await s3.delete_objects(
+                        Bucket=self.bucket,
+                        Delete={"Objects": [{"Key": key} for key in keys]},
+                    )
+                for key in keys:
+                    video_cache.discard(key)
+
+    async def open(self, key: str) -> Tuple[ObjectStat, RangeStreamer]:
+        if settings.S3_CACHE:
+            try:
+                cached = await video_cache.open(key)
+            except CacheBypass:
+                pass
+            except FileNotFoundError:
+                # evicted by another process sharing the cache directory
+                pass
+            except ClientError as e:
+                raise _not_found(key, e)
+            else:
+                # opened already: an eviction can't cut the response short
+                result = os.fstat(cached.fileno())
+                stat = make_stat(key, result.st_size, result.st_mtime)
+                return stat, partial(video_cache.stream, cached)
+        return await super().open(key)
+
+
+class MemoryStorage(StorageBackend):
+    """Keeps objects in a dict; a stand-in for the real storages in tests."""
+
+    def __init__(self, kind: Storages = Storages.LOCAL):
+        self.kind = kind
+        self.objects: Dict[str, Tuple[bytes, float]] = {}
+
+    async def put(self, key: str, path: str):
+        async with aiofiles.open(path, mode="rb") as f:
+            self.objects[key] = (await f.read(), datetime.now(timezone.utc).timestamp())
+
+    async def get(self, key: str) -> bytes:
+        try:
+            return self.objects[key][0]
+        except KeyError:
+            raise StorageNotFound(key)
+
+    async def stream(self, key: str, start: int = 0, end: Optional[int] = None):
+        data = await self.get(key)
+        data = data[start : None if end is None else end + 1]
+        for offset in range(0, len(data), settings.STREAM_CHUNK_SIZE):
+            yield data[offset : offset + settings.STREAM_CHUNK_SIZE]
+
+    async def stat(self, key: str) -> ObjectStat:
+        data = await self.get(key)
+        return make_stat(key, len(data), self.objects[key][1])
+
+    async def delete(self, key: str):
+        self.objects.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self.objects if key.startswith(f"{prefix}/")]:
+            del self.objects[key]
+
+
+def _not_found(key: str, error: ClientError) -> Exception:
+    if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+        return StorageNotFound(key)
+    return error
+
+
+_backends: Dict[Storages, StorageBackend] = {}
+
+
+def get_storage(kind: Optional[Storages] = None) -> StorageBackend:
+    """The backend holding media stored as `kind`, by default `settings.STORAGE`."""
+    kind = Storages(settings.STORAGE if kind is None else kind)
+    if kind not in _backends:
+        if kind == Storages.AWS_S3:
+            _backends[kind] = S3Storage(settings.BUCKET_NAME)
+        else:
+            _backends[kind] = LocalStorage(settings.MEDIA_ROOT)
+    return _backends[kind]
@@ -1,9 +1,12 @@
+import shlex
+from typing import List, Optional
+
 from app.core.config import get_settings
 
 settings = get_settings()
 
 
-def encode_cmd(input_path: str, output_path: str) -> str:
+def encode_cmd(input_path: str, output_path: str, audio: bool = True) -> str:
     cmd = [
         settings.FFMPEG_COMMAND,
         "-hide_banner",
@@ -29,8 +32,149 @@ def encode_cmd(input_path: str, output_path: str) -> str:
         "-maxrate 2.5M",
         "-bufsize 2.5M",
         "-movflags faststart",
+        "-b:a 64k" if audio else "-an",
+        output_path,
+    ]
+    return " ".join(cmd)
+
+
+def probe_cmd(input_path: str) -> str:
+    cmd = [
+        settings.FFPROBE_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-print_format json",
+        "-show_format",
+        "-show_streams",
+        input_path,
+    ]
+    return " ".join(cmd)
+
+
+def remux_cmd(input_path: str, output_path: str) -> str:
+    cmd = [
+        settings.FFMPEG_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-y",
+        "-i",
+        input_path,
+        "-map 0:v:0",
+        "-map 0:a:0?",
+        "-c copy",
+        "-movflags +faststart",
+        output_path,
+    ]
+    return " ".join(cmd)
+
+
+def split_cmd(input_path: str, output_pattern: str, segment_seconds: int) -> str:
+    # stream copy can only cut on keyframes, so segments start on one
+    cmd = [
+        settings.FFMPEG_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-y",
+        "-i",
+        input_path,
+        "-map 0:v:0",
+        "-c copy",
+        "-f segment",
+        f"-segment_time {segment_seconds}",
+        "-reset_timestamps 1",
+        output_pattern,
+    ]
+    return " ".join(cmd)
+
+
+def audio_cmd(input_path: str, output_path: str) -> str:
+    cmd = [
+        settings.FFMPEG_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-y",
+        "-i",
+        input_path,
+        "-map 0:a:0",
+        "-vn",
+        "-c:a aac",
         "-b:a 64k",
-        "-pass 1",
         output_path,
     ]
     return " ".join(cmd)
+
+
+def concat_cmd(list_path: str, audio_path: Optional[str], output_path: str) -> str:
+    cmd = [
+        settings.FFMPEG_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-y",
+        "-f concat",
+        "-safe 0",
+        "-i",
+        list_path,
+    ]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map 0:v", "-map 1:a"]
+    cmd += ["-c copy", "-movflags +faststart", output_path]
+    return " ".join(cmd)
+
+
+def hls_cmd(
+    input_path: str, output_dir: str, renditions: List[dict], with_audio: bool
+) -> str:
+    """
+    Decode the source once, split it into one scaled stream per rendition and
+    package every rendition as HLS under `output_dir/<height>p/`, plus a
+    `master.m3u8` in `output_dir`.
+    """
+    segment = settings.HLS_SEGMENT_SECONDS
+    count = len(renditions)
+    graph = [f"[0:v]split={count}" + "".join(f"[v{i}]" for i in range(count))]
+    graph += [
+        f"[v{i}]scale=-2:{rendition['height']},setsar=1:1[v{i}out]"
+        for i, rendition in enumerate(renditions)
+    ]
+
+    cmd = [
+        settings.FFMPEG_COMMAND,
+        "-hide_banner",
+        "-loglevel error",
+        "-y",
+        "-i",
+        input_path,
+        f"-filter_complex {shlex.quote(';'.join(graph))}",
+    ]
+    stream_map = []
+    for i, rendition in enumerate(renditions):
+        cmd += [
+            f"-map [v{i}out]",
+            f"-b:v:{i} {rendition['video_bitrate']}",
+            f"-maxrate:v:{i} {rendition['maxrate']}",
+            f"-bufsize:v:{i} {rendition['maxrate']}",
+        ]
+        entry = f"v:{i}"
+        if with_audio:
+            cmd += ["-map 0:a:0", f"-b:a:{i} {rendition['audio_bitrate']}"]
+            entry += f",a:{i}"
+        stream_map.append(f"{entry},name:{rendition['height']}p")
+
+    cmd += [
+        "-c:v libx264",
+        "-c:a aac",
+        "-pix_fmt yuv420p",
+        "-profile:v main",
+        "-preset:v veryfast",
+        "-sc_threshold 0",
+        f"-force_key_frames {shlex.quote(f'expr:gte(t,n_forced*{segment})')}",
+        "-f hls",
+        f"-hls_time {segment}",
+        "-hls_playlist_type vod",
+        "-hls_flags independent_segments",
+        f"-hls_segment_filename {output_dir}/%v/segment_%05d.ts",
+        "-master_pl_name master.m3u8",
+        f"-var_stream_map {shlex.quote(' '.join(stream_map))}",
+        f"{output_dir}/%v/index.m3u8",
+    ]
+    return " ".join(cmd)
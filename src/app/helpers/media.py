@@ -1,11 +1,28 @@
 import asyncio
+import json
+import logging
 import os
+import shutil
+import tempfile
+import time
+from typing import Optional
 
 from app.core.config import get_settings
-from app.helpers.cmds import encode_cmd
+from app.helpers.cmds import (
+    audio_cmd,
+    concat_cmd,
+    encode_cmd,
+    hls_cmd,
+    probe_cmd,
+    remux_cmd,
+    split_cmd,
+)
 
 settings = get_settings()
 
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
 
 async def run_command(cmd: str) -> dict:
     ret = {}
@@ -14,7 +31,11 @@ async def run_command(cmd: str) -> dict:
         cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
 
-    stdout, stderr = await process.communicate()
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
 
     if process.returncode == 0:
         try:
@@ -42,14 +63,202 @@ async def get_file_size(input_file: str) -> int:
             return 0
 
 
-async def encode_file(input_file: str, output_file) -> tuple:
+def _to_number(value, cast=float):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+async def probe_file(input_file: str) -> dict:
+    """
+    Read container and stream metadata with ffprobe.
+
+    Returns an empty dict when the file can't be probed.
+    """
     if not os.path.isfile(input_file):
-        return False, "Input file is not a file"
+        return {}
+
+    stdout = await run_command(probe_cmd(input_file))
+    if stdout.get("error", None) is not None:
+        return {}
+    try:
+        info = json.loads(stdout.get("out") or "{}")
+    except ValueError:
+        return {}
+
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    container = info.get("format", {})
+
+    return {
+        "duration": _to_number(container.get("duration")),
+        "width": _to_number(video.get("width"), int),
+        "height": _to_number(video.get("height"), int),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "bitrate": _to_number(container.get("bit_rate"), int),
+    }
+
+
+def can_remux(metadata: dict) -> bool:
+    """Whether the source already fits the target profile and can be copied."""
+    if not metadata or metadata.get("video_codec") != "h264":
+        return False
+    if metadata.get("audio_codec") not in ("aac", None):
+        return False
+    if metadata.get("pix_fmt") != "yuv420p":
+        return False
+    bitrate = metadata.get("bitrate")
+    if bitrate is None or bitrate > settings.REMUX_MAX_BITRATE:
+        return False
+    width, height = metadata.get("width"), metadata.get("height")
+    if not width or not height:
+        return False
+    return max(width, height) <= settings.REMUX_MAX_DIMENSION
+
+
+async def encode_file(
+    input_file: str, output_file, metadata: Optional[dict] = None
+) -> tuple:
+    """
+    Returns `(status, detail, remuxed)`; `remuxed` is set when the streams
+    were copied as is, so the output has the metadata of the source.
+    """
+    if not os.path.isfile(input_file):
+        return False, "Input file is not a file", False
+
+    if metadata is not None and can_remux(metadata):
+        cmd = remux_cmd(input_file, output_file)
+        stdout = await run_command(cmd)
+        if "error" not in stdout:
+            return True, "Remuxed", True
+
+    duration = metadata.get("duration") if metadata else None
+    if (
+        settings.PARALLEL_ENCODE
+        and duration
+        and duration >= settings.PARALLEL_ENCODE_MIN_DURATION
+    ):
+        status, detail = await encode_file_parallel(input_file, output_file, metadata)
+        if status:
+            return True, detail, False
+        logger.warning(f"Parallel encoding fail, encoding in one process: {detail}")
 
     cmd = encode_cmd(input_file, output_file)
     stdout = await run_command(cmd)
 
     if stdout.get("error", None):
+        return False, stdout.get("error"), False
+
+    return True, "Success", False
+
+
+async def _encode_segment(slots: asyncio.Semaphore, segment: str, output: str):
+    async with slots:
+        started = time.monotonic()
+        stdout = await run_command(encode_cmd(segment, output, audio=False))
+        elapsed = time.monotonic() - started
+    if "error" in stdout:
+        raise RuntimeError(f"{os.path.basename(segment)}: {stdout.get('error')}")
+    return elapsed
+
+
+async def encode_file_parallel(
+    input_file: str, output_file: str, metadata: dict
+) -> tuple:
+    """
+    Split the video stream at keyframes, encode the parts concurrently in up
+    to `PARALLEL_ENCODE_PROCESSES` ffmpeg processes and join them losslessly.
+
+    Audio is encoded once from the whole source, so there are no gaps at the
+    joins, and muxed in during the concat.
+    """
+    tmp_root = os.path.join(settings.MEDIA_ROOT, "tmp")
+    os.makedirs(tmp_root, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=tmp_root)
+    try:
+        started = time.monotonic()
+        stdout = await run_command(
+            split_cmd(
+                input_file,
+                os.path.join(work_dir, "source_%05d.mp4"),
+                settings.PARALLEL_ENCODE_SEGMENT_SECONDS,
+            )
+        )
+        if "error" in stdout:
+            return False, stdout.get("error")
+        segments = sorted(
+            os.path.join(work_dir, name)
+            for name in os.listdir(work_dir)
+            if name.startswith("source_")
+        )
+        if not segments:
+            return False, "Source has no video stream"
+        outputs = [segment.replace("source_", "encoded_") for segment in segments]
+        split_time = time.monotonic() - started
+
+        slots = asyncio.Semaphore(settings.PARALLEL_ENCODE_PROCESSES)
+        jobs = [
+            _encode_segment(slots, segment, output)
+            for segment, output in zip(segments, outputs)
+        ]
+        audio_path = None
+        if metadata.get("audio_codec"):
+            audio_path = os.path.join(work_dir, "audio.m4a")
+            jobs.append(run_command(audio_cmd(input_file, audio_path)))
+
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if audio_path and isinstance(results[-1], dict) and "error" in results[-1]:
+            errors.append(results[-1].get("error"))
+        if errors:
+            return False, str(errors[0])
+        timings = results[: len(segments)]
+
+        list_path = os.path.join(work_dir, "segments.txt")
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{output}'\n" for output in outputs)
+        stdout = await run_command(concat_cmd(list_path, audio_path, output_file))
+        if "error" in stdout:
+            return False, stdout.get("error")
+
+        logger.info(
+            f"Parallel encoding of {len(segments)} segments: "
+            f"split {split_time:.1f}s, "
+            f"segments {', '.join(f'{t:.1f}s' for t in timings)}, "
+            f"total {time.monotonic() - started:.1f}s"
+        )
+        return True, f"Encoded in {len(segments)} segments"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def hls_renditions(metadata: dict) -> list:
+    """Ladder rungs that don't upscale the source; at least the lowest one."""
+    renditions = sorted(settings.HLS_RENDITIONS, key=lambda r: r["height"])
+    height = metadata.get("height") if metadata else None
+    if not height:
+        return renditions
+    fitting = [r for r in renditions if r["height"] <= height]
+    return fitting or renditions[:1]
+
+
+async def encode_hls(input_file: str, output_dir: str, metadata: dict) -> tuple:
+    if not os.path.isfile(input_file):
+        return False, "Input file is not a file"
+
+    renditions = hls_renditions(metadata)
+    for rendition in renditions:
+        os.makedirs(os.path.join(output_dir, f"{rendition['height']}p"), exist_ok=True)
+
+    with_audio = bool(metadata.get("audio_codec")) if metadata else False
+    cmd = hls_cmd(input_file, output_dir, renditions, with_audio)
+    stdout = await run_command(cmd)
+
+    if "error" in stdout:
         return False, stdout.get("error")
 
     return True, "Success"
@@ -1,12 +1,18 @@
 import time
 
 from fastapi import FastAPI, Request, logger
-from fastapi.staticfiles import StaticFiles
 from fastapi_versioning import VersionedFastAPI
 
 from app.api.routers import api_router
-from app.core.config import get_settings
+from app.core.config import Storages, get_settings
 from app.core.db import init_db
+from app.core.s3 import close_s3_client, open_s3_client
+from app.core.security import hashing_pool
+from app.utils.counters import counter_buffer
+from app.utils.principals import principals
+from app.utils.response_cache import response_cache
+from app.utils.search import create_search_indexes
+from app.utils.streaming import MediaFiles
 
 settings = get_settings()
 
@@ -17,7 +23,7 @@ app.include_router(api_router)
 app = VersionedFastAPI(app, version_format="{major}", prefix_format="/api/v{major}")
 app.mount(
     settings.MEDIA_URL,
-    StaticFiles(directory=settings.MEDIA_ROOT),
+    MediaFiles(directory=settings.MEDIA_ROOT),
     name=settings.MEDIA_URL,
 )
 
@@ -31,4 +37,16 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
+# registered before init_db, whose shutdown handler closes the connections
+app.add_event_handler("startup", counter_buffer.start)
+app.add_event_handler("shutdown", counter_buffer.stop)
 init_db(app)
+app.add_event_handler("startup", create_search_indexes)
+
+app.add_event_handler("shutdown", response_cache.close)
+app.add_event_handler("shutdown", principals.close)
+app.add_event_handler("shutdown", hashing_pool.close)
+
+if settings.STORAGE == Storages.AWS_S3:
+    app.add_event_handler("startup", open_s3_client)
+app.add_event_handler("shutdown", close_s3_client)
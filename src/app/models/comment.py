@@ -11,6 +11,12 @@ class Comment(models.Model):
     reply_to = fields.ForeignKeyField(
         "models.Comment", null=True, on_delete=fields.CASCADE, related_name="replies"
     )
+    created = fields.DatetimeField(auto_now_add=True)
+    # kept up to date by app.utils.comments
+    replies_count = fields.IntField(default=0)
+
+    class Meta:
+        indexes = (("video_id", "created", "id"), ("reply_to_id", "created", "id"))
 
 
 Tortoise.init_models(
@@ -19,6 +25,3 @@ Tortoise.init_models(
 CommentModel = pydantic_model_creator(
     Comment, exclude=("video", "reply_to", "video_id", "replies")
 )
-CommentCreateModel = pydantic_model_creator(
-    Comment, exclude=("user_id",), exclude_readonly=True
-)
@@ -0,0 +1,50 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "uploadsession" (
+    "id" CHAR(36) NOT NULL  PRIMARY KEY,
+    "content_type" VARCHAR(64) NOT NULL,
+    "size" BIGINT NOT NULL,
+    "offset" BIGINT NOT NULL  DEFAULT 0,
+    "created" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "expires" TIMESTAMP NOT NULL,
+    "completed" TIMESTAMP,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    "video_id" CHAR(36) NOT NULL UNIQUE REFERENCES "video" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_uploadsessi_expires_fb30f8" ON "uploadsession" ("expires");
+CREATE TABLE IF NOT EXISTS "encodingjob" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "status" VARCHAR(20) NOT NULL  DEFAULT 'queued' /* QUEUED: queued\nRUNNING: running\nDONE: done\nFAILED: failed */,
+    "kind" VARCHAR(10) NOT NULL  DEFAULT 'mp4' /* MP4: mp4\nHLS: hls */,
+    "input_path" VARCHAR(1024) NOT NULL,
+    "filename" VARCHAR(255) NOT NULL,
+    "upload_to" VARCHAR(255) NOT NULL,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "error" TEXT,
+    "run_after" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "heartbeat" TIMESTAMP,
+    "created" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "started" TIMESTAMP,
+    "finished" TIMESTAMP,
+    "wait_time" REAL,
+    "run_time" REAL,
+    "video_id" CHAR(36) NOT NULL REFERENCES "video" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_encodingjob_status_c2a1bf" ON "encodingjob" ("status");
+CREATE INDEX IF NOT EXISTS "idx_encodingjob_run_aft_bf2fcf" ON "encodingjob" ("run_after");
+ALTER TABLE "video" ADD "duration" REAL;
+ALTER TABLE "video" ADD "width" INT;
+ALTER TABLE "video" ADD "height" INT;
+ALTER TABLE "video" ADD "video_codec" VARCHAR(32);
+ALTER TABLE "video" ADD "audio_codec" VARCHAR(32);
+ALTER TABLE "video" ADD "bitrate" INT;
+ALTER TABLE "video" ADD "hls_path" VARCHAR(1024);
+-- downgrade --
+ALTER TABLE "video" DROP COLUMN "duration";
+ALTER TABLE "video" DROP COLUMN "width";
+ALTER TABLE "video" DROP COLUMN "height";
+ALTER TABLE "video" DROP COLUMN "video_codec";
+ALTER TABLE "video" DROP COLUMN "audio_codec";
+ALTER TABLE "video" DROP COLUMN "bitrate";
+ALTER TABLE "video" DROP COLUMN "hls_path";
+DROP TABLE IF EXISTS "encodingjob";
+DROP TABLE IF EXISTS "uploadsession";
@@ -0,0 +1,14 @@
+-- upgrade --
+ALTER TABLE "comment" ADD "created" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX "idx_comment_video_i_7780f6" ON "comment" ("video_id", "created", "id");
+CREATE INDEX "idx_video_loading_ea6f4e" ON "video" ("loading_status", "created", "id");
+CREATE INDEX "idx_video_user_id_a79438" ON "video" ("user_id", "created", "id");
+CREATE INDEX "idx_userfollowi_user_id_89b5b0" ON "userfollowing" ("user_id", "created", "id");
+CREATE INDEX "idx_userfollowi_followi_ab0e26" ON "userfollowing" ("following_user_id", "created", "id");
+-- downgrade --
+DROP INDEX "idx_userfollowi_followi_ab0e26";
+DROP INDEX "idx_userfollowi_user_id_89b5b0";
+DROP INDEX "idx_video_user_id_a79438";
+DROP INDEX "idx_video_loading_ea6f4e";
+DROP INDEX "idx_comment_video_i_7780f6";
+ALTER TABLE "comment" DROP COLUMN "created";
@@ -0,0 +1,11 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "reaction" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "kind" VARCHAR(10) NOT NULL  /* LIKE: like\nDISLIKE: dislike */,
+    "created" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    "video_id" CHAR(36) NOT NULL REFERENCES "video" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_reaction_user_id_be5a42" UNIQUE ("user_id", "video_id")
+);
+-- downgrade --
+DROP TABLE IF EXISTS "reaction";
@@ -0,0 +1,14 @@
+-- upgrade --
+ALTER TABLE "user" ADD "fanout_on_read" INT NOT NULL  DEFAULT 0;
+CREATE TABLE IF NOT EXISTS "feedentry" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "created" TIMESTAMP NOT NULL,
+    "video_id" CHAR(36) NOT NULL REFERENCES "video" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    "author_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_feedentry_user_id_e1619c" UNIQUE ("user_id", "video_id")
+) /* A video in the materialized following feed (inbox) of `user`. */;
+CREATE INDEX IF NOT EXISTS "idx_feedentry_user_id_72df4e" ON "feedentry" ("user_id", "created", "video_id");
+-- downgrade --
+DROP TABLE IF EXISTS "feedentry";
+ALTER TABLE "user" DROP COLUMN "fanout_on_read";
@@ -0,0 +1,6 @@
+-- upgrade --
+ALTER TABLE "video" ADD "score" REAL;
+CREATE INDEX "idx_video_score_b3d4b5" ON "video" ("score", "id");
+-- downgrade --
+DROP INDEX "idx_video_score_b3d4b5";
+ALTER TABLE "video" DROP COLUMN "score";
@@ -0,0 +1,14 @@
+-- upgrade --
+DELETE FROM "userfollowing" WHERE "id" NOT IN (
+    SELECT MIN("id") FROM "userfollowing" GROUP BY "user_id", "following_user_id"
+);
+CREATE UNIQUE INDEX "uid_userfollowi_user_id_b73a69" ON "userfollowing" ("user_id", "following_user_id");
+ALTER TABLE "user" ADD "followers_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "user" ADD "following_count" INT NOT NULL  DEFAULT 0;
+UPDATE "user" SET
+    "followers_count" = (SELECT COUNT(*) FROM "userfollowing" WHERE "following_user_id" = "user"."id"),
+    "following_count" = (SELECT COUNT(*) FROM "userfollowing" WHERE "user_id" = "user"."id");
+-- downgrade --
+ALTER TABLE "user" DROP COLUMN "following_count";
+ALTER TABLE "user" DROP COLUMN "followers_count";
+DROP INDEX "uid_userfollowi_user_id_b73a69";
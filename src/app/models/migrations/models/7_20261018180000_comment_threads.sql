@@ -0,0 +1,14 @@
+-- upgrade --
+ALTER TABLE "comment" ADD "replies_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "video" ADD "comments_count" INT NOT NULL  DEFAULT 0;
+CREATE INDEX "idx_comment_reply_t_8cf4f3" ON "comment" ("reply_to_id", "created", "id");
+UPDATE "comment" SET "replies_count" = (
+    SELECT COUNT(*) FROM "comment" AS "reply" WHERE "reply"."reply_to_id" = "comment"."id"
+);
+UPDATE "video" SET "comments_count" = (
+    SELECT COUNT(*) FROM "comment" WHERE "comment"."video_id" = "video"."id"
+);
+-- downgrade --
+DROP INDEX "idx_comment_reply_t_8cf4f3";
+ALTER TABLE "video" DROP COLUMN "comments_count";
+ALTER TABLE "comment" DROP COLUMN "replies_count";
@@ -10,9 +10,25 @@ class User(models.Model):
     password_hash = fields.CharField(128, null=True)
     is_active = fields.BooleanField(default=True)
     is_superuser = fields.BooleanField(default=False)
+    # too many followers to fan videos out to: followers read them instead
+    fanout_on_read = fields.BooleanField(default=False)
+    # kept up to date by app.utils.follows
+    followers_count = fields.IntField(default=0)
+    following_count = fields.IntField(default=0)
 
     class PydanticMeta:
-        exclude = ["password_hash", "videos", "user_comments", "following", "followers"]
+        exclude = [
+            "password_hash",
+            "videos",
+            "user_comments",
+            "following",
+            "followers",
+            "upload_sessions",
+            "reactions",
+            "feed",
+            "fanned_out",
+            "fanout_on_read",
+        ]
 
 
 class UserFollowing(models.Model):
@@ -20,6 +36,13 @@ class UserFollowing(models.Model):
     following_user = fields.ForeignKeyField("models.User", related_name="followers")
     created = fields.DatetimeField(auto_now_add=True, index=True)
 
+    class Meta:
+        unique_together = (("user", "following_user"),)
+        indexes = (
+            ("user_id", "created", "id"),
+            ("following_user_id", "created", "id"),
+        )
+
 
 UserModel = pydantic_model_creator(User)
 UserFollowingModel = pydantic_model_creator(UserFollowing)
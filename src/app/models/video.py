@@ -39,15 +39,70 @@ class Video(models.Model):
     likes = fields.IntField(default=0, index=True)
     dislikes = fields.IntField(default=0)
     views = fields.IntField(index=True, default=0)
+    # kept up to date by app.utils.comments
+    comments_count = fields.IntField(default=0)
     size = fields.CharField(max_length=20, null=True)
+    duration = fields.FloatField(null=True)
+    width = fields.IntField(null=True)
+    height = fields.IntField(null=True)
+    video_codec = fields.CharField(max_length=32, null=True)
+    audio_codec = fields.CharField(max_length=32, null=True)
+    bitrate = fields.IntField(null=True)
     path = fields.CharField(max_length=1024, null=True)
+    hls_path = fields.CharField(max_length=1024, null=True)
     created = fields.DatetimeField(auto_now_add=True, index=True)
+    # trending rank, kept up to date by the worker (app.utils.trending)
+    score = fields.FloatField(null=True)
+
+    class Meta:
+        indexes = (
+            ("loading_status", "created", "id"),
+            ("user_id", "created", "id"),
+            ("score", "id"),
+        )
 
     class PydanticMeta:
-        exclude = ["path"]
+        exclude = [
+            "path",
+            "hls_path",
+            "upload_session",
+            "jobs",
+            "reactions",
+            "feed_entries",
+        ]
         exclude_raw_fields = False
 
 
+class Reaction(models.Model):
+    class Kind(str, Enum):
+        LIKE = "like"
+        DISLIKE = "dislike"
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="reactions")
+    video = fields.ForeignKeyField("models.Video", related_name="reactions")
+    kind = fields.CharEnumField(Kind, max_length=10)
+    created = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("user", "video"),)
+
+
+class FeedEntry(models.Model):
+    """A video in the materialized following feed (inbox) of `user`."""
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="feed")
+    author = fields.ForeignKeyField("models.User", related_name="fanned_out")
+    video = fields.ForeignKeyField("models.Video", related_name="feed_entries")
+    # the video's, so inboxes page like the videos themselves
+    created = fields.DatetimeField()
+
+    class Meta:
+        unique_together = (("user", "video"),)
+        indexes = (("user_id", "created", "video_id"),)
+
+
 class Tag(models.Model):
     id = fields.IntField(pk=True)
     name = fields.CharField(max_length=64, unique=True)
@@ -55,6 +110,56 @@ class Tag(models.Model):
 
     videos: fields.ManyToManyRelation[Video]
 
+    class PydanticMeta:
+        exclude = ["videos"]
+
+
+class UploadSession(models.Model):
+    id = fields.UUIDField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="upload_sessions")
+    video = fields.OneToOneField("models.Video", related_name="upload_session")
+    content_type = fields.CharField(max_length=64)
+    size = fields.BigIntField()
+    offset = fields.BigIntField(default=0)
+    created = fields.DatetimeField(auto_now_add=True)
+    expires = fields.DatetimeField(index=True)
+    completed = fields.DatetimeField(null=True)
+
+    class PydanticMeta:
+        exclude = ["user", "video", "user_id"]
+        exclude_raw_fields = False
+
+
+class EncodingJob(models.Model):
+    class Status(str, Enum):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    class Kind(str, Enum):
+        MP4 = "mp4"
+        HLS = "hls"
+
+    id = fields.IntField(pk=True)
+    video = fields.ForeignKeyField("models.Video", related_name="jobs")
+    kind = fields.CharEnumField(Kind, max_length=10, default=Kind.MP4)
+    status = fields.CharEnumField(
+        Status, max_length=20, default=Status.QUEUED, index=True
+    )
+    input_path = fields.CharField(max_length=1024)
+    filename = fields.CharField(max_length=255)
+    upload_to = fields.CharField(max_length=255)
+    attempts = fields.IntField(default=0)
+    error = fields.TextField(null=True)
+    run_after = fields.DatetimeField(auto_now_add=True, index=True)
+    heartbeat = fields.DatetimeField(null=True)
+    created = fields.DatetimeField(auto_now_add=True)
+    started = fields.DatetimeField(null=True)
+    finished = fields.DatetimeField(null=True)
+    wait_time = fields.FloatField(null=True)
+    run_time = fields.FloatField(null=True)
+
 
 Tortoise.init_models(
     ["app.models.video", "app.models.user", "app.models.comment"], "models"
@@ -65,11 +170,16 @@ VideoModel = pydantic_model_creator(
     exclude=(
         "loading_status",
         "size",
+        "video_codec",
+        "audio_codec",
+        "bitrate",
         "video_comments",
         "storage",
         "user_id",
         "category_id",
+        "score",
     ),
 )
 CategoryModel = pydantic_model_creator(Category, name="Category")
 TagModel = pydantic_model_creator(Tag, name="Tag")
+UploadSessionModel = pydantic_model_creator(UploadSession, name="UploadSession")
@@ -1,3 +1,6 @@
+from .comment import *
 from .responses import *
+from .search import *
 from .token import *
 from .user import *
+from .video import *
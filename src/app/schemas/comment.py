@@ -0,0 +1,18 @@
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from app.models.comment import CommentModel
+
+
+class CommentCreate(BaseModel):
+    text: str
+    video_id: UUID
+    reply_to_id: Optional[int] = None
+
+
+class CommentThread(CommentModel):
+    # the newest replies, and the cursor of the ones after them
+    replies: List[CommentModel] = []
+    replies_next: Optional[str] = None
@@ -0,0 +1,17 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from app.models.user import UserModel
+from app.models.video import TagModel, VideoModel
+
+
+class SearchResults(BaseModel):
+    videos: List[VideoModel]
+    tags: List[TagModel]
+    users: List[UserModel]
+
+
+class Suggestions(BaseModel):
+    tags: List[str]
+    users: List[str]
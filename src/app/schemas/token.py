@@ -9,3 +9,7 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[int] = None
+    iat: Optional[int] = None
+    # the principal at the time the token was issued (app.utils.principals)
+    is_active: Optional[bool] = None
+    is_superuser: Optional[bool] = None
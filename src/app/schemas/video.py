@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from app.core.config import Storages
+
+
+class PlayURL(BaseModel):
+    url: str
+    expires_in: int
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    fetched_bytes: int
+    served_bytes: int
+    size: int
+    max_size: int
+    files: int
+
+
+class VideoImport(BaseModel):
+    title: str = Field(..., max_length=128)
+    user_id: int
+    # storage key of the encoded MP4, and of the HLS directory if any
+    path: str = Field(..., max_length=1024)
+    hls_path: Optional[str] = Field(None, max_length=1024)
+    storage: Optional[Storages] = None
+    tags: List[str] = []
+    category_id: Optional[int] = None
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    created: Optional[datetime] = None
+
+
+class VideoImportResult(BaseModel):
+    ids: List[UUID]
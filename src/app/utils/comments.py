@@ -0,0 +1,155 @@
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from pypika import Order, Table
+from pypika.analytics import RowNumber
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from app.core.config import get_settings
+from app.models.comment import Comment, CommentModel
+from app.models.video import Video
+from app.schemas import CommentThread
+from app.utils.paginator import (
+    NEXT,
+    CursorPage,
+    cursor_page,
+    encode_cursor,
+    load_items,
+)
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+async def add_comment(
+    user_id: int, video_id: UUID, text: str, reply_to_id: Optional[int] = None
+) -> Comment:
+    """
+    Comment on the video, or reply to one of its comments; the video's
+    `comments_count` and the parent's `replies_count` change along.
+    """
+    async with in_transaction() as conn:
+        comment = await Comment.create(
+            user_id=user_id,
+            video_id=video_id,
+            text=text,
+            reply_to_id=reply_to_id,
+            using_db=conn,
+        )
+        await Video.filter(id=video_id).using_db(conn).update(
+            comments_count=F("comments_count") + 1
+        )
+        if reply_to_id is not None:
+            await Comment.filter(id=reply_to_id).using_db(conn).update(
+                replies_count=F("replies_count") + 1
+            )
+    return comment
+
+
+async def first_replies(parent_ids: List[int], limit: int) -> Dict[int, List[dict]]:
+    """
+    The `limit` newest replies to each of the comments `parent_ids`, in the
+    order the replies endpoint pages them, from one windowed query.
+    """
+    if not parent_ids or limit <= 0:
+        return {}
+    db = Comment._meta.db
+    table = Table(Comment._meta.db_table)
+    position = (
+        RowNumber()
+        .over(table.reply_to_id)
+        .orderby(table.created, order=Order.desc)
+        .orderby(table.id, order=Order.desc)
+    )
+    ranked = (
+        db.query_class.from_(table)
+        .select(table.id, table.reply_to_id, table.created, position.as_("position"))
+        .where(table.reply_to_id.isin(parent_ids))
+    )
+    query = (
+        db.query_class.from_(ranked)
+        .select(ranked.id, ranked.reply_to_id, ranked.created)
+        .where(ranked.position <= limit)
+        .orderby(ranked.reply_to_id)
+        .orderby(ranked.position)
+    )
+    replies: Dict[int, List[dict]] = {}
+    for row in await db.execute_query_dict(str(query)):
+        replies.setdefault(row["reply_to_id"], []).append(row)
+    return replies
+
+
+async def with_replies(page: CursorPage, limit: int) -> CursorPage:
+    """`page` of comments as threads carrying their `limit` newest replies."""
+    replies = await first_replies([comment["id"] for comment in page.items], limit)
+    loaded = {
+        reply["id"]: reply
+        for reply in await load_items(
+            CommentModel, [row["id"] for rows in replies.values() for row in rows]
+        )
+    }
+    threads = []
+    for comment in page.items:
+        rows = replies.get(comment["id"], [])
+        thread = {
+            **comment,
+            "replies": [loaded[row["id"]] for row in rows if row["id"] in loaded],
+            "replies_next": None,
+        }
+        if thread["replies"] and comment["replies_count"] > len(thread["replies"]):
+            last = thread["replies"][-1]
+            thread["replies_next"] = encode_cursor(NEXT, last["created"], last["id"])
+        threads.append(thread)
+    threaded = cursor_page(CommentThread, threads, page.size)
+    threaded.next, threaded.previous = page.next, page.previous
+    threaded.total, threaded.total_strategy = page.total, page.total_strategy
+    return threaded
+
+
+async def remove_comments(user_id: int):
+    """
+    Uncount the comments of a user about to be deleted, and the replies
+    that go with them, from their videos and surviving parents.
+    """
+    async with in_transaction() as conn:
+        rows = await (
+            Comment.filter(user_id=user_id)
+            .using_db(conn)
+            .values_list("id", "video_id", "reply_to_id")
+        )
+        gone = {}
+        while rows:
+            gone.update({id_: (video_id, parent) for id_, video_id, parent in rows})
+            rows = await (
+                Comment.filter(reply_to_id__in=[row[0] for row in rows])
+                .exclude(id__in=list(gone))
+                .using_db(conn)
+                .values_list("id", "video_id", "reply_to_id")
+            )
+        by_video = Counter(video_id for video_id, _ in gone.values())
+        by_parent = Counter(
+            parent
+            for _, parent in gone.values()
+            if parent is not None and parent not in gone
+        )
+        for removed, video_ids in _grouped(by_video).items():
+            await Video.filter(id__in=video_ids).using_db(conn).update(
+                comments_count=F("comments_count") - removed
+            )
+        for removed, parent_ids in _grouped(by_parent).items():
+            await Comment.filter(id__in=parent_ids).using_db(conn).update(
+                replies_count=F("replies_count") - removed
+            )
+
+
+def _grouped(counts: Counter) -> Dict[int, list]:
+    """The keys of `counts` by their count, to update each group at once."""
+    groups: Dict[int, list] = {}
+    for key, value in counts.items():
+        groups.setdefault(value, []).append(key)
+    return groups
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Any, Dict, Optional, Tuple, Type
+
+from tortoise.expressions import F
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# (model, primary key) -> field -> pending increment
+Pending = Dict[Tuple[Type[Model], Any], Counter]
+
+
+class CounterBuffer:
+    """
+    Write-behind aggregator for hot counter columns (views, likes, ...).
+
+    Increments are summed in memory and written in batched UPDATEs every
+    `flush_interval` seconds, or as soon as `max_pending` rows have pending
+    increments, instead of one UPDATE per request fighting over the row lock.
+    `overlay` adds the pending increments to values read from the database,
+    so a client sees its own like before the flush.
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Pending = defaultdict(Counter)
+        # increments taken by the running flush, until they are committed
+        self._writing: Pending = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+    def incr(self, model: Type[Model], pk: Any, field: str, delta: int = 1):
+        self._pending[(model, pk)][field] += delta
+        if len(self._pending) >= self.max_pending and self._task is not None:
+            self._flush_soon()
+
+    def pending(self, model: Type[Model], pk: Any) -> Counter:
+        """Increments of `model` row `pk` not written yet."""
+        key = (model, pk)
+        return self._pending.get(key, Counter()) + self._writing.get(key, Counter())
+
+    def overlay(self, model: Type[Model], item: Any) -> Any:
+        """Add the pending increments of `model` row `item.id` to `item`."""
+        for field, delta in self.pending(model, item.id).items():
+            if hasattr(item, field):
+                setattr(item, field, getattr(item, field) + delta)
+        return item
+
+    async def flush(self) -> int:
+        """Write the pending increments; returns the number of UPDATEs run."""
+        while self._flushing is not None:
+            await asyncio.shield(self._flushing)
+        if not self._pending:
+            return 0
+        # the write is shielded: cancelling a caller must not lose increments
+        self._writing, self._pending = self._pending, defaultdict(Counter)
+        self._flushing = asyncio.ensure_future(self._write(self._writing))
+        self._flushing.add_done_callback(self._flushed)
+        return await asyncio.shield(self._flushing)
+
+    def _flushed(self, _):
+        self._flushing = None
+
+    async def _write(self, pending: Pending) -> int:
+        # one UPDATE per model, field and increment: most rows share a delta
+        batches = defaultdict(list)
+        for (model, pk), fields in pending.items():
+            for field, delta in fields.items():
+                if delta:
+                    batches[(model, field, delta)].append(pk)
+        try:
+            async with in_transaction():
+                for (model, field, delta), pks in batches.items():
+                    await model.filter(pk__in=pks).update(**{field: F(field) + delta})
+        except Exception:
+            logger.exception("Flushing counters failed, keeping them for later")
+            self._writing = {}
+            for key, fields in pending.items():
+                self._pending[key].update(fields)
+            return 0
+        self._writing = {}
+        logger.debug(f"Flushed {len(pending)} counters in {len(batches)} updates")
+        return len(batches)
+
+    def _flush_soon(self):
+        if self._flushing is None:
+            asyncio.ensure_future(self.flush())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and drain what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+counter_buffer = CounterBuffer(
+    flush_interval=settings.COUNTER_FLUSH_INTERVAL,
+    max_pending=settings.COUNTER_MAX_PENDING,
+)
@@ -0,0 +1,88 @@
+import json
+import logging
+from collections import defaultdict
+from enum import Enum
+from typing import Dict, Tuple, Type
+
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
+from tortoise.signals import post_delete, post_save
+
+from app.core.config import get_settings
+from app.models.comment import Comment
+from app.models.user import UserFollowing
+from app.models.video import Video
+from app.utils.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+class CountStrategy(str, Enum):
+    EXACT = "exact"
+    # the planner's row estimate, PostgreSQL only
+    ESTIMATE = "estimate"
+    # an exact count reused for COUNT_CACHE_TTL seconds or until the table changes
+    CACHED = "cached"
+
+
+_counts = TTLCache(maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL)
+# bumped on every write to a table, which orphans the counts cached for it
+_generations: Dict[str, int] = defaultdict(int)
+
+
+def invalidate_counts(model: Type[Model]):
+    """
+    Forget the cached counts over `model`'s table in this process.
+
+    Saves and deletes of the models below do this through signals; bulk
+    `update()`/`delete()` calls have to do it themselves. Other processes
+    pick the change up when their entries expire.
+    """
+    _generations[model._meta.db_table] += 1
+
+
+@post_save(Video, Comment, UserFollowing)
+async def _saved(sender, instance, created, using_db, update_fields):
+    invalidate_counts(sender)
+
+
+@post_delete(Video, Comment, UserFollowing)
+async def _deleted(sender, instance, using_db):
+    invalidate_counts(sender)
+
+
+async def count(
+    query: QuerySet, strategy: CountStrategy = CountStrategy.EXACT
+) -> Tuple[int, CountStrategy]:
+    """
+    Count the rows of `query` with `strategy`.
+
+    Returns the number with the strategy that actually produced it: a
+    planner estimate is only available on PostgreSQL and falls back to a
+    cached count elsewhere.
+    """
+    if strategy == CountStrategy.ESTIMATE:
+        if query.model._meta.db.capabilities.dialect == "postgres":
+            return await _estimate(query), CountStrategy.ESTIMATE
+        strategy = CountStrategy.CACHED
+
+    if strategy == CountStrategy.CACHED:
+        table = query.model._meta.db_table
+        key = (table, _generations[table], query.all().sql())
+        value = _counts.get(key)
+        if value is None:
+            value = await query.count()
+            _counts.set(key, value)
+        return value, CountStrategy.CACHED
+
+    return await query.count(), CountStrategy.EXACT
+
+
+async def _estimate(query: QuerySet) -> int:
+    plan = (await query.all().explain())[0]["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
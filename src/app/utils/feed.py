@@ -0,0 +1,156 @@
+import logging
+from typing import Iterable, List, Tuple
+
+from tortoise.functions import Count
+from tortoise.query_utils import Q
+from tortoise.queryset import QuerySet
+
+from app.core.config import get_settings
+from app.models.user import User, UserFollowing
+from app.models.video import FeedEntry, Video
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+async def fan_out(video: Video) -> int:
+    """
+    Copy a video that just became SUCCESS into the inboxes of its author's
+    followers; returns the number of inboxes written.
+
+    Each batch of inboxes written is trimmed to FEED_INBOX_SIZE right away.
+    Authors with more than FEED_FANOUT_MAX_FOLLOWERS followers are switched
+    to fan-out on read for good: their followers' feeds query their videos
+    instead, and switching back would drop the videos posted meanwhile.
+    """
+    author = await User.get(id=video.user_id)
+    if author.fanout_on_read:
+        return 0
+    followers = UserFollowing.filter(following_user_id=author.id)
+    if await followers.count() > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        await User.filter(id=author.id).update(fanout_on_read=True)
+        logger.info(f"User {author.id} switched to fan-out on read")
+        return 0
+
+    follower_ids = await followers.values_list("user_id", flat=True)
+    # a retried job may have fanned this video out already
+    done = set(
+        await FeedEntry.filter(video_id=video.id).values_list("user_id", flat=True)
+    )
+    entries = [
+        FeedEntry(
+            user_id=follower_id,
+            author_id=author.id,
+            video_id=video.id,
+            created=video.created,
+        )
+        for follower_id in follower_ids
+        if follower_id not in done
+    ]
+    for start in range(0, len(entries), settings.FEED_FANOUT_BATCH):
+        batch = entries[start : start + settings.FEED_FANOUT_BATCH]
+        await FeedEntry.bulk_create(batch)
+        await trim_inboxes(entry.user_id for entry in batch)
+    logger.debug(f"Fanned video {video.id} out to {len(entries)} feeds")
+    return len(entries)
+
+
+async def backfill(user_id: int, author_id: int) -> int:
+    """
+    Copy the latest videos of a newly followed author into the inbox, and
+    trim it to FEED_INBOX_SIZE.
+    """
+    author = await User.get_or_none(id=author_id)
+    if author is None or author.fanout_on_read:
+        return 0
+    videos = (
+        await Video.filter(
+            user_id=author_id, loading_status=Video.LoadingStatus.SUCCESS
+        )
+        .order_by("-created", "-id")
+        .limit(settings.FEED_BACKFILL_SIZE)
+        .values("id", "created")
+    )
+    done = set(
+        await FeedEntry.filter(user_id=user_id, author_id=author_id).values_list(
+            "video_id", flat=True
+        )
+    )
+    entries = [
+        FeedEntry(
+            user_id=user_id,
+            author_id=author_id,
+            video_id=video["id"],
+            created=video["created"],
+        )
+        for video in videos
+        if video["id"] not in done
+    ]
+    if entries:
+        await FeedEntry.bulk_create(entries)
+        await trim_inbox(user_id)
+    return len(entries)
+
+
+async def forget_author(user_id: int, author_id: int):
+    """Remove an unfollowed author's videos from the inbox."""
+    await FeedEntry.filter(user_id=user_id, author_id=author_id).delete()
+
+
+async def trim_inbox(user_id: int) -> int:
+    """Drop the entries beyond the newest FEED_INBOX_SIZE of the inbox."""
+    last = (
+        await FeedEntry.filter(user_id=user_id)
+        .order_by("-created", "-video_id")
+        .offset(settings.FEED_INBOX_SIZE - 1)
+        .limit(1)
+        .values("created", "video_id")
+    )
+    if not last:
+        return 0
+    created, video_id = last[0]["created"], last[0]["video_id"]
+    return await FeedEntry.filter(
+        Q(created__lt=created) | Q(created=created, video_id__lt=video_id),
+        user_id=user_id,
+    ).delete()
+
+
+async def trim_inboxes(user_ids: Iterable[int]) -> int:
+    """
+    `trim_inbox` the inboxes of `user_ids` holding more than FEED_INBOX_SIZE
+    entries; a single grouped count finds them.
+    """
+    full = (
+        await FeedEntry.filter(user_id__in=list(user_ids))
+        .annotate(entries=Count("id"))
+        .group_by("user_id")
+        .filter(entries__gt=settings.FEED_INBOX_SIZE)
+        .values_list("user_id", flat=True)
+    )
+    removed = 0
+    for user_id in full:
+        removed += await trim_inbox(user_id)
+    return removed
+
+
+async def feed_sources(user_id: int) -> List[Tuple[QuerySet, str]]:
+    """
+    What the following feed of the user is merged from, for `paginate_merged`:
+    the inbox, and the videos of followed authors who fan out on read.
+    """
+    sources = [(FeedEntry.filter(user_id=user_id), "video_id")]
+    pulled = await UserFollowing.filter(
+        user_id=user_id, following_user__fanout_on_read=True
+    ).values_list("following_user_id", flat=True)
+    if pulled:
+        sources.append(
+            (
+                Video.filter(
+                    user_id__in=pulled, loading_status=Video.LoadingStatus.SUCCESS
+                ),
+                "id",
+            )
+        )
+    return sources
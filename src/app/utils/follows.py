@@ -0,0 +1,86 @@
+import logging
+from typing import Iterable, List
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from app.core.config import get_settings
+from app.models.user import User, UserFollowing
+from app.utils.counts import invalidate_counts
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+async def follow(user_id: int, author_id: int) -> bool:
+    """
+    Subscribe the user to the author; False if they already were.
+
+    The follow row and both users' `following_count`/`followers_count`
+    change in one transaction. The unique (user, following_user) constraint
+    settles concurrent requests: the loser's insert fails and its
+    transaction is rolled back.
+    """
+    try:
+        async with in_transaction() as conn:
+            await UserFollowing.create(
+                user_id=user_id, following_user_id=author_id, using_db=conn
+            )
+            await _count(conn, [user_id], [author_id], 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+async def unfollow(user_id: int, author_id: int) -> bool:
+    """Unsubscribe the user from the author; False if they weren't subscribed."""
+    async with in_transaction() as conn:
+        deleted = (
+            await UserFollowing.filter(user_id=user_id, following_user_id=author_id)
+            .using_db(conn)
+            .delete()
+        )
+        if deleted:
+            await _count(conn, [user_id], [author_id], -1)
+    invalidate_counts(UserFollowing)
+    return bool(deleted)
+
+
+async def followed_ids(user_id: int, author_ids: Iterable[int]) -> List[int]:
+    """Those of `author_ids` the user follows, in one query."""
+    return await UserFollowing.filter(
+        user_id=user_id, following_user_id__in=list(author_ids)
+    ).values_list("following_user_id", flat=True)
+
+
+async def remove_follows(user_id: int):
+    """Drop the follows of and to a user about to be deleted, with the counts."""
+    async with in_transaction() as conn:
+        authors = (
+            await UserFollowing.filter(user_id=user_id)
+            .using_db(conn)
+            .values_list("following_user_id", flat=True)
+        )
+        followers = (
+            await UserFollowing.filter(following_user_id=user_id)
+            .using_db(conn)
+            .values_list("user_id", flat=True)
+        )
+        await _count(conn, followers, authors, -1)
+        await UserFollowing.filter(user_id=user_id).using_db(conn).delete()
+        await UserFollowing.filter(following_user_id=user_id).using_db(conn).delete()
+    invalidate_counts(UserFollowing)
+
+
+async def _count(conn, follower_ids: List[int], author_ids: List[int], delta: int):
+    if follower_ids:
+        await User.filter(id__in=follower_ids).using_db(conn).update(
+            following_count=F("following_count") + delta
+        )
+    if author_ids:
+        await User.filter(id__in=author_ids).using_db(conn).update(
+            followers_count=F("followers_count") + delta
+        )
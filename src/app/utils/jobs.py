@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Optional
+
+from tortoise.expressions import F
+from tortoise.timezone import now
+
+from app.core.config import get_settings
+from app.models.video import EncodingJob, Video
+from app.utils.feed import fan_out
+from app.utils.response_cache import response_cache
+from app.utils.video import (
+    encode_video,
+    encode_video_hls,
+    enqueue_encoding,
+    remove_video,
+)
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+async def requeue_stale_jobs() -> int:
+    """
+    Put back RUNNING jobs whose worker stopped sending heartbeats.
+
+    Jobs that already used up their attempts are failed instead, so a source
+    that takes down its worker every time isn't retried forever.
+    """
+    stale_before = now() - timedelta(seconds=settings.JOB_STALE_TIMEOUT)
+    stale = EncodingJob.filter(
+        status=EncodingJob.Status.RUNNING, heartbeat__lt=stale_before
+    )
+    exhausted = await stale.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS)
+    for job in exhausted:
+        job.status = EncodingJob.Status.FAILED
+        job.error = "Worker stopped responding"
+        job.finished = now()
+        await job.save()
+        if job.kind == EncodingJob.Kind.MP4:
+            await Video.filter(id=job.video_id).update(
+                loading_status=Video.LoadingStatus.FAIL
+            )
+        if os.path.isfile(job.input_path):
+            remove_video(job.input_path)
+        logger.error(f"Encoding job {job.id} failed: worker stopped responding")
+
+    count = await stale.filter(attempts__lt=settings.JOB_MAX_ATTEMPTS).update(
+        status=EncodingJob.Status.QUEUED, run_after=now()
+    )
+    if count:
+        logger.warning(f"Requeued {count} stale encoding jobs")
+    return count
+
+
+async def claim_job() -> Optional[EncodingJob]:
+    """
+    Take the oldest due job off the queue.
+
+    The claim is a conditional UPDATE on the job status, so concurrent
+    workers never pick the same job.
+    """
+    while True:
+        job = (
+            await EncodingJob.filter(
+                status=EncodingJob.Status.QUEUED, run_after__lte=now()
+            )
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = await EncodingJob.filter(
+            id=job.id, status=EncodingJob.Status.QUEUED
+        ).update(
+            status=EncodingJob.Status.RUNNING,
+            attempts=F("attempts") + 1,
+            heartbeat=now(),
+        )
+        if claimed:
+            return await EncodingJob.get(id=job.id)
+
+
+async def _heartbeat(job: EncodingJob):
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+        await EncodingJob.filter(id=job.id).update(heartbeat=now())
+
+
+async def run_job(job: EncodingJob):
+    job.started = now()
+    job.wait_time = (job.started - job.run_after).total_seconds()
+    video_obj = await Video.get_or_none(id=job.video_id)
+
+    if job.attempts > settings.JOB_MAX_ATTEMPTS:
+        status, detail = False, f"Gave up after {settings.JOB_MAX_ATTEMPTS} attempts"
+    elif video_obj is None:
+        status, detail = False, "Video was removed"
+        job.attempts = settings.JOB_MAX_ATTEMPTS
+    elif not os.path.isfile(job.input_path):
+        status, detail = False, "Input file is not a file"
+        job.attempts = settings.JOB_MAX_ATTEMPTS
+    else:
+        if job.kind == EncodingJob.Kind.HLS:
+            encoding = encode_video_hls(video_obj, job.input_path)
+        else:
+            encoding = encode_video(
+                video_obj, job.upload_to, job.input_path, job.filename
+            )
+        heartbeat = asyncio.ensure_future(_heartbeat(job))
+        try:
+            status, detail = await asyncio.wait_for(
+                encoding, timeout=settings.JOB_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            status, detail = False, f"Timed out after {settings.JOB_TIMEOUT}s"
+        except Exception as e:
+            logger.exception(f"Encoding job {job.id} crashed")
+            status, detail = False, str(e)
+        finally:
+            heartbeat.cancel()
+
+    job.finished = now()
+    job.run_time = (job.finished - job.started).total_seconds()
+
+    # HLS is best effort: its outcome never changes the video status
+    updates_video = video_obj is not None and job.kind == EncodingJob.Kind.MP4
+    # the source is handed over to the HLS job instead of being removed
+    keep_input = False
+
+    if status:
+        job.status = EncodingJob.Status.DONE
+        job.error = None
+        if updates_video:
+            try:
+                await fan_out(video_obj)
+            except Exception:
+                # the video is still listed, only missing from following feeds
+                logger.exception(f"Fanning out video {video_obj.id} failed")
+            # reaches the API processes through the shared response cache only
+            await response_cache.invalidate("videos", f"video:{video_obj.id}")
+        if updates_video and settings.ENCODE_HLS:
+            await enqueue_encoding(
+                video_obj,
+                job.upload_to,
+                job.input_path,
+                job.filename,
+                EncodingJob.Kind.HLS,
+            )
+            keep_input = True
+    elif job.attempts < settings.JOB_MAX_ATTEMPTS:
+        delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        job.status = EncodingJob.Status.QUEUED
+        job.run_after = now() + timedelta(seconds=delay)
+        job.error = detail
+        if updates_video:
+            video_obj.loading_status = Video.LoadingStatus.PENDING
+            await video_obj.save()
+        logger.warning(f"Encoding job {job.id} failed, retry in {delay}s: {detail}")
+    else:
+        job.status = EncodingJob.Status.FAILED
+        job.error = detail
+        if updates_video:
+            video_obj.loading_status = Video.LoadingStatus.FAIL
+            await video_obj.save()
+        logger.error(f"Encoding job {job.id} failed: {detail}")
+
+    await job.save()
+    if (
+        job.status != EncodingJob.Status.QUEUED
+        and not keep_input
+        and os.path.isfile(job.input_path)
+    ):
+        remove_video(job.input_path)
+
+    logger.info(
+        f"Encoding job {job.id} ({job.kind.value}) {job.status.value}: "
+        f"waited {job.wait_time:.1f}s, ran {job.run_time:.1f}s"
+    )
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict
+from uuid import uuid4
+
+import aiofiles
+
+from app.core.config import get_settings
+from app.core.s3 import s3_client
+from app.utils.cache import TTLCache
+from app.utils.streaming import read_range
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# downloads left behind by a crashed process are removed after this long
+STALE_PART_SECONDS = 60 * 60
+
+
+class CacheBypass(Exception):
+    """The object is too large to be cached and has to be streamed from S3."""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+
+class DiskCache:
+    """
+    Read-through LRU cache of S3 objects on the local disk.
+
+    Concurrent misses for the same key share a single download. Files are
+    named after a hash of their key and written atomically, so processes can
+    share the directory; each process keeps it within `max_size` on its own.
+    """
+
+    def __init__(self, root: str, max_size: int, max_object_size: int):
+        self.root = root
+        self.max_size = max_size
+        self.max_object_size = max_object_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fetched_bytes = 0
+        self.served_bytes = 0
+        # file name -> size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._oversized = TTLCache(maxsize=1024, ttl=60 * 60)
+        self._loaded = False
+
+    def _load(self):
+        """Pick up the files cached before a restart, oldest access first."""
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name.endswith(".part"):
+                    if stat.st_mtime < time.time() - STALE_PART_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                found.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._files[name] = size
+            self.size += size
+        self._loaded = True
+        self._evict()
+
+    def _add(self, name: str, size: int):
+        self.size += size - self._files.pop(name, 0)
+        self._files[name] = size
+        self._evict()
+
+    def _forget(self, name: str):
+        self.size -= self._files.pop(name, 0)
+
+    def _evict(self):
+        while self.size > self.max_size and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted {name} ({size} bytes) from the media cache")
+
+    async def get(self, key: str) -> str:
+        """
+        Local path of the object `key`, downloaded on a miss. The file keeps
+        the object's size and its S3 modification time.
+
+        Raises `CacheBypass` for objects above `max_object_size` and
+        botocore's `ClientError` when the object can't be fetched.
+        """
+        if not self._loaded:
+            self._load()
+        name = self._name(key)
+        path = os.path.join(self.root, name)
+
+        size = self._files.get(name)
+        if size is not None:
+            if os.path.isfile(path):
+                self._files.move_to_end(name)
+                self.hits += 1
+                return path
+            # evicted by another process sharing the directory
+            self._forget(name)
+
+        oversized = self._oversized.get(name)
+        if oversized is not None:
+            raise CacheBypass(oversized)
+
+        self.misses += 1
+        fetch = self._pending.get(name)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch(key, name, path))
+            self._pending[name] = fetch
+            fetch.add_done_callback(lambda _: self._pending.pop(name, None))
+        # a client going away must not abort the download other requests wait on
+        await asyncio.shield(fetch)
+        return path
+
+    async def open(self, key: str):
+        """
+        The object `key` opened for reading, downloaded on a miss.
+
+        The open file stays readable when the entry is evicted or discarded
+        while it is streamed. Raises `FileNotFoundError` when another process
+        sharing the directory removed the file first.
+        """
+        path = await self.get(key)
+        return await aiofiles.open(path, mode="rb")
+
+    def discard(self, key: str):
+        """Drop `key` from the cache, e.g. after the object was deleted."""
+        name = self._name(key)
+        self._forget(name)
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    async def _fetch(self, key: str, name: str, path: str) -> int:
+        part = os.path.join(self.root, f"{name}.{uuid4().hex}.part")
+        async with s3_client() as s3:
+            s3_ob = await s3.get_object(Bucket=settings.BUCKET_NAME, Key=key)
+            size = s3_ob["ContentLength"]
+            async with s3_ob["Body"] as stream:
+                if size > self.max_object_size:
+                    self._oversized.set(name, size)
+                    raise CacheBypass(size)
+                try:
+                    async with aiofiles.open(part, mode="wb") as f:
+                        while True:
+                            chunk = await stream.read(settings.STREAM_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            await f.write(chunk)
+                    modified = s3_ob["LastModified"].timestamp()
+                    os.utime(part, (time.time(), modified))
+                    os.replace(part, path)
+                except BaseException:
+                    if os.path.exists(part):
+                        os.remove(part)
+                    raise
+        self.fetched_bytes += size
+        self._add(name, size)
+        logger.debug(f"Cached {key} ({size} bytes)")
+        return size
+
+    async def stream(self, f, start: int, end: int):
+        """Yield the bytes `start..end` of a file returned by `open`."""
+        async for chunk in read_range(f, start, end):
+            self.served_bytes += len(chunk)
+            yield chunk
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "fetched_bytes": self.fetched_bytes,
+            "served_bytes": self.served_bytes,
+            "size": self.size,
+            "max_size": self.max_size,
+            "files": len(self._files),
+        }
+
+
+video_cache = DiskCache(
+    root=os.path.join(settings.MEDIA_ROOT, "cache"),
+    max_size=settings.S3_CACHE_MAX_SIZE,
+    max_object_size=settings.S3_CACHE_MAX_OBJECT_SIZE,
+)
@@ -1,67 +1,218 @@
-from typing import Optional, Type, Union
-
-from fastapi_pagination.api import create_page, resolve_params
-from fastapi_pagination.bases import (
-    AbstractPage,
-    AbstractParams,
+import base64
+import json
+from datetime import datetime
+from typing import (
+    Any,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
 )
-from tortoise.models import Model
-from tortoise.queryset import QuerySet
-
-from app.models.comment import CommentModel
-from app.models.video import VideoModel
-from app.models.user import UserModel
-
-
-async def video_paginate(
-    query: Union[QuerySet, Type[Model]], params: Optional[AbstractParams] = None
-) -> AbstractPage:
-    if not isinstance(query, QuerySet):
-        query = query.all()
 
-    params = resolve_params(params)
-
-    limit_offset_params = params.to_limit_offset()
+from fastapi import HTTPException, Query, status
+from pydantic.generics import GenericModel
+from tortoise.contrib.pydantic import PydanticModel
+from tortoise.query_utils import Q
+from tortoise.queryset import QuerySet
 
-    total = await query.count()
-    items = await VideoModel.from_queryset(
-        query.offset(limit_offset_params.offset).limit(limit_offset_params.limit).all()
+from app.utils.counts import CountStrategy, count
+from app.utils.projection import projection
+
+T = TypeVar("T")
+
+NEXT, PREVIOUS = "n", "p"
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: Sequence[T]
+    size: int
+    next: Optional[str] = None
+    previous: Optional[str] = None
+    total: Optional[int] = None
+    total_strategy: Optional[CountStrategy] = None
+
+
+class CursorParams:
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(
+            None, description="`next` or `previous` of the page before"
+        ),
+        size: int = Query(50, ge=1, le=100),
+        include_total: bool = Query(False, description="Also count all items"),
+    ):
+        self.cursor = cursor
+        self.size = size
+        self.include_total = include_total
+
+
+def encode_cursor(direction: str, key: Any, id_) -> str:
+    """Cursor of the row with the sort `key` (`created` by default) and `id_`."""
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([direction, key, id_ if isinstance(id_, int) else str(id_)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type = datetime) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, key, id_ = json.loads(raw)
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        if key_type is datetime:
+            return direction, datetime.fromisoformat(key), id_
+        return direction, key_type(key), id_
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+async def paginate(
+    query: QuerySet,
+    params: CursorParams,
+    model: Type[PydanticModel],
+    through: Optional[str] = None,
+    count_strategy: CountStrategy = CountStrategy.EXACT,
+) -> CursorPage:
+    """
+    Keyset pagination over `query`, newest first by `(created, id)`.
+
+    Pages are found with an indexed range condition instead of OFFSET, so
+    deep pages cost the same as the first one. Nothing is counted unless
+    `include_total` is asked for; the endpoint picks how with `count_strategy`.
+    `through` names a reverse relation the rows are filtered on whose
+    `(created, id)` orders them instead of their own: follower lists are
+    users ordered by follow time, read with the join in a single query.
+    """
+    if through:
+        prefix = f"{through}__"
+        direction, paged = _seek(query, params.cursor, "id", prefix)
+        fields = list(model.__fields__)
+        rows = await paged.limit(params.size + 1).values(
+            *fields, through_created=f"{prefix}created", through_id=f"{prefix}id"
+        )
+        rows = [
+            {
+                "created": row["through_created"],
+                "id": row["through_id"],
+                "item": {field: row[field] for field in fields},
+            }
+            for row in rows
+        ]
+    else:
+        direction, paged = _seek(query, params.cursor, "id")
+        rows = await paged.limit(params.size + 1).values("id", "created")
+    page = await _page(model, rows, params, direction)
+    if params.include_total:
+        page.total, page.total_strategy = await count(query, count_strategy)
+    return page
+
+
+async def paginate_merged(
+    sources: Sequence[Tuple[QuerySet, str]],
+    params: CursorParams,
+    model: Type[PydanticModel],
+) -> CursorPage:
+    """
+    Keyset pagination over the union of `sources`, newest first.
+
+    Each source is a query with the name of its field holding the primary
+    key of the listed items, and pages by `(created, <that field>)`. The
+    sources are read a page at a time each and merged; items found in
+    several sources are listed once. Totals are not available.
+    """
+    rows = {}
+    direction = NEXT
+    for query, key in sources:
+        direction, paged = _seek(query, params.cursor, key)
+        for row in await paged.limit(params.size + 1).values("created", key):
+            rows[row[key]] = {"created": row["created"], "id": row[key]}
+    merged = sorted(
+        rows.values(),
+        key=lambda row: (row["created"], row["id"]),
+        reverse=direction == NEXT,
     )
-
-    return create_page(items, total, params)
-
-
-async def comments_paginate(
-    query: Union[QuerySet, Type[Model]], params: Optional[AbstractParams] = None
-) -> AbstractPage:
-    if not isinstance(query, QuerySet):
-        query = query.all()
-
-    params = resolve_params(params)
-
-    limit_offset_params = params.to_limit_offset()
-
-    total = await query.count()
-    items = await CommentModel.from_queryset(
-        query.offset(limit_offset_params.offset).limit(limit_offset_params.limit).all()
+    return await _page(model, merged[: params.size + 1], params, direction)
+
+
+def _seek(
+    query: QuerySet, cursor: Optional[str], key: str, prefix: str = ""
+) -> Tuple[str, QuerySet]:
+    """
+    Direction of `cursor` and `query` ordered and filtered to start after it;
+    `prefix` is the path of a relation holding `created` and `key`.
+    """
+    created_field, key = f"{prefix}created", f"{prefix}{key}"
+    direction = NEXT
+    if cursor:
+        direction, created, id_ = decode_cursor(cursor)
+        if direction == NEXT:
+            query = query.filter(
+                Q(**{f"{created_field}__lt": created})
+                | Q(**{created_field: created, f"{key}__lt": id_})
+            )
+        else:
+            query = query.filter(
+                Q(**{f"{created_field}__gt": created})
+                | Q(**{created_field: created, f"{key}__gt": id_})
+            )
+    if direction == NEXT:
+        return direction, query.order_by(f"-{created_field}", f"-{key}")
+    return direction, query.order_by(created_field, key)
+
+
+async def _page(
+    model: Type[PydanticModel], rows: List[dict], params: CursorParams, direction: str
+) -> CursorPage:
+    """
+    The page of the first `params.size` of `rows`, which were fetched in
+    `direction` with one row more to tell whether there is another page.
+
+    Rows hold the `created` and `id` of the cursors, and the serialized
+    `item` when it was read with them; otherwise `id` is the primary key
+    of the item to load.
+    """
+    size = params.size
+    more = len(rows) > size
+    rows = rows[:size]
+    if direction == PREVIOUS:
+        rows.reverse()
+
+    has_next = more if direction == NEXT else True
+    has_previous = more if direction == PREVIOUS else bool(params.cursor)
+    if rows and "item" in rows[0]:
+        items = [row["item"] for row in rows]
+    else:
+        items = await load_items(model, [row["id"] for row in rows])
+    page = cursor_page(model, items, size)
+    if rows and has_next:
+        page.next = encode_cursor(NEXT, rows[-1]["created"], rows[-1]["id"])
+    if rows and has_previous:
+        page.previous = encode_cursor(PREVIOUS, rows[0]["created"], rows[0]["id"])
+    return page
+
+
+def cursor_page(model: Type[PydanticModel], items: list, size: int) -> CursorPage:
+    """
+    A page of `items` serialized by `load_items`, built without validating
+    them again; endpoints return it as is or through `FastJSONResponse`.
+    """
+    page = CursorPage[model].construct(items=items, size=size)
+    # construct() puts the defaults first, the JSON keeps the declared order
+    object.__setattr__(
+        page, "__dict__", {name: getattr(page, name) for name in page.__fields__}
     )
+    return page
 
-    return create_page(items, total, params)
-
-
-async def users_paginate(
-    query: Union[QuerySet, Type[Model]], params: Optional[AbstractParams] = None
-) -> AbstractPage:
-    if not isinstance(query, QuerySet):
-        query = query.all()
-
-    params = resolve_params(params)
-
-    limit_offset_params = params.to_limit_offset()
-
-    total = await query.count()
-    items = await UserModel.from_queryset(
-        query.offset(limit_offset_params.offset).limit(limit_offset_params.limit).all()
-    )
 
-    return create_page(items, total, params)
+async def load_items(model: Type[PydanticModel], ids: List) -> List[dict]:
+    """
+    Serialize the objects with the primary keys `ids`, in that order, as
+    the dicts of `model`: read by their projection, not through ORM objects.
+    """
+    return await projection(model).rows(ids)
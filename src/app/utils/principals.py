@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from tortoise.signals import post_delete, post_save
+
+from app.core.config import get_settings
+from app.core.resp import RespClient, RespError
+from app.models.user import User
+from app.schemas import TokenPayload
+from app.utils.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+REVOKED_PREFIX = "auth:rev:"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Who an authenticated request is made by."""
+
+    id: int
+    is_active: bool
+    is_superuser: bool
+
+
+class PrincipalCache:
+    """
+    The principals of users by id, read from the database once per `ttl`
+    seconds instead of on every authenticated request; ids without a user
+    are remembered as such for `negative_ttl`.
+
+    Tokens may carry the principal as claims: they are trusted unless their
+    user was invalidated after the token was issued, which is remembered for
+    `revoked_ttl` (the lifetime of a token). Invalidations are per process,
+    unless a `shared` Redis-protocol server publishes them: it is then asked
+    on every lookup, so a user deleted or demoted by one process is not
+    trusted by the others. The shared server being down leaves each process
+    with its own invalidations.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        negative_ttl: float,
+        maxsize: int,
+        revoked_ttl: float,
+        shared: Optional[RespClient] = None,
+    ):
+        self.negative_ttl = negative_ttl
+        self.revoked_ttl = revoked_ttl
+        self.shared = shared
+        # user id -> (time.time() it was read at, principal)
+        self._principals = TTLCache(maxsize=maxsize, ttl=ttl)
+        # user id -> time.time() of their last invalidation
+        self._revoked = TTLCache(maxsize=maxsize, ttl=revoked_ttl)
+        self._loading: Dict[int, asyncio.Future] = {}
+
+    async def get(self, user_id: int) -> Optional[Principal]:
+        """The principal of the user `user_id`, None when there is no such user."""
+        cached = self._principals.get(user_id)
+        if cached is not None and cached[0] > await self._last_revoked(user_id):
+            return cached[1]
+        future = self._loading.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def from_claims(self, payload: TokenPayload) -> Optional[Principal]:
+        """The principal the claims of a token describe, if they still hold."""
+        if None in (payload.sub, payload.iat, payload.is_active, payload.is_superuser):
+            return None
+        if await self._last_revoked(payload.sub) >= payload.iat:
+            return None
+        return Principal(payload.sub, payload.is_active, payload.is_superuser)
+
+    async def invalidate(self, user_id: int):
+        """
+        Forget the user `user_id` and the claims of their tokens issued until
+        now, in every process.
+        """
+        now = time.time()
+        self._principals.delete(user_id)
+        self._revoked.set(user_id, now)
+        await self._shared(
+            "SET",
+            f"{REVOKED_PREFIX}{user_id}",
+            repr(now),
+            "PX",
+            int(self.revoked_ttl * 1000),
+        )
+
+    async def close(self):
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def _last_revoked(self, user_id: int) -> float:
+        last = self._revoked.get(user_id, 0)
+        value = await self._shared("GET", f"{REVOKED_PREFIX}{user_id}")
+        if value:
+            last = max(last, float(value))
+            # later lookups of this process and `_load` see it too
+            self._revoked.set(user_id, last)
+        return last
+
+    async def _load(self, user_id: int) -> Optional[Principal]:
+        started = time.time()
+        rows = await User.filter(id=user_id).values("id", "is_active", "is_superuser")
+        principal = Principal(**rows[0]) if rows else None
+        # an invalidation during the query may have made the row stale
+        if self._revoked.get(user_id, 0) < started:
+            self._principals.set(
+                user_id,
+                (started, principal),
+                ttl=None if principal else self.negative_ttl,
+            )
+        return principal
+
+    async def _shared(self, *args) -> Any:
+        if self.shared is None:
+            return None
+        try:
+            return await self.shared.execute(*args)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Shared revocations unavailable: {e!r}")
+        except RespError as e:
+            logger.warning(f"Shared revocations error: {e}")
+        return None
+
+
+principals = PrincipalCache(
+    ttl=settings.AUTH_CACHE_TTL,
+    negative_ttl=settings.AUTH_CACHE_NEGATIVE_TTL,
+    maxsize=settings.AUTH_CACHE_SIZE,
+    revoked_ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    shared=RespClient(settings.RESPONSE_CACHE_URL)
+    if settings.RESPONSE_CACHE_URL
+    else None,
+)
+
+
+@post_save(User)
+async def _saved(sender, instance, created, using_db, update_fields):
+    await principals.invalidate(instance.id)
+
+
+@post_delete(User)
+async def _deleted(sender, instance, using_db):
+    await principals.invalidate(instance.id)
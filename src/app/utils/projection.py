@@ -0,0 +1,159 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Tuple, Type
+from uuid import UUID
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from tortoise.contrib.pydantic import PydanticModel
+
+from app.utils.counters import counter_buffer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is used instead
+    orjson = None
+
+PLAIN, FOREIGN_KEY, MANY_TO_MANY = "plain", "fk", "m2m"
+
+
+class Projection:
+    """
+    How to read the serialized shape of a pydantic `model` of a Tortoise model
+    straight from the database: its columns, those of its foreign keys
+    through a join, and its many-to-many relations with one more query.
+
+    The rows come out as the dicts `model(...).dict()` would give, without
+    instantiating ORM objects or validating them. Related models have to be
+    leaves (no relations of their own), as `pydantic_model_creator` makes them.
+    """
+
+    def __init__(self, model: Type[PydanticModel]):
+        self.model = model
+        self.orig_model = model.__config__.orig_model
+        meta = self.orig_model._meta
+        self.layout: List[Tuple[str, str, List[str]]] = []
+        self.columns: List[str] = []
+        for name, field in model.__fields__.items():
+            if name in meta.fk_fields or name in meta.o2o_fields:
+                subfields = self._leaf_fields(name, field.type_)
+                self.layout.append((name, FOREIGN_KEY, subfields))
+                self.columns += [f"{name}__{subfield}" for subfield in subfields]
+            elif name in meta.m2m_fields:
+                subfields = self._leaf_fields(name, field.type_)
+                self.layout.append((name, MANY_TO_MANY, subfields))
+            elif name in meta.fields_map:
+                self.layout.append((name, PLAIN, []))
+                self.columns.append(name)
+            else:
+                raise ValueError(f"{model.__name__}.{name} can't be projected")
+
+    def _leaf_fields(self, name: str, model: Type[BaseModel]) -> List[str]:
+        related = model.__config__.orig_model._meta
+        fields = list(model.__fields__)
+        if fields[0] != related.pk_attr or any(
+            field not in related.fields_db_projection for field in fields
+        ):
+            raise ValueError(f"{self.model.__name__}.{name} isn't a leaf model")
+        return fields
+
+    async def rows(self, ids: List) -> List[dict]:
+        """The serialized objects with the primary keys `ids`, in that order."""
+        if not ids:
+            return []
+        pk = self.orig_model._meta.pk_attr
+        query = self.orig_model.filter(pk__in=ids)
+        columns = list(dict.fromkeys([pk] + self.columns))
+        rows = {str(row[pk]): row for row in await query.values(*columns)}
+        related = {}
+        for name, kind, subfields in self.layout:
+            if kind == MANY_TO_MANY:
+                related[name] = await self._many(query, name, subfields)
+
+        items = []
+        for id_ in ids:
+            row = rows.get(str(id_))
+            if row is None:
+                continue
+            item = {}
+            for name, kind, subfields in self.layout:
+                if kind == PLAIN:
+                    item[name] = row[name]
+                elif kind == FOREIGN_KEY:
+                    item[name] = (
+                        None
+                        if row[f"{name}__{subfields[0]}"] is None
+                        else {sub: row[f"{name}__{sub}"] for sub in subfields}
+                    )
+                else:
+                    item[name] = related[name].get(str(row[pk]), [])
+            for field, delta in counter_buffer.pending(
+                self.orig_model, row[pk]
+            ).items():
+                if field in item:
+                    item[field] += delta
+            items.append(item)
+        return items
+
+    async def _many(self, query, name: str, subfields: List[str]) -> Dict[str, list]:
+        pk = self.orig_model._meta.pk_attr
+        paths = [f"{name}__{subfield}" for subfield in subfields]
+        related: Dict[str, list] = {}
+        for row in await query.order_by(paths[0]).values_list(pk, *paths):
+            if row[1] is not None:
+                related.setdefault(str(row[0]), []).append(
+                    dict(zip(subfields, row[1:]))
+                )
+        return related
+
+
+_projections: Dict[Type[PydanticModel], Projection] = {}
+
+
+def projection(model: Type[PydanticModel]) -> Projection:
+    if model not in _projections:
+        _projections[model] = Projection(model)
+    return _projections[model]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def render_json(content: Any) -> bytes:
+    """
+    `content` as the JSON FastAPI would send for it, skipping
+    `jsonable_encoder`: with orjson when it is installed.
+    """
+    if isinstance(content, BaseModel):
+        content = content.dict()
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSONResponse rendered by `render_json`."""
+
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
@@ -0,0 +1,95 @@
+import logging
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from uuid import UUID
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from app.core.config import get_settings
+from app.models.video import Reaction, Video
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# the Video column counting each kind of reaction
+COUNTERS = {Reaction.Kind.LIKE: "likes", Reaction.Kind.DISLIKE: "dislikes"}
+
+
+async def react(
+    user_id: int, video_id: UUID, kind: Reaction.Kind
+) -> Optional[Reaction.Kind]:
+    """
+    Toggle the user's `kind` reaction to the video.
+
+    Reacting the same way twice takes the reaction back, reacting the other
+    way replaces it. The reaction row and the video's `likes`/`dislikes`
+    change in one transaction. Returns the reaction left, if any.
+    """
+    try:
+        return await _react(user_id, video_id, kind)
+    except IntegrityError:
+        # a concurrent request of the same user created the row first
+        logger.debug(f"Retrying the reaction of {user_id} to {video_id}")
+        return await _react(user_id, video_id, kind)
+
+
+async def _react(
+    user_id: int, video_id: UUID, kind: Reaction.Kind
+) -> Optional[Reaction.Kind]:
+    async with in_transaction() as conn:
+        current = (
+            await Reaction.filter(user_id=user_id, video_id=video_id)
+            .select_for_update()
+            .using_db(conn)
+            .first()
+        )
+        changes = Counter({COUNTERS[kind]: 1})
+        if current is None:
+            await Reaction.create(
+                user_id=user_id, video_id=video_id, kind=kind, using_db=conn
+            )
+            result = kind
+        elif current.kind == kind:
+            await current.delete(using_db=conn)
+            changes[COUNTERS[kind]] = -1
+            result = None
+        else:
+            changes[COUNTERS[current.kind]] = -1
+            current.kind = kind
+            await current.save(using_db=conn, update_fields=["kind"])
+            result = kind
+        await Video.filter(id=video_id).using_db(conn).update(
+            **{field: F(field) + delta for field, delta in changes.items()}
+        )
+    return result
+
+
+async def user_reactions(user_id: int, video_ids: Iterable[UUID]) -> Dict[str, str]:
+    """The user's reactions to the videos `video_ids`, in one query."""
+    rows = await Reaction.filter(
+        user_id=user_id, video_id__in=list(video_ids)
+    ).values_list("video_id", "kind")
+    return {str(video_id): kind for video_id, kind in rows}
+
+
+async def remove_reactions(user_id: int):
+    """Take back every reaction of a user about to be deleted."""
+    async with in_transaction() as conn:
+        rows = (
+            await Reaction.filter(user_id=user_id)
+            .using_db(conn)
+            .values_list("video_id", "kind")
+        )
+        by_kind = {}
+        for video_id, kind in rows:
+            by_kind.setdefault(kind, []).append(video_id)
+        for kind, video_ids in by_kind.items():
+            field = COUNTERS[Reaction.Kind(kind)]
+            await Video.filter(id__in=video_ids).using_db(conn).update(
+                **{field: F(field) - 1}
+            )
+        await Reaction.filter(user_id=user_id).using_db(conn).delete()
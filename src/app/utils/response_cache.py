@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import get_settings
+from app.core.resp import RespClient, RespError
+from app.utils.cache import TTLCache
+from app.utils.projection import render_json
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# (time.time() its computation started at, JSON body)
+Page = Tuple[float, bytes]
+
+PAGE_PREFIX = "rc:page:"
+INVALIDATED_PREFIX = "rc:inv:"
+
+
+class ResponseCache:
+    """
+    Rendered JSON responses of public endpoints, by path and query string.
+
+    A page is fresh for its route's TTL, then served stale for `stale`
+    seconds more while one request recomputes it in the background;
+    concurrent misses of a page share one computation. Pages belong to
+    scopes (e.g. "video:<id>") and `invalidate` drops every page of a scope
+    computed before it. Pages live in a per-process LRU, and with a `shared`
+    Redis-protocol server also there, where invalidations reach the other
+    processes; the shared server being down only costs its hits.
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        stale: float,
+        maxsize: int,
+        shared: Optional[RespClient] = None,
+    ):
+        self.ttls = ttls
+        self.stale = stale
+        self.shared = shared
+        # how long pages and invalidations are kept
+        self.lifetime = max(ttls.values(), default=0) + stale
+        self._pages = TTLCache(maxsize=maxsize, ttl=self.lifetime)
+        # scope -> time.time() of its last invalidation
+        self._invalidated = TTLCache(maxsize=maxsize * 100, ttl=self.lifetime)
+        self._filling: Dict[str, asyncio.Future] = {}
+
+    async def respond(
+        self,
+        request: Request,
+        route: str,
+        scopes: Sequence[str],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Response:
+        """The page of `request`, cached, or computed by `compute` and stored."""
+        ttl = self.ttls.get(route, 0)
+        if ttl <= 0:
+            return _response(render_json(await compute()), "OFF")
+        key = _key(request)
+        invalidated = await self._last_invalidated(scopes)
+        page = self._pages.get(key)
+        if (page is None or page[0] <= invalidated) and self.shared is not None:
+            page = await self._shared_page(key)
+            if page is not None:
+                self._pages.set(key, page, ttl=page[0] + ttl + self.stale - time.time())
+        age = time.time() - page[0] if page is not None else None
+        if age is None or page[0] <= invalidated or age >= ttl + self.stale:
+            return _response((await self._fill(key, ttl, compute))[1], "MISS")
+        if age >= ttl:
+            self._fill_soon(key, ttl, compute)
+            return _response(page[1], "STALE")
+        return _response(page[1], "HIT")
+
+    async def invalidate(self, *scopes: str):
+        """Drop the pages of `scopes` computed until now, in every process."""
+        now = time.time()
+        for scope in scopes:
+            self._invalidated.set(scope, now)
+            await self._shared(
+                "SET",
+                INVALIDATED_PREFIX + scope,
+                repr(now),
+                "PX",
+                int(self.lifetime * 1000),
+            )
+
+    async def close(self):
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def _last_invalidated(self, scopes: Sequence[str]) -> float:
+        last = max((self._invalidated.get(scope, 0) for scope in scopes), default=0)
+        if self.shared is not None and scopes:
+            values = await self._shared(
+                "MGET", *(INVALIDATED_PREFIX + scope for scope in scopes)
+            )
+            last = max([last] + [float(value) for value in values or () if value])
+        return last
+
+    async def _shared_page(self, key: str) -> Optional[Page]:
+        value = await self._shared("GET", PAGE_PREFIX + key)
+        if not value:
+            return None
+        started, body = value.split(b"\n", 1)
+        return float(started), body
+
+    def _fill_soon(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]):
+        if key not in self._filling:
+            self._start_fill(key, ttl, compute)
+
+    async def _fill(
+        self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]
+    ) -> Page:
+        future = self._filling.get(key) or self._start_fill(key, ttl, compute)
+        return await asyncio.shield(future)
+
+    def _start_fill(
+        self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        future = asyncio.ensure_future(self._compute(key, ttl, compute))
+        self._filling[key] = future
+        future.add_done_callback(lambda done: self._filled(key, done))
+        return future
+
+    def _filled(self, key: str, future: asyncio.Future):
+        self._filling.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            # e.g. a 404 once the video is gone: its stale page must go too
+            self._pages.delete(key)
+            if not future.cancelled() and not isinstance(
+                future.exception(), HTTPException
+            ):
+                logger.error(f"Computing {key} failed: {future.exception()!r}")
+
+    async def _compute(
+        self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]
+    ) -> Page:
+        page = (time.time(), render_json(await compute()))
+        self._pages.set(key, page, ttl=ttl + self.stale)
+        await self._shared(
+            "SET",
+            PAGE_PREFIX + key,
+            repr(page[0]).encode() + b"\n" + page[1],
+            "PX",
+            int((ttl + self.stale) * 1000),
+        )
+        return page
+
+    async def _shared(self, *args) -> Any:
+        if self.shared is None:
+            return None
+        try:
+            return await self.shared.execute(*args)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Shared response cache unavailable: {e!r}")
+        except RespError as e:
+            logger.warning(f"Shared response cache error: {e}")
+        return None
+
+
+def _key(request: Request) -> str:
+    return (
+        request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+    )
+
+
+def _response(body: bytes, state: str) -> Response:
+    return Response(body, media_type="application/json", headers={"X-Cache": state})
+
+
+response_cache = ResponseCache(
+    ttls=settings.RESPONSE_CACHE_TTLS,
+    stale=settings.RESPONSE_CACHE_STALE,
+    maxsize=settings.RESPONSE_CACHE_SIZE,
+    shared=RespClient(settings.RESPONSE_CACHE_URL)
+    if settings.RESPONSE_CACHE_URL
+    else None,
+)
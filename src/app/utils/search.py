@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from bisect import insort
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from tortoise import Tortoise
+from tortoise.query_utils import Q
+from tortoise.queryset import QuerySet
+
+from app.core.config import get_settings
+from app.models.user import User, UserModel
+from app.models.video import Tag, TagModel, Video, VideoModel
+from app.utils.paginator import load_items
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# The filters below compile to UPPER(CAST(col AS VARCHAR)) LIKE ..., which
+# PostgreSQL answers from trigram indexes over that same expression
+TRIGRAM_INDEXES = {
+    "idx_video_title_trgm": ("video", "title"),
+    "idx_tag_name_trgm": ("tag", "name"),
+    "idx_user_username_trgm": ("user", "username"),
+    "idx_user_full_name_trgm": ("user", "full_name"),
+}
+
+
+class SearchKind(str, Enum):
+    ALL = "all"
+    VIDEOS = "videos"
+    TAGS = "tags"
+    USERS = "users"
+
+
+async def create_search_indexes():
+    """Create the trigram indexes on PostgreSQL; other databases scan."""
+    connection = Tortoise.get_connection("default")
+    if connection.capabilities.dialect != "postgres":
+        return
+    try:
+        await connection.execute_script("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        for name, (table, column) in TRIGRAM_INDEXES.items():
+            await connection.execute_script(
+                f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+                f'USING gin ((UPPER(CAST("{column}" AS VARCHAR))) gin_trgm_ops);'
+            )
+    except Exception as e:
+        logger.warning(f"Search indexes not created, searches will scan: {e}")
+
+
+def relevance(text: Optional[str], query: str, words: List[str]) -> int:
+    """How well `text` matches: whole, prefix, word prefixes or substrings."""
+    text = (text or "").lower()
+    if text == query:
+        return 3
+    if text.startswith(query):
+        return 2
+    text_words = text.split()
+    if all(any(tw.startswith(w) for tw in text_words) for w in words):
+        return 1
+    return 0
+
+
+async def candidates(
+    matches: QuerySet, fields: List[str], query: str, order: str
+) -> list:
+    """
+    The `matches` worth ranking: those with one of `fields` equal to `query`,
+    then starting with it, then the rest, each read by `order` up to
+    SEARCH_CANDIDATES. Whole and prefix matches are never crowded out by
+    more viewed substring matches.
+    """
+    found = {}
+    for lookup in ("iexact", "istartswith", None):
+        narrowed = matches
+        if lookup:
+            narrowed = matches.filter(
+                Q(
+                    *(Q(**{f"{field}__{lookup}": query}) for field in fields),
+                    join_type=Q.OR,
+                )
+            )
+        for item in await narrowed.order_by(order).limit(settings.SEARCH_CANDIDATES):
+            found.setdefault(item.pk, item)
+    return list(found.values())
+
+
+async def search(
+    query: str, kind: SearchKind = SearchKind.ALL, limit: int = 20
+) -> Dict[str, list]:
+    """
+    Videos, tags and users matching `query`, best first.
+
+    Each word of the query has to occur in the title, tag or name. The
+    `candidates` are ranked by `relevance`, then by views.
+    """
+    query = " ".join(query.lower().split())
+    words = query.split()[: settings.SEARCH_MAX_WORDS]
+    results = {"videos": [], "tags": [], "users": []}
+    if not words:
+        return results
+
+    if kind in (SearchKind.ALL, SearchKind.VIDEOS):
+        videos = Video.filter(loading_status=Video.LoadingStatus.SUCCESS)
+        for word in words:
+            videos = videos.filter(title__icontains=word)
+        found = await candidates(videos, ["title"], query, "-views")
+        found.sort(key=lambda video: -relevance(video.title, query, words))
+        results["videos"] = await load_items(
+            VideoModel, [video.id for video in found[:limit]]
+        )
+
+    if kind in (SearchKind.ALL, SearchKind.TAGS):
+        tags = Tag.all()
+        for word in words:
+            tags = tags.filter(name__icontains=word)
+        found = await candidates(tags, ["name"], query, "-views")
+        found.sort(key=lambda tag: -relevance(tag.name, query, words))
+        results["tags"] = await load_items(TagModel, [tag.id for tag in found[:limit]])
+
+    if kind in (SearchKind.ALL, SearchKind.USERS):
+        users = User.filter(is_active=True)
+        for word in words:
+            users = users.filter(
+                Q(username__icontains=word) | Q(full_name__icontains=word)
+            )
+        found = await candidates(users, ["username", "full_name"], query, "username")
+        found.sort(
+            key=lambda user: -max(
+                relevance(user.username, query, words),
+                relevance(user.full_name, query, words),
+            )
+        )
+        results["users"] = await load_items(
+            UserModel, [user.id for user in found[:limit]]
+        )
+    return results
+
+
+class Trie:
+    """
+    Prefix tree of terms, each node keeping its `top` best completions.
+
+    Lookups walk at most `depth` characters and return the precomputed
+    list, so they don't depend on how many terms share the prefix. Memory
+    is bounded by `max_terms` * `depth` nodes; terms past `max_terms` are
+    not added.
+    """
+
+    def __init__(self, max_terms: int, depth: int, top: int):
+        self.max_terms = max_terms
+        self.depth = depth
+        self.top = top
+        self.terms: Dict[str, float] = {}
+        self._root = self._node()
+
+    @staticmethod
+    def _node() -> list:
+        # [children, completions as (-weight, term) best first]
+        return [{}, []]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def insert(self, term: str, weight: float = 0):
+        if term in self.terms or len(self.terms) >= self.max_terms:
+            return
+        self.terms[term] = weight
+        node = self._root
+        for char in term.lower()[: self.depth]:
+            node = node[0].setdefault(char, self._node())
+            completions = node[1]
+            if len(completions) < self.top or (-weight, term) < completions[-1]:
+                insort(completions, (-weight, term))
+                del completions[self.top :]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        prefix = prefix.lower()
+        node = self._root
+        for char in prefix[: self.depth]:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        terms = [term for _, term in node[1]]
+        if len(prefix) > self.depth:
+            terms = [term for term in terms if term.lower().startswith(prefix)]
+        return terms[:limit]
+
+
+class Autocomplete:
+    """
+    Typeahead over tag names, by views, and usernames. The tries are
+    rebuilt from the database every SEARCH_TRIE_REFRESH seconds; tags and
+    users created in this process are added right away.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.tags = self._trie()
+        self.users = self._trie()
+        self._built: Optional[float] = None
+        self._building: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def _trie() -> Trie:
+        return Trie(
+            max_terms=settings.SEARCH_TRIE_SIZE,
+            depth=settings.SEARCH_TRIE_DEPTH,
+            top=settings.SEARCH_TRIE_TOP,
+        )
+
+    async def suggest(self, prefix: str, limit: int) -> Tuple[List[str], List[str]]:
+        if (
+            self._built is None
+            or time.monotonic() - self._built >= self.refresh_interval
+        ):
+            if self._building is None:
+                self._building = asyncio.ensure_future(self.rebuild())
+                self._building.add_done_callback(self._rebuilt)
+            if self._built is None:
+                # stale suggestions beat waiting, an empty trie doesn't
+                await asyncio.shield(self._building)
+        prefix = prefix.strip()
+        return self.tags.complete(prefix, limit), self.users.complete(prefix, limit)
+
+    def _rebuilt(self, future: asyncio.Future):
+        self._building = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Rebuilding autocomplete failed: {future.exception()}")
+
+    async def rebuild(self):
+        tags, users = self._trie(), self._trie()
+        for name, views in (
+            await Tag.all()
+            .order_by("-views")
+            .limit(settings.SEARCH_TRIE_SIZE)
+            .values_list("name", "views")
+        ):
+            tags.insert(name, views)
+        for username in (
+            await User.filter(is_active=True)
+            .order_by("-id")
+            .limit(settings.SEARCH_TRIE_SIZE)
+            .values_list("username", flat=True)
+        ):
+            users.insert(username)
+        self.tags, self.users = tags, users
+        self._built = time.monotonic()
+        logger.debug(f"Autocomplete built: {len(tags)} tags, {len(users)} users")
+
+
+autocomplete = Autocomplete(refresh_interval=settings.SEARCH_TRIE_REFRESH)
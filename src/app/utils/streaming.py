@@ -0,0 +1,268 @@
+import os
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import aiofiles
+from fastapi import Header, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# (start, end) byte offsets, both inclusive as in the Range header
+ByteRange = Tuple[int, int]
+RangeStreamer = Callable[[int, int], AsyncIterator[bytes]]
+
+
+class MediaRequestHeaders:
+    """Request headers deciding between a full, partial or 304 media response."""
+
+    def __init__(
+        self,
+        range_header: Optional[str] = Header(None, alias="Range"),
+        if_range: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+    ):
+        self.range = range_header
+        self.if_range = if_range
+        self.if_none_match = if_none_match
+        self.if_modified_since = if_modified_since
+
+
+def validator_headers(
+    etag: str, last_modified: datetime, cache_control: str
+) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified.timestamp(), usegmt=True),
+        "Cache-Control": cache_control,
+    }
+
+
+def is_not_modified(
+    request: MediaRequestHeaders, etag: str, last_modified: datetime
+) -> bool:
+    """
+    Whether the client's copy is still current, so a 304 can be sent.
+
+    If-None-Match takes precedence over If-Modified-Since (RFC 7232 6).
+    """
+    if request.if_none_match:
+        tags = [tag.strip() for tag in request.if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if request.if_modified_since:
+        try:
+            since = parsedate_to_datetime(request.if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return int(last_modified.timestamp()) <= since.timestamp()
+    return False
+
+
+def conditional_response(
+    request: MediaRequestHeaders,
+    streamer: "RangeStreamer",
+    size: int,
+    etag: str,
+    last_modified: datetime,
+    media_type: str = "video/mp4",
+    cache_control: Optional[str] = None,
+) -> Response:
+    """
+    A 304 when the client's copy is current, otherwise `ranged_response`
+    with the validators attached so the response can be revalidated later.
+    """
+    headers = validator_headers(
+        etag,
+        last_modified,
+        cache_control or f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+    )
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.range
+    # a range against another version of the file would mix up two versions
+    if request.if_range and request.if_range not in (etag, headers["Last-Modified"]):
+        range_header = None
+    return ranged_response(streamer, size, range_header, media_type, headers)
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> List[ByteRange]:
+    """
+    Parse a `Range: bytes=...` header against a resource of `size` bytes.
+
+    Returns an empty list when the whole resource has to be served (no header,
+    unsupported unit, malformed or too many ranges), otherwise a sorted list of
+    non-overlapping ranges. Raises 416 when no range is satisfiable.
+    """
+    if not range_header or size <= 0:
+        return []
+
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return []
+
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return []
+        try:
+            if first == "":
+                # suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+        except ValueError:
+            return []
+        if start >= size:
+            continue
+        if end < start:
+            return []
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if len(ranges) > settings.STREAM_MAX_RANGES:
+        return []
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def ranged_response(
+    streamer: RangeStreamer,
+    size: int,
+    range_header: Optional[str],
+    media_type: str = "video/mp4",
+    headers: Optional[Dict[str, str]] = None,
+) -> StreamingResponse:
+    """
+    Build a 200 or 206 response for `Range` requests.
+
+    `streamer(start, end)` must yield the bytes of the inclusive range
+    `start..end`; only the requested bytes are ever read from the storage.
+    """
+    ranges = parse_range_header(range_header, size)
+    headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        body = streamer(0, size - 1) if size else _empty()
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            streamer(start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    boundary = uuid4().hex
+    part_headers = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    content_length = sum(
+        len(head) + (end - start + 1)
+        for head, (start, end) in zip(part_headers, ranges)
+    )
+    # every part but the first is preceded by a CRLF
+    content_length += 2 * (len(ranges) - 1) + len(closing)
+    headers["Content-Length"] = str(content_length)
+
+    async def multipart_body():
+        for i, (head, (start, end)) in enumerate(zip(part_headers, ranges)):
+            if i:
+                yield b"\r\n"
+            yield head
+            async for chunk in streamer(start, end):
+                yield chunk
+        yield closing
+
+    return StreamingResponse(
+        multipart_body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
+
+
+async def _empty():
+    return
+    yield
+
+
+async def file_streamer(path: str, start: int = 0, end: Optional[int] = None):
+    async with aiofiles.open(path, mode="rb") as f:
+        async for chunk in read_range(f, start, end):
+            yield chunk
+
+
+async def read_range(f, start: int = 0, end: Optional[int] = None):
+    """Yield the bytes `start..end` of the open aiofiles file `f`."""
+    await f.seek(start)
+    remaining = None if end is None else end - start + 1
+    while remaining is None or remaining > 0:
+        size = settings.STREAM_CHUNK_SIZE
+        if remaining is not None:
+            size = min(size, remaining)
+        chunk = await f.read(size)
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+class MediaFiles(StaticFiles):
+    """
+    `StaticFiles` for MEDIA_ROOT with our caching policy: encoded media is
+    immutable. Uploads in progress under `tmp/` and the S3 disk cache under
+    `cache/` live in MEDIA_ROOT too but are not served.
+    """
+
+    private_dirs = ("tmp", "cache")
+
+    async def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        if path.split(os.sep, 1)[0] in self.private_dirs:
+            return "", None
+        return await super().lookup_path(path)
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers[
+            "Cache-Control"
+        ] = f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable"
+        return response
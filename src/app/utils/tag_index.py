@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tortoise.timezone import now
+
+from app.core.config import get_settings
+from app.models.video import EncodingJob, Video, VideoModel
+from app.utils.cache import TTLCache
+from app.utils.counts import CountStrategy
+from app.utils.paginator import (
+    NEXT,
+    PREVIOUS,
+    CursorPage,
+    CursorParams,
+    cursor_page,
+    decode_cursor,
+    encode_cursor,
+    load_items,
+)
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# (created, id) of a video: the order of the feeds
+Key = Tuple[datetime, str]
+
+
+class TagMatch(str, Enum):
+    ALL = "all"
+    ANY = "any"
+
+
+class TagIndex:
+    """
+    In-memory inverted index from tag name to the SUCCESS videos carrying it.
+
+    Videos are numbered in the order they are indexed and each tag keeps a
+    sorted array of those numbers, so AND and OR queries are merges of
+    integer arrays; the result is then ordered like the feeds by
+    `(created, id)`. Videos tagged or deleted in this process are applied
+    right away. Those finished by the encoding worker are picked up every
+    TAG_INDEX_REFRESH seconds from the finished jobs, and the whole index
+    is rebuilt every TAG_INDEX_REBUILD seconds to catch the rest (videos
+    deleted by other processes are left out of pages meanwhile).
+    """
+
+    def __init__(self, refresh_interval: float, rebuild_interval: float):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._numbers: Dict[str, int] = {}
+        self._keys: List[Key] = []
+        self._postings: Dict[str, array] = {}
+        self._deleted: Set[int] = set()
+        self._results = TTLCache(
+            maxsize=settings.TAG_QUERY_CACHE_SIZE, ttl=rebuild_interval
+        )
+        # bumped on every change, which orphans the cached results
+        self._generation = 0
+        self._built: Optional[float] = None
+        self._refreshed = 0.0
+        # jobs finished after this were not looked at yet
+        self._synced: Optional[datetime] = None
+        self._updating: Optional[asyncio.Future] = None
+
+    def add(self, video_id, created: datetime, tags: Iterable[str]):
+        """Index a SUCCESS video, or more tags of an indexed one."""
+        video_id = str(video_id)
+        number = self._numbers.get(video_id)
+        if number is None:
+            number = len(self._keys)
+            self._numbers[video_id] = number
+            self._keys.append((created, video_id))
+        for tag in tags:
+            postings = self._postings.setdefault(tag, array("L"))
+            # new videos get the highest number, so this is usually an append
+            position = bisect_left(postings, number)
+            if position == len(postings) or postings[position] != number:
+                postings.insert(position, number)
+        self._generation += 1
+
+    def discard(self, video_id):
+        number = self._numbers.pop(str(video_id), None)
+        if number is not None:
+            self._deleted.add(number)
+            self._generation += 1
+
+    def match(self, tags: List[str], mode: TagMatch) -> List[Key]:
+        """Keys of the videos with all or any of `tags`, oldest first."""
+        cache_key = (self._generation, tuple(sorted(tags)), mode)
+        result = self._results.get(cache_key)
+        if result is not None:
+            return result
+        postings = sorted(
+            (self._postings.get(tag, array("L")) for tag in set(tags)), key=len
+        )
+        if mode == TagMatch.ALL:
+            numbers = _intersect(postings)
+        else:
+            numbers = set().union(*postings)
+        result = sorted(
+            self._keys[number] for number in numbers if number not in self._deleted
+        )
+        self._results.set(cache_key, result)
+        return result
+
+    async def ensure_fresh(self):
+        """Rebuild or catch up when due; concurrent callers share the work."""
+        clock = time.monotonic()
+        if self._built is not None and clock - self._refreshed < self.refresh_interval:
+            return
+        if self._updating is None:
+            self._updating = asyncio.ensure_future(self._update())
+            self._updating.add_done_callback(self._updated)
+        await asyncio.shield(self._updating)
+
+    def _updated(self, _):
+        self._updating = None
+
+    async def _update(self):
+        clock = time.monotonic()
+        if self._built is None or clock - self._built >= self.rebuild_interval:
+            await self.rebuild()
+        else:
+            await self._catch_up()
+        self._refreshed = clock
+
+    async def rebuild(self):
+        synced = now()
+        rows = (
+            await Video.filter(loading_status=Video.LoadingStatus.SUCCESS)
+            .order_by("created", "id")
+            .values_list("id", "created", "tags__name")
+        )
+        self._numbers, self._keys, self._postings = {}, [], {}
+        self._deleted = set()
+        for video_id, created, tag in rows:
+            if tag is not None:
+                self.add(video_id, created, [tag])
+        self._built = time.monotonic()
+        self._synced = synced
+        logger.debug(
+            f"Tag index built: {len(self._keys)} videos, {len(self._postings)} tags"
+        )
+
+    async def _catch_up(self):
+        synced = now()
+        # leeway for jobs committed while the previous catch-up ran
+        since = self._synced - timedelta(seconds=self.refresh_interval)
+        video_ids = await EncodingJob.filter(
+            kind=EncodingJob.Kind.MP4,
+            status=EncodingJob.Status.DONE,
+            finished__gte=since,
+        ).values_list("video_id", flat=True)
+        new = [id_ for id_ in video_ids if str(id_) not in self._numbers]
+        if new:
+            rows = (
+                await Video.filter(
+                    id__in=new, loading_status=Video.LoadingStatus.SUCCESS
+                )
+                .order_by("created", "id")
+                .values_list("id", "created", "tags__name")
+            )
+            for video_id, created, tag in rows:
+                if tag is not None:
+                    self.add(video_id, created, [tag])
+        self._synced = synced
+
+
+def _intersect(postings: List[array]) -> List[int]:
+    """Numbers in all of the sorted `postings`, the shortest first."""
+    if not postings:
+        return []
+    result = list(postings[0])
+    for other in postings[1:]:
+        if not result:
+            break
+        kept = []
+        low = 0
+        for number in result:
+            low = bisect_left(other, number, low)
+            if low == len(other):
+                break
+            if other[low] == number:
+                kept.append(number)
+        result = kept
+    return result
+
+
+tag_index = TagIndex(
+    refresh_interval=settings.TAG_INDEX_REFRESH,
+    rebuild_interval=settings.TAG_INDEX_REBUILD,
+)
+
+
+async def tagged_page(
+    tags: List[str], mode: TagMatch, params: CursorParams
+) -> CursorPage:
+    """A page of the SUCCESS videos with all or any of `tags`, newest first."""
+    await tag_index.ensure_fresh()
+    keys = tag_index.match(tags, mode)
+    end = len(keys)
+    if params.cursor:
+        direction, created, id_ = decode_cursor(params.cursor)
+        if direction == NEXT:
+            end = bisect_left(keys, (created, str(id_)))
+        else:
+            start = bisect_right(keys, (created, str(id_)))
+            end = min(start + params.size, len(keys))
+    start = max(end - params.size, 0)
+    page_keys = keys[start:end][::-1]
+
+    page = cursor_page(
+        VideoModel,
+        await load_items(VideoModel, [id_ for _, id_ in page_keys]),
+        params.size,
+    )
+    if params.include_total:
+        page.total, page.total_strategy = len(keys), CountStrategy.EXACT
+    if page_keys and start > 0:
+        page.next = encode_cursor(NEXT, *page_keys[-1])
+    if page_keys and end < len(keys):
+        page.previous = encode_cursor(PREVIOUS, *page_keys[0])
+    return page
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import math
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
+
+from app.core.config import get_settings
+from app.models.video import Video, VideoModel
+from app.utils.cache import TTLCache
+from app.utils.paginator import (
+    NEXT,
+    PREVIOUS,
+    CursorPage,
+    CursorParams,
+    cursor_page,
+    decode_cursor,
+    encode_cursor,
+    load_items,
+)
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+# scores count the age from here instead of from now, so they never decay
+EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def score(views: int, likes: int, dislikes: int, created: datetime) -> float:
+    """
+    Trending score of a video.
+
+    Ranks like the engagement halved every TRENDING_HALF_LIFE seconds of
+    age, but in log2 and counted from EPOCH: a video posted one half-life
+    later scores one more for the same engagement. The order doesn't change
+    as time passes, so only videos whose engagement changed need rescoring.
+    """
+    engagement = (
+        views * settings.TRENDING_VIEW_WEIGHT
+        + likes * settings.TRENDING_LIKE_WEIGHT
+        - dislikes * settings.TRENDING_DISLIKE_WEIGHT
+    )
+    age = (created - EPOCH).total_seconds() / settings.TRENDING_HALF_LIFE
+    return math.log2(max(engagement, 1)) + age
+
+
+async def refresh_scores() -> int:
+    """
+    Rescore the videos of the last TRENDING_WINDOW seconds and store the
+    scores that changed; returns how many. Older videos keep their last
+    score, they have decayed out of the top by then.
+    """
+    since = now() - timedelta(seconds=settings.TRENDING_WINDOW)
+    rows = await Video.filter(
+        loading_status=Video.LoadingStatus.SUCCESS, created__gte=since
+    ).values("id", "views", "likes", "dislikes", "created", "score")
+    changed = []
+    for row in rows:
+        new = score(row["views"], row["likes"], row["dislikes"], row["created"])
+        if row["score"] is None or not math.isclose(row["score"], new):
+            changed.append((row["id"], new))
+    async with in_transaction() as conn:
+        for id_, new in changed:
+            await Video.filter(id=id_).using_db(conn).update(score=new)
+    logger.debug(f"Rescored {len(changed)} of {len(rows)} recent videos")
+    return len(changed)
+
+
+class Ranking:
+    """The top videos of a trending slice, best first, kept in memory."""
+
+    def __init__(self, rows: List[Tuple[float, str]]):
+        # ascending (-score, id) so pages are found by bisection
+        self.keys = sorted((-score, str(id_)) for score, id_ in rows)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def page(self, cursor: Optional[str], size: int) -> Tuple[int, list]:
+        """Start and keys of the page of `size` after (or before) `cursor`."""
+        if not cursor:
+            return 0, self.keys[:size]
+        direction, score_, id_ = decode_cursor(cursor, float)
+        if direction == NEXT:
+            start = bisect_right(self.keys, (-score_, str(id_)))
+            return start, self.keys[start : start + size]
+        end = bisect_left(self.keys, (-score_, str(id_)))
+        start = max(end - size, 0)
+        return start, self.keys[start:end]
+
+
+_rankings = TTLCache(maxsize=settings.TRENDING_SLICES, ttl=settings.TRENDING_INTERVAL)
+_loading: Dict[Hashable, asyncio.Future] = {}
+
+
+async def get_ranking(
+    tag: Optional[str] = None, category: Optional[int] = None
+) -> Ranking:
+    """
+    The ranking of all videos, of a tag or of a category. Loaded from the
+    stored scores at most every TRENDING_INTERVAL seconds, concurrent
+    requests sharing the load.
+    """
+    key = (tag, category)
+    ranking = _rankings.get(key)
+    if ranking is not None:
+        return ranking
+    loading = _loading.get(key)
+    if loading is None:
+        loading = asyncio.ensure_future(_load_ranking(key, tag, category))
+        _loading[key] = loading
+        loading.add_done_callback(lambda _: _loading.pop(key, None))
+    return await asyncio.shield(loading)
+
+
+async def _load_ranking(
+    key: Hashable, tag: Optional[str], category: Optional[int]
+) -> Ranking:
+    query = Video.filter(
+        loading_status=Video.LoadingStatus.SUCCESS, score__isnull=False
+    )
+    if tag is not None:
+        query = query.filter(tags__name=tag)
+    if category is not None:
+        query = query.filter(category_id=category)
+    rows = (
+        await query.order_by("-score", "id")
+        .limit(settings.TRENDING_SIZE)
+        .values_list("score", "id")
+    )
+    ranking = Ranking(rows)
+    _rankings.set(key, ranking)
+    return ranking
+
+
+async def trending_page(
+    params: CursorParams, tag: Optional[str] = None, category: Optional[int] = None
+) -> CursorPage:
+    """A page of the trending videos; only the top TRENDING_SIZE are ranked."""
+    ranking = await get_ranking(tag, category)
+    start, keys = ranking.page(params.cursor, params.size)
+    page = cursor_page(
+        VideoModel,
+        await load_items(VideoModel, [id_ for _, id_ in keys]),
+        params.size,
+    )
+    if keys and start + len(keys) < len(ranking):
+        page.next = encode_cursor(NEXT, -keys[-1][0], keys[-1][1])
+    if keys and start > 0:
+        page.previous = encode_cursor(PREVIOUS, -keys[0][0], keys[0][1])
+    return page
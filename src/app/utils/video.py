@@ -1,16 +1,41 @@
 import logging
 import os
-from uuid import uuid4
+import shutil
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from uuid import UUID, uuid4
 
-import aioboto3
 import aiofiles
 import filetype
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile, status
+from pypika import Table
+from starlette.requests import ClientDisconnect
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import IntegrityError
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
 
 from app.core.config import Storages
 from app.core.config import get_settings
-from app.helpers.media import get_file_size, encode_file
-from app.models.video import Video
+from app.core.storage import StorageBackend, get_storage
+from app.helpers.media import get_file_size, encode_file, encode_hls, probe_file
+from app.models.user import User
+from app.models.video import Category, EncodingJob, Tag, UploadSession, Video
+from app.schemas import VideoImport
+from app.utils.counts import invalidate_counts
+from app.utils.search import autocomplete
+from app.utils.tag_index import tag_index
 
 settings = get_settings()
 
@@ -18,32 +43,23 @@ logger = logging.getLogger(__name__)
 logger.setLevel(settings.LOG_LEVEL)
 
 
-async def video_streamer(path: str):
-    if settings.STORAGE == Storages.AWS_S3:
-        chunk_size = 69 * 1024
-        async with aioboto3.client(
-            service_name="s3",
-            endpoint_url=settings.STORAGE_ENDPOINT_URL,
-        ) as s3:
-            logger.debug(f"Serving {settings.BUCKET_NAME} {path}")
-            s3_ob = await s3.get_object(Bucket=settings.BUCKET_NAME, Key=path)
-            async with s3_ob["Body"] as stream:
-                while True:
-                    chunk = await stream.read(chunk_size)
-                    if not chunk:
-                        break
-                    yield chunk
+PROBED_FIELDS = ("duration", "width", "height", "video_codec", "audio_codec", "bitrate")
+TAG_NAME_LENGTH = Tag._meta.fields_map["name"].max_length
 
-    elif settings.STORAGE == Storages.LOCAL:
-        async with aiofiles.open(path, mode="rb") as f:
-            lines = await f.readlines()
-            for line in lines:
-                yield line
 
+class UploadSizeExceeded(Exception):
+    pass
 
-def _generate_filename(file: UploadFile):
-    content_type = filetype.get_type(file.content_type)
-    return f"{uuid4().hex}.{content_type.EXTENSION}"
+
+def _generate_filename(content_type: str):
+    kind = filetype.get_type(content_type)
+    return f"{uuid4().hex}.{kind.EXTENSION}"
+
+
+def _tmp_root() -> str:
+    tmp_file_root = os.path.join(settings.MEDIA_ROOT, "tmp")
+    os.makedirs(tmp_file_root, exist_ok=True)
+    return tmp_file_root
 
 
 def remove_video(file_path: str):
@@ -51,76 +67,350 @@ def remove_video(file_path: str):
     logger.debug(f"Tmp file {file_path} - removed")
 
 
-async def write_video(video_obj: Video, upload_to: str, file: UploadFile):
-    filename = _generate_filename(file)
-    tmp_file_root = os.path.join(settings.MEDIA_ROOT, "tmp")
-    tmp_file = os.path.join(tmp_file_root, filename)
-    final_file_root = os.path.join(settings.MEDIA_ROOT, upload_to)
-    final_file_path = os.path.join(final_file_root, filename)
+def parse_tags(tags: Union[str, Iterable[str]]) -> List[str]:
+    """
+    Tag names from a comma separated string or a list: trimmed, lower case,
+    inner whitespace collapsed, without a leading "#" and duplicates.
+    Raises a 400 for more than TAGS_MAX_PER_VIDEO tags.
+    """
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    names = []
+    for tag in tags:
+        name = " ".join(tag.lower().split()).lstrip("# ")[:TAG_NAME_LENGTH].rstrip()
+        if name and name not in names:
+            names.append(name)
+    if len(names) > settings.TAGS_MAX_PER_VIDEO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.TAGS_MAX_PER_VIDEO} tags per video",
+        )
+    return names
+
+
+async def upsert_tags(
+    names: Iterable[str], using_db: Optional[BaseDBAsyncClient] = None
+) -> Dict[str, int]:
+    """Ids of the tags `names`, creating the missing ones in one INSERT."""
+    names = set(names)
+    if not names:
+        return {}
+    existing = (
+        await Tag.filter(name__in=names).using_db(using_db).values_list("name", "id")
+    )
+    ids = dict(existing)
+    missing = names - ids.keys()
+    if missing:
+        await Tag.bulk_create([Tag(name=name) for name in missing], using_db=using_db)
+        created = (
+            await Tag.filter(name__in=missing)
+            .using_db(using_db)
+            .values_list("name", "id")
+        )
+        ids.update(created)
+        for name in missing:
+            autocomplete.tags.insert(name)
+    return ids
+
+
+async def link_tags(
+    pairs: Iterable[Tuple[Any, int]], using_db: Optional[BaseDBAsyncClient] = None
+):
+    """
+    Tag new videos in one INSERT, `pairs` being (video id, tag id).
+
+    Unlike `video.tags.add` this doesn't look for existing links first, so
+    the videos must not have these tags yet.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    field = Video._meta.fields_map["tags"]
+    db = using_db or Video._meta.db
+    table = Table(field.through)
+    query = db.query_class.into(table).columns(
+        table[field.backward_key], table[field.forward_key]
+    )
+    for video_id, tag_id in pairs:
+        query = query.insert(str(video_id), tag_id)
+    await db.execute_query(str(query))
+
+
+async def add_tags(
+    video_obj: Video, names: List[str], using_db: Optional[BaseDBAsyncClient] = None
+):
+    """Tag a new video with the already parsed `names`."""
+    ids = await upsert_tags(names, using_db)
+    await link_tags([(video_obj.id, ids[name]) for name in names], using_db)
 
-    if not os.path.exists(settings.MEDIA_ROOT):
-        os.makedirs(settings.MEDIA_ROOT)
 
-    if not os.path.exists(tmp_file_root):
-        os.makedirs(tmp_file_root)
+async def create_video_with_tags(tags: List[str], **fields) -> Video:
+    """Create a video and its tags in one transaction."""
 
-    if not os.path.exists(final_file_root):
-        os.makedirs(final_file_root)
+    async def create():
+        async with in_transaction() as conn:
+            video_obj = await Video.create(using_db=conn, **fields)
+            await add_tags(video_obj, tags, conn)
+        return video_obj
+
+    return await _retry_tag_conflict(create)
+
+
+async def import_videos(items: List[VideoImport]) -> List[UUID]:
+    """
+    Create SUCCESS videos for media already in storage, with their tags, in
+    one transaction: one INSERT for the videos, one for the new tags and one
+    for the links. Raises a 400 for unknown users or categories.
+    """
+    for model, ids in (
+        (User, {item.user_id for item in items}),
+        (Category, {item.category_id for item in items} - {None}),
+    ):
+        found = set(await model.filter(id__in=ids).values_list("id", flat=True))
+        if ids - found:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown {model.__name__.lower()} ids: {sorted(ids - found)}",
+            )
+
+    names = [parse_tags(item.tags) for item in items]
+    videos = [
+        Video(
+            loading_status=Video.LoadingStatus.SUCCESS,
+            storage=settings.STORAGE if item.storage is None else item.storage,
+            **item.dict(exclude={"tags", "storage"}, exclude_none=True),
+        )
+        for item in items
+    ]
+
+    async def create():
+        async with in_transaction() as conn:
+            await Video.bulk_create(videos, using_db=conn)
+            tag_ids = await upsert_tags(
+                {n for video_names in names for n in video_names}, conn
+            )
+            await link_tags(
+                [
+                    (video.id, tag_ids[name])
+                    for video, video_names in zip(videos, names)
+                    for name in video_names
+                ],
+                conn,
+            )
+
+    await _retry_tag_conflict(create)
+    # bulk inserts fire no signals
+    invalidate_counts(Video)
+    for video, video_names in zip(videos, names):
+        tag_index.add(video.id, video.created, video_names)
+    logger.info(f"Imported {len(videos)} videos")
+    return [video.id for video in videos]
+
+
+async def _retry_tag_conflict(create: Callable[[], Awaitable[Any]]) -> Any:
+    # a tag created by a concurrent request makes the insert fail, once
+    try:
+        return await create()
+    except IntegrityError:
+        logger.debug("Tags were created concurrently, retrying")
+        return await create()
+
+
+async def save_upload(file: UploadFile, path: str):
+    """Copy an upload to `path` in bounded chunks instead of reading it whole."""
+    async with aiofiles.open(path, mode="wb") as f:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await f.write(chunk)
+
+
+async def write_video(video_obj: Video, upload_to: str, file: UploadFile):
+    filename = _generate_filename(file.content_type)
+    tmp_file = os.path.join(_tmp_root(), filename)
 
     try:
         logger.debug(f" Start saving file: {filename}")
-        async with aiofiles.open(tmp_file, mode="wb") as f:
-            data = await file.read()
-            await f.write(data)
+        await save_upload(file, tmp_file)
     except OSError as e:
         logger.error(str(e))
         video_obj.loading_status = Video.LoadingStatus.FAIL
         await video_obj.save()
+        return
 
     logger.debug(f"File {filename} - saved")
+    await enqueue_encoding(video_obj, upload_to, tmp_file, filename)
+
+
+def upload_session_path(session: UploadSession) -> str:
+    return os.path.join(_tmp_root(), f"{session.id.hex}.part")
+
+
+async def write_upload_chunk(
+    session: UploadSession, offset: int, stream: AsyncIterator[bytes]
+) -> int:
+    """
+    Write a request body to the session file starting at `offset`.
+
+    Bytes are committed to `session.offset` even when the client disconnects
+    midway, so the upload can be resumed from the last byte that reached disk.
+    Returns the number of bytes written.
+    """
+    written = 0
+    try:
+        async with aiofiles.open(upload_session_path(session), mode="r+b") as f:
+            await f.seek(offset)
+            async for chunk in stream:
+                if offset + written + len(chunk) > session.size:
+                    raise UploadSizeExceeded()
+                await f.write(chunk)
+                written += len(chunk)
+    except ClientDisconnect:
+        logger.debug(f"Upload {session.id} interrupted at {offset + written}")
+    finally:
+        expires = upload_session_expiry()
+        if written and await UploadSession.filter(id=session.id, offset=offset).update(
+            offset=offset + written, expires=expires
+        ):
+            session.offset = offset + written
+            session.expires = expires
+    return written
+
+
+def upload_session_expiry() -> datetime:
+    return now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+async def expire_upload_sessions() -> int:
+    """Remove unfinished upload sessions, their files and pending videos."""
+    sessions = await UploadSession.filter(completed__isnull=True, expires__lt=now())
+    for session in sessions:
+        path = upload_session_path(session)
+        if os.path.isfile(path):
+            remove_video(path)
+        await Video.filter(
+            id=session.video_id, loading_status=Video.LoadingStatus.PENDING
+        ).delete()
+        await UploadSession.filter(id=session.id).delete()
+    if sessions:
+        logger.info(f"Expired {len(sessions)} upload sessions")
+    return len(sessions)
+
+
+async def finish_upload(session: UploadSession, upload_to: str):
+    video_obj = await Video.get(id=session.video_id)
+    filename = _generate_filename(session.content_type)
+    tmp_file = os.path.join(_tmp_root(), filename)
+    os.rename(upload_session_path(session), tmp_file)
+    await enqueue_encoding(video_obj, upload_to, tmp_file, filename)
+
+
+async def enqueue_encoding(
+    video_obj: Video,
+    upload_to: str,
+    tmp_file: str,
+    filename: str,
+    kind: EncodingJob.Kind = EncodingJob.Kind.MP4,
+) -> EncodingJob:
+    job = await EncodingJob.create(
+        video=video_obj,
+        kind=kind,
+        input_path=tmp_file,
+        filename=filename,
+        upload_to=upload_to,
+    )
+    logger.debug(f"Encoding job {job.id} queued for video {video_obj.id}")
+    return job
+
+
+async def encode_video(
+    video_obj: Video, upload_to: str, tmp_file: str, filename: str
+) -> tuple:
+    """
+    Encode `tmp_file` and store the result; the input file is left in place.
+
+    Only marks the video as RUNNING and, on success, SUCCESS: failures are
+    reported to the caller, which decides whether the job is retried.
+    """
+    final_file_root = os.path.join(settings.MEDIA_ROOT, upload_to)
+    final_file_path = os.path.join(final_file_root, filename)
+    os.makedirs(final_file_root, exist_ok=True)
+
     video_obj.loading_status = Video.LoadingStatus.RUNNING
     await video_obj.save()
-    logger.debug(f"Start encoding file: {filename}")
-    status, detail = await encode_file(tmp_file, final_file_path)
+    source = await probe_file(tmp_file)
+    logger.debug(f"Start encoding file: {filename}, source {source}")
+    status, detail, remuxed = await encode_file(tmp_file, final_file_path, source)
 
     if not status:
         logger.error(f"Encoding file fail: {detail}")
-        video_obj.loading_status = Video.LoadingStatus.FAIL
-        await video_obj.save()
-    else:
-        logger.debug(f"Encoding file success")
-        logger.debug(f"Start upload file to aws")
-        file_size = await get_file_size(final_file_path)
-        video_obj.size = file_size
-        video_obj.loading_status = Video.LoadingStatus.SUCCESS
-
-        if settings.STORAGE == Storages.AWS_S3:
-            key = f"{upload_to}/{filename}"
-            aws_upload_status = await upload_to_aws(key, final_file_path)
-            if aws_upload_status:
-                video_obj.path = key
-                video_obj.storage = Storages.AWS_S3
-                remove_video(final_file_path)
-            else:
-                video_obj.path = final_file_path
-                video_obj.storage = Storages.LOCAL
-        await video_obj.save()
-    remove_video(tmp_file)
+        return False, detail
 
+    logger.debug(f"Encoding file success: {detail}")
+    output = source if remuxed else await probe_file(final_file_path)
+    for field in PROBED_FIELDS:
+        setattr(video_obj, field, output.get(field))
+    file_size = await get_file_size(final_file_path)
+    video_obj.size = file_size
+    video_obj.loading_status = Video.LoadingStatus.SUCCESS
 
-async def upload_to_aws(
-    filename: str,
-    staging_path: str,
-):
-    async with aioboto3.client(
-        service_name="s3",
-        endpoint_url=settings.STORAGE_ENDPOINT_URL,
-    ) as s3:
-        try:
-            async with aiofiles.open(staging_path, mode="rb") as file:
-                await s3.upload_fileobj(file, settings.BUCKET_NAME, filename)
-            logger.debug(f"Upload file to aws success")
-            return True
-        except Exception as e:
-            logger.error(f"Upload file to aws error, detail: {e}")
-            return False
+    key = f"{upload_to}/{filename}"
+    storage = get_storage()
+    try:
+        await storage.put(key, final_file_path)
+    except Exception as e:
+        logger.error(f"Storing {key} failed, serving the local copy: {e}")
+        storage = get_storage(Storages.LOCAL)
+    video_obj.path = key
+    video_obj.storage = storage.kind
+    if storage.kind != Storages.LOCAL:
+        remove_video(final_file_path)
+    await video_obj.save()
+    return True, "Success"
+
+
+async def encode_video_hls(video_obj: Video, tmp_file: str) -> tuple:
+    """
+    Package the adaptive bitrate ladder next to the already stored MP4.
+
+    Runs as its own job after the video is SUCCESS: a failed HLS encode
+    doesn't fail the video, it is only served as MP4. Partial output is
+    removed on failure, timeout or cancellation.
+    """
+    prefix = f"hls/{video_obj.id}"
+    output_dir = os.path.join(settings.MEDIA_ROOT, prefix)
+    keep_output = False
+    try:
+        logger.debug(f"Start HLS encoding: {prefix}")
+        status, detail = await encode_hls(
+            tmp_file, output_dir, await probe_file(tmp_file)
+        )
+        if not status:
+            logger.error(f"HLS encoding fail: {detail}")
+            return False, detail
+
+        storage = get_storage(video_obj.storage)
+        await put_dir(storage, prefix, output_dir)
+        keep_output = storage.kind == Storages.LOCAL
+        await Video.filter(id=video_obj.id).update(hls_path=prefix)
+        return True, "Success"
+    finally:
+        if not keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+async def put_dir(storage: StorageBackend, prefix: str, staging_dir: str):
+    for root, _, files in os.walk(staging_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            await storage.put(f"{prefix}/{os.path.relpath(path, staging_dir)}", path)
+
+
+async def remove_stored_video(video_obj: Video):
+    """Remove the stored MP4 and HLS files of a deleted video."""
+    storage = get_storage(video_obj.storage)
+    if video_obj.path:
+        await storage.delete(video_obj.path)
+    if video_obj.hls_path:
+        await storage.delete_prefix(video_obj.hls_path)
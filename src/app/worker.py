@@ -0,0 +1,87 @@
+"""
+Encoding worker: runs queued encoding jobs outside the API process.
+
+    python -m app.worker
+
+At most `JOB_CONCURRENCY` jobs run at once per worker; run more workers to
+scale encoding capacity independently of the API. Workers also rescore the
+trending videos every `TRENDING_INTERVAL` seconds.
+"""
+import asyncio
+import logging
+import signal
+
+from tortoise import Tortoise
+
+from app.core.config import Storages, get_settings
+from app.core.db import tortoise_orm
+from app.core.s3 import close_s3_client, open_s3_client
+from app.utils.jobs import claim_job, requeue_stale_jobs, run_job
+from app.utils.response_cache import response_cache
+from app.utils.trending import refresh_scores
+from app.utils.video import expire_upload_sessions
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.LOG_LEVEL)
+
+
+async def work(stop: asyncio.Event):
+    slots = asyncio.Semaphore(settings.JOB_CONCURRENCY)
+    running = set()
+    loop = asyncio.get_event_loop()
+    scored = None
+
+    while not stop.is_set():
+        await requeue_stale_jobs()
+        await expire_upload_sessions()
+        if scored is None or loop.time() - scored >= settings.TRENDING_INTERVAL:
+            scored = loop.time()
+            try:
+                await refresh_scores()
+            except Exception:
+                logger.exception("Rescoring trending videos failed")
+        while not stop.is_set():
+            await slots.acquire()
+            job = await claim_job()
+            if job is None:
+                slots.release()
+                break
+            logger.info(f"Encoding job {job.id} started, attempt {job.attempts}")
+            task = asyncio.ensure_future(run_job(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    if running:
+        logger.info(f"Waiting for {len(running)} running jobs")
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def main():
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    await Tortoise.init(config=tortoise_orm)
+    if settings.STORAGE == Storages.AWS_S3:
+        await open_s3_client()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Encoding worker started, concurrency {settings.JOB_CONCURRENCY}")
+    try:
+        await work(stop)
+    finally:
+        await close_s3_client()
+        await response_cache.close()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+import os
+
+os.environ.setdefault("POSTGRES_USER", "postgres")
+os.environ.setdefault("POSTGRES_PASSWORD", "postgres")
+os.environ.setdefault("POSTGRES_DB", "app")
+os.environ.setdefault("DATABASE_URI", "sqlite://:memory:")
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import asyncio
+import threading
+import time
+
+import pytest
+from tortoise import Tortoise
+
+from app.core import s3 as s3_module
+from app.core.config import get_settings
+from app.utils.paginator import CursorParams
+
+settings = get_settings()
+
+BUCKET = "test-bucket"
+MiB = 1024 * 1024
+
+
+@pytest.fixture(scope="session")
+def endpoint_url():
+    """A local S3-compatible stand-in (moto) on a free port."""
+    moto_server = pytest.importorskip("moto.server")
+    serving = pytest.importorskip("werkzeug.serving")
+    server = serving.make_server(
+        "127.0.0.1", 0, moto_server.create_backend_app("s3"), threaded=True
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def storage(endpoint_url, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_ENDPOINT_URL", endpoint_url)
+    monkeypatch.setattr(settings, "BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(settings, "S3_MULTIPART_THRESHOLD", 8 * MiB)
+    monkeypatch.setattr(settings, "S3_MULTIPART_CHUNK_SIZE", 5 * MiB)
+    monkeypatch.setattr(settings, "S3_MULTIPART_CONCURRENCY", 2)
+
+    async def create_bucket():
+        async with s3_module.s3_client() as s3:
+            await s3.create_bucket(Bucket=BUCKET)
+
+    asyncio.run(create_bucket())
+
+
+def write_random(path, size):
+    data = os.urandom(size)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def run_with_db(coro_fn):
+    """Run `coro_fn()` against a fresh in-memory database."""
+
+    async def run():
+        await Tortoise.init(
+            db_url="sqlite://:memory:", modules={"models": settings.MODELS}
+        )
+        await Tortoise.generate_schemas()
+        try:
+            return await coro_fn()
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(run())
+
+
+async def serve_resp():
+    """A Redis-protocol stand-in knowing GET, SET (with PX) and MGET."""
+    data = {}
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                count = int((await reader.readline())[1:])
+            except ValueError:
+                break
+            args = []
+            for _ in range(count):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2])
+            command = args[0].upper()
+            if command == b"SET":
+                data[args[1]] = (args[2], time.monotonic() + int(args[4]) / 1000)
+                writer.write(b"+OK\r\n")
+            else:
+                keys = args[1:]
+                values = []
+                for key in keys:
+                    value, expires = data.get(key, (None, 0))
+                    values.append(value if expires > time.monotonic() else None)
+                if command == b"MGET":
+                    writer.write(b"*%d\r\n" % len(values))
+                for value in values:
+                    if value is None:
+                        writer.write(b"$-1\r\n")
+                    else:
+                        writer.write(b"$%d\r\n%s\r\n" % (len(value), value))
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def params(cursor=None, size=50, include_total=False) -> CursorParams:
+    """`CursorParams` as the endpoints get them from the query string."""
+    return CursorParams(cursor=cursor, size=size, include_total=include_total)
@@ -0,0 +1,85 @@
+from app.models.comment import Comment, CommentModel
+from app.models.user import User
+from app.models.video import Video
+from app.utils.comments import add_comment, first_replies, remove_comments, with_replies
+from app.utils.paginator import paginate
+from tests.conftest import params, run_with_db
+
+
+def test_threads_carry_their_newest_replies():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        video = await Video.create(title="v", user=user)
+        first = await add_comment(user.id, video.id, "first")
+        second = await add_comment(user.id, video.id, "second")
+        for i in range(4):
+            await add_comment(user.id, video.id, f"re{i}", first.id)
+        await add_comment(user.id, video.id, "deep", (await Comment.get(text="re3")).id)
+
+        page = await paginate(
+            Comment.filter(video_id=video.id, reply_to_id__isnull=True),
+            params(),
+            CommentModel,
+        )
+        threads = await with_replies(page, 2)
+        rest = await paginate(
+            Comment.filter(reply_to_id=first.id),
+            params(threads.items[1]["replies_next"]),
+            CommentModel,
+        )
+        return threads, rest, await Video.get(id=video.id), second.id
+
+    threads, rest, video, second_id = run_with_db(run)
+    assert [thread["text"] for thread in threads.items] == ["second", "first"]
+    newest, first = threads.items
+    assert (newest["id"], newest["replies"], newest["replies_next"]) == (
+        second_id,
+        [],
+        None,
+    )
+    assert first["replies_count"] == 4
+    assert [reply["text"] for reply in first["replies"]] == ["re3", "re2"]
+    assert first["replies"][0]["replies_count"] == 1
+    assert [reply["text"] for reply in rest.items] == ["re1", "re0"]
+    assert video.comments_count == 7
+
+
+def test_first_replies_limits_each_parent():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        video = await Video.create(title="v", user=user)
+        parents = [await add_comment(user.id, video.id, f"p{i}") for i in range(3)]
+        for parent in parents[:2]:
+            for i in range(3):
+                await add_comment(user.id, video.id, f"{parent.text}r{i}", parent.id)
+        replies = await first_replies([parent.id for parent in parents], 2)
+        texts = dict(await Comment.all().values_list("id", "text"))
+        return parents, {
+            parent_id: [texts[row["id"]] for row in rows]
+            for parent_id, rows in replies.items()
+        }
+
+    parents, replies = run_with_db(run)
+    assert replies == {
+        parents[0].id: ["p0r2", "p0r1"],
+        parents[1].id: ["p1r2", "p1r1"],
+    }
+
+
+def test_removed_comments_are_uncounted_with_their_replies():
+    async def run():
+        author, gone = [
+            await User.create(username=name, email=f"{name}@b.co")
+            for name in ("a", "b")
+        ]
+        video = await Video.create(title="v", user=author)
+        kept = await add_comment(author.id, video.id, "kept")
+        reply = await add_comment(gone.id, video.id, "reply", kept.id)
+        await add_comment(author.id, video.id, "answer", reply.id)
+        await remove_comments(gone.id)
+        await User.filter(id=gone.id).delete()
+        return await Video.get(id=video.id), await Comment.get(id=kept.id)
+
+    video, kept = run_with_db(run)
+    assert video.comments_count == 1
+    assert kept.replies_count == 0
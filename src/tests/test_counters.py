@@ -0,0 +1,75 @@
+import asyncio
+
+from app.models.user import User
+from app.models.video import Tag, Video
+from app.utils.counters import CounterBuffer
+from tests.conftest import run_with_db
+
+
+async def make_videos(n):
+    user = await User.create(username="a", email="a@b.co")
+    return [await Video.create(title=str(i), user=user) for i in range(n)]
+
+
+def test_increments_are_written_in_one_update_per_delta():
+    async def run():
+        one, two, three = await make_videos(3)
+        tag = await Tag.create(name="cats")
+        buffer = CounterBuffer(flush_interval=60, max_pending=100)
+        for video in (one, two):
+            buffer.incr(Video, video.id, "views")
+        buffer.incr(Video, three.id, "views", 2)
+        buffer.incr(Video, three.id, "likes")
+        buffer.incr(Tag, tag.id, "views")
+        updates = await buffer.flush()
+        views = await Video.all().order_by("title").values_list("views", flat=True)
+        return updates, views, await Video.get(id=three.id), await Tag.get(id=tag.id)
+
+    updates, views, three, tag = run_with_db(run)
+    # views +1 on two videos, views +2, likes +1, tag views +1
+    assert updates == 4
+    assert views == [1, 1, 2]
+    assert three.likes == 1
+    assert tag.views == 1
+
+
+def test_overlay_adds_what_is_not_flushed_yet():
+    async def run():
+        (video,) = await make_videos(1)
+        buffer = CounterBuffer(flush_interval=60, max_pending=100)
+        buffer.incr(Video, video.id, "likes")
+        buffer.incr(Video, video.id, "likes")
+        before = buffer.overlay(Video, await Video.get(id=video.id)).likes
+        await buffer.flush()
+        after = buffer.overlay(Video, await Video.get(id=video.id)).likes
+        return before, after
+
+    assert run_with_db(run) == (2, 2)
+
+
+def test_stop_drains_the_buffer():
+    async def run():
+        (video,) = await make_videos(1)
+        buffer = CounterBuffer(flush_interval=60, max_pending=100)
+        await buffer.start()
+        buffer.incr(Video, video.id, "views")
+        await buffer.stop()
+        return (await Video.get(id=video.id)).views
+
+    assert run_with_db(run) == 1
+
+
+def test_flushes_once_max_pending_rows_are_buffered():
+    async def run():
+        videos = await make_videos(3)
+        buffer = CounterBuffer(flush_interval=60, max_pending=2)
+        await buffer.start()
+        for video in videos[:2]:
+            buffer.incr(Video, video.id, "views")
+        buffer.incr(Video, videos[0].id, "views")
+        await asyncio.sleep(0.1)
+        views = await Video.all().order_by("title").values_list("views", flat=True)
+        await buffer.stop()
+        return views
+
+    assert run_with_db(run) == [2, 1, 0]
@@ -0,0 +1,49 @@
+from app.models.user import User
+from app.models.video import Video
+from app.utils.counts import CountStrategy, count
+from tests.conftest import run_with_db
+
+
+def test_cached_count_is_reused_until_the_table_changes():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await Video.create(title="one", user=user)
+        query = Video.filter(user=user)
+        first = await count(query, CountStrategy.CACHED)
+
+        # bulk inserts fire no signals, so the cached count stays
+        await Video.bulk_create([Video(title="two", user=user)])
+        stale = await count(query, CountStrategy.CACHED)
+        exact = await count(query, CountStrategy.EXACT)
+
+        await Video.create(title="three", user=user)
+        fresh = await count(query, CountStrategy.CACHED)
+        return first, stale, exact, fresh
+
+    first, stale, exact, fresh = run_with_db(run)
+    assert first == (1, CountStrategy.CACHED)
+    assert stale == (1, CountStrategy.CACHED)
+    assert exact == (2, CountStrategy.EXACT)
+    assert fresh == (3, CountStrategy.CACHED)
+
+
+def test_counts_are_cached_per_query():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await Video.create(title="one", user=user)
+        success = Video.filter(loading_status=Video.LoadingStatus.SUCCESS)
+        return (
+            await count(Video.all(), CountStrategy.CACHED),
+            await count(success, CountStrategy.CACHED),
+        )
+
+    assert run_with_db(run) == ((1, CountStrategy.CACHED), (0, CountStrategy.CACHED))
+
+
+def test_estimate_falls_back_to_a_cached_count_without_postgres():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await Video.create(title="one", user=user)
+        return await count(Video.all(), CountStrategy.ESTIMATE)
+
+    assert run_with_db(run) == (1, CountStrategy.CACHED)
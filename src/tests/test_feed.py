@@ -0,0 +1,100 @@
+from app.models.user import User, UserFollowing
+from app.models.video import FeedEntry, Video, VideoModel
+from app.utils.feed import backfill, fan_out, feed_sources, forget_author, trim_inbox
+from app.utils.paginator import paginate_merged
+from tests.conftest import params, run_with_db
+
+SUCCESS = Video.LoadingStatus.SUCCESS
+
+
+async def feed_titles(user, size=50):
+    titles, cursor = [], None
+    while True:
+        page = await paginate_merged(
+            await feed_sources(user.id), params(cursor, size), VideoModel
+        )
+        titles += [item["title"] for item in page.items]
+        if page.next is None:
+            return titles
+        cursor = page.next
+
+
+async def post(author, title):
+    video = await Video.create(title=title, user=author, loading_status=SUCCESS)
+    await fan_out(video)
+    return video
+
+
+def test_videos_are_fanned_out_to_followers():
+    async def run():
+        author = await User.create(username="author", email="a@b.co")
+        reader = await User.create(username="reader", email="r@b.co")
+        other = await User.create(username="other", email="o@b.co")
+        await UserFollowing.create(user=reader, following_user=author)
+        for title in "abc":
+            await post(author, title)
+        await post(other, "not followed")
+        return await feed_titles(reader, size=2), await FeedEntry.all().count()
+
+    assert run_with_db(run) == (["c", "b", "a"], 3)
+
+
+def test_authors_with_many_followers_are_merged_at_read_time(monkeypatch):
+    monkeypatch.setattr("app.utils.feed.settings.FEED_FANOUT_MAX_FOLLOWERS", 1)
+
+    async def run():
+        star = await User.create(username="star", email="s@b.co")
+        author = await User.create(username="author", email="a@b.co")
+        reader = await User.create(username="reader", email="r@b.co")
+        fan = await User.create(username="fan", email="f@b.co")
+        await UserFollowing.create(user=reader, following_user=author)
+        await UserFollowing.create(user=reader, following_user=star)
+        await UserFollowing.create(user=fan, following_user=star)
+        await post(author, "1")
+        await post(star, "2")
+        await post(author, "3")
+        await post(star, "4")
+        entries = await FeedEntry.filter(author=star).count()
+        return await feed_titles(reader, size=3), entries
+
+    assert run_with_db(run) == (["4", "3", "2", "1"], 0)
+
+
+def test_follow_backfills_and_unfollow_forgets():
+    async def run():
+        author = await User.create(username="author", email="a@b.co")
+        reader = await User.create(username="reader", email="r@b.co")
+        for title in "ab":
+            await post(author, title)
+        await UserFollowing.create(user=reader, following_user=author)
+        await backfill(reader.id, author.id)
+        followed = await feed_titles(reader)
+        await forget_author(reader.id, author.id)
+        return followed, await feed_titles(reader)
+
+    assert run_with_db(run) == (["b", "a"], [])
+
+
+def test_fan_out_and_backfill_keep_the_newest_entries(monkeypatch):
+    monkeypatch.setattr("app.utils.feed.settings.FEED_INBOX_SIZE", 2)
+    monkeypatch.setattr("app.utils.feed.settings.FEED_FANOUT_BATCH", 1)
+
+    async def run():
+        author = await User.create(username="author", email="a@b.co")
+        other = await User.create(username="other", email="o@b.co")
+        reader = await User.create(username="reader", email="r@b.co")
+        fan = await User.create(username="fan", email="f@b.co")
+        await UserFollowing.create(user=reader, following_user=author)
+        await UserFollowing.create(user=fan, following_user=author)
+        for title in "abcd":
+            await post(author, title)
+        fanned_out = await feed_titles(reader), await feed_titles(fan)
+        await post(other, "e")
+        await UserFollowing.create(user=reader, following_user=other)
+        await backfill(reader.id, other.id)
+        # nothing is over the size any more
+        return fanned_out, await feed_titles(reader), await trim_inbox(reader.id)
+
+    fanned_out, backfilled, removed = run_with_db(run)
+    assert fanned_out == (["d", "c"], ["d", "c"])
+    assert backfilled == ["e", "d"] and removed == 0
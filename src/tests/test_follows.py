@@ -0,0 +1,59 @@
+import asyncio
+
+from app.models.user import User, UserFollowing
+from app.utils.follows import follow, followed_ids, remove_follows, unfollow
+from tests.conftest import run_with_db
+
+
+async def _users(count):
+    return [
+        await User.create(username=f"u{i}", email=f"u{i}@b.co") for i in range(count)
+    ]
+
+
+async def _counts(users):
+    rows = await User.filter(id__in=[user.id for user in users]).order_by("id")
+    return [(user.followers_count, user.following_count) for user in rows]
+
+
+def test_follow_once_and_keep_counts():
+    async def run():
+        a, b = await _users(2)
+        results = await asyncio.gather(follow(a.id, b.id), follow(a.id, b.id))
+        followed = await _counts([a, b])
+        again = await follow(a.id, b.id)
+        left = await unfollow(a.id, b.id), await unfollow(a.id, b.id)
+        return results, followed, again, left, await _counts([a, b])
+
+    results, followed, again, left, unfollowed = run_with_db(run)
+    assert sorted(results) == [False, True]
+    assert followed == [(0, 1), (1, 0)]
+    assert again is False
+    assert left == (True, False)
+    assert unfollowed == [(0, 0), (0, 0)]
+
+
+def test_followed_ids_of_a_page():
+    async def run():
+        me, *others = await _users(4)
+        await follow(me.id, others[0].id)
+        await follow(me.id, others[2].id)
+        await follow(others[1].id, me.id)
+        return others, await followed_ids(me.id, [other.id for other in others])
+
+    others, ids = run_with_db(run)
+    assert sorted(ids) == [others[0].id, others[2].id]
+
+
+def test_removing_follows_of_a_user_updates_the_others():
+    async def run():
+        gone, a, b = await _users(3)
+        await follow(gone.id, a.id)
+        await follow(b.id, gone.id)
+        await follow(a.id, b.id)
+        await remove_follows(gone.id)
+        return await _counts([a, b]), await UserFollowing.all().count()
+
+    counts, left = run_with_db(run)
+    assert counts == [(0, 1), (1, 0)]
+    assert left == 1
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from datetime import timedelta
+
+from tortoise.timezone import now
+
+from app.core.config import get_settings
+from app.models.user import User
+from app.models.video import EncodingJob, Video
+from app.utils import jobs
+from app.utils.jobs import claim_job, requeue_stale_jobs, run_job
+from app.utils.video import enqueue_encoding
+from tests.conftest import run_with_db
+
+settings = get_settings()
+
+
+async def _job(input_path="/nonexistent.mp4", **fields) -> EncodingJob:
+    user = await User.get_or_none(id=1) or await User.create(
+        username="a", email="a@b.co"
+    )
+    video = await Video.create(title="x", user=user)
+    job = await enqueue_encoding(video, "videos", input_path, "x.mp4")
+    if fields:
+        await EncodingJob.filter(id=job.id).update(**fields)
+    return await EncodingJob.get(id=job.id)
+
+
+def test_concurrent_claims_never_share_a_job():
+    async def run():
+        due = [await _job() for _ in range(3)]
+        await _job(run_after=now() + timedelta(hours=1))
+        claimed = await asyncio.gather(*(claim_job() for _ in range(5)))
+        return due, claimed
+
+    due, claimed = run_with_db(run)
+    taken = [job for job in claimed if job is not None]
+    assert sorted(job.id for job in taken) == [job.id for job in due]
+    assert all(job.status == EncodingJob.Status.RUNNING for job in taken)
+    assert all(job.attempts == 1 for job in taken)
+
+
+def test_stale_jobs_are_retried_until_their_attempts_run_out(tmp_path):
+    source = tmp_path / "source.mp4"
+    source.write_bytes(b"x")
+    stale = now() - timedelta(seconds=settings.JOB_STALE_TIMEOUT + 1)
+
+    async def run():
+        retried = await _job(status=EncodingJob.Status.RUNNING, heartbeat=stale)
+        exhausted = await _job(
+            str(source),
+            status=EncodingJob.Status.RUNNING,
+            heartbeat=stale,
+            attempts=settings.JOB_MAX_ATTEMPTS,
+        )
+        alive = await _job(status=EncodingJob.Status.RUNNING, heartbeat=now())
+        requeued = await requeue_stale_jobs()
+        return (
+            requeued,
+            [await EncodingJob.get(id=job.id) for job in (retried, exhausted, alive)],
+            await Video.get(id=exhausted.video_id),
+        )
+
+    requeued, (retried, exhausted, alive), video = run_with_db(run)
+    assert requeued == 1
+    assert retried.status == EncodingJob.Status.QUEUED
+    assert exhausted.status == EncodingJob.Status.FAILED
+    assert video.loading_status == Video.LoadingStatus.FAIL
+    assert not os.path.exists(source)
+    assert alive.status == EncodingJob.Status.RUNNING
+
+
+def test_failed_runs_back_off_then_fail(tmp_path, monkeypatch):
+    source = tmp_path / "source.mp4"
+    source.write_bytes(b"x")
+
+    async def failing_encode(*args):
+        return False, "broken source"
+
+    monkeypatch.setattr(jobs, "encode_video", failing_encode)
+
+    async def run():
+        job = await _job(str(source))
+        attempts = []
+        while True:
+            claimed = await claim_job()
+            if claimed is None:
+                # still backing off: make it due again
+                await EncodingJob.filter(id=job.id, status="queued").update(
+                    run_after=now()
+                )
+                claimed = await claim_job()
+            if claimed is None:
+                break
+            await run_job(claimed)
+            job = await EncodingJob.get(id=job.id)
+            attempts.append((job.status, job.run_after > now()))
+        return attempts, job, await Video.get(id=job.video_id)
+
+    attempts, job, video = run_with_db(run)
+    retries = [(EncodingJob.Status.QUEUED, True)] * (settings.JOB_MAX_ATTEMPTS - 1)
+    assert attempts == retries + [(EncodingJob.Status.FAILED, False)]
+    assert job.error == "broken source"
+    assert video.loading_status == Video.LoadingStatus.FAIL
+    assert not os.path.exists(source)
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+
+from app.core import s3 as s3_module
+from app.utils.media_cache import CacheBypass, DiskCache
+from tests.conftest import BUCKET, write_random
+
+
+async def _put(key, data):
+    async with s3_module.s3_client() as s3:
+        await s3.put_object(Bucket=BUCKET, Key=key, Body=data)
+
+
+async def _read(cache, key, start, end):
+    f = await cache.open(key)
+    return b"".join([chunk async for chunk in cache.stream(f, start, end)])
+
+
+def test_miss_then_hit_serves_ranges_from_disk(storage, tmp_path):
+    data = write_random(str(tmp_path / "src"), 4096)
+    cache = DiskCache(str(tmp_path / "cache"), 1024 * 1024, 1024 * 1024)
+
+    async def run():
+        await _put("video.mp4", data)
+        first = await cache.get("video.mp4")
+        second = await cache.get("video.mp4")
+        return first, second, await _read(cache, "video.mp4", 100, 199)
+
+    path, second, part = asyncio.run(run())
+    assert second == path
+    assert open(path, "rb").read() == data
+    assert part == data[100:200]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["fetched_bytes"] == len(data)
+    assert stats["served_bytes"] == 100
+
+
+def test_concurrent_misses_share_one_download(storage, tmp_path):
+    data = write_random(str(tmp_path / "src"), 64 * 1024)
+    cache = DiskCache(str(tmp_path / "cache"), 1024 * 1024, 1024 * 1024)
+
+    async def run():
+        await _put("viral.mp4", data)
+        return await asyncio.gather(*(cache.get("viral.mp4") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(set(results)) == 1
+    assert cache.fetched_bytes == len(data)
+    assert not [name for name in os.listdir(cache.root) if name.endswith(".part")]
+
+
+def test_least_recently_used_files_are_evicted(storage, tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 2500, 2500)
+
+    async def run():
+        for key in ("a", "b"):
+            await _put(key, os.urandom(1000))
+            await cache.get(key)
+        await cache.get("a")
+        await _put("c", os.urandom(1000))
+        await cache.get("c")
+
+    asyncio.run(run())
+    assert cache.evictions == 1
+    assert cache.size == 2000
+    assert len(os.listdir(cache.root)) == 2
+    assert cache.hits == 1
+
+
+def test_large_objects_bypass_the_cache(storage, tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 1024 * 1024, 100)
+
+    async def run():
+        await _put("large.mp4", os.urandom(1000))
+        with pytest.raises(CacheBypass) as bypass:
+            await cache.get("large.mp4")
+        return bypass.value.size
+
+    assert asyncio.run(run()) == 1000
+    assert os.listdir(cache.root) == []
+
+
+def test_open_files_outlive_their_eviction(storage, tmp_path):
+    data = write_random(str(tmp_path / "src"), 2000)
+    cache = DiskCache(str(tmp_path / "cache"), 2500, 2500)
+
+    async def run():
+        await _put("a", data)
+        await _put("b", os.urandom(2000))
+        streamed = await cache.open("a")
+        # evicted by a miss, then discarded, before the body is sent
+        await cache.get("b")
+        cache.discard("a")
+        return b"".join([chunk async for chunk in cache.stream(streamed, 0, 1999)])
+
+    assert asyncio.run(run()) == data
+    assert cache.evictions == 1
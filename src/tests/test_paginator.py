@@ -0,0 +1,89 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from tortoise.timezone import now
+
+from app.models.user import User, UserFollowing, UserModel
+from app.models.video import Video, VideoModel
+from app.utils.paginator import paginate
+from tests.conftest import params, run_with_db
+
+
+async def _videos(user, count):
+    start = now()
+    titles = []
+    for i in range(count):
+        video = await Video.create(title=f"v{i}", user=user)
+        # pairs of videos share a timestamp, so the id has to break ties
+        await Video.filter(id=video.id).update(
+            created=start + timedelta(seconds=i // 2)
+        )
+        titles.append(f"v{i}")
+    return titles
+
+
+def test_pages_walk_forward_and_back_without_gaps():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await _videos(user, 8)
+        query = Video.filter(user=user)
+
+        pages = [await paginate(query, params(size=3, include_total=True), VideoModel)]
+        while pages[-1].next:
+            pages.append(await paginate(query, params(pages[-1].next, 3), VideoModel))
+        back = [pages[-1]]
+        while back[-1].previous:
+            back.append(await paginate(query, params(back[-1].previous, 3), VideoModel))
+        return pages, back
+
+    pages, back = run_with_db(run)
+    titles = [[item["title"] for item in page.items] for page in pages]
+    assert [len(page) for page in titles] == [3, 3, 2]
+    flat = sum(titles, [])
+    assert sorted(flat) == [f"v{i}" for i in range(8)]
+    # newest first; titles sharing a timestamp are in id order
+    assert [int(t[1:]) // 2 for t in flat] == sorted(
+        (int(t[1:]) // 2 for t in flat), reverse=True
+    )
+    assert pages[0].total == 8 and pages[1].total is None
+    assert pages[0].previous is None
+    assert [[item["title"] for item in page.items] for page in reversed(back)] == titles
+
+
+def test_rows_joined_through_a_relation_page_in_its_order():
+    async def run():
+        me = await User.create(username="me", email="me@b.co")
+        others = [
+            await User.create(username=f"u{i}", email=f"u{i}@b.co") for i in range(4)
+        ]
+        # followed in another order than created
+        for other in others[2:] + others[:2]:
+            await UserFollowing.create(user=other, following_user=me)
+        query = User.filter(following__following_user_id=me.id)
+        first = await paginate(
+            query, params(size=3, include_total=True), UserModel, through="following"
+        )
+        second = await paginate(
+            query, params(first.next, 3), UserModel, through="following"
+        )
+        back = await paginate(
+            query, params(second.previous, 3), UserModel, through="following"
+        )
+        return first, second, back
+
+    first, second, back = run_with_db(run)
+    assert [user["username"] for user in first.items] == ["u1", "u0", "u3"]
+    assert [user["username"] for user in second.items] == ["u2"]
+    assert back.items == first.items
+    assert first.total == 4 and second.next is None
+
+
+def test_invalid_cursor_is_rejected():
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await paginate(Video.all(), params("bm90IGpzb24"), VideoModel)
+        return error.value.status_code
+
+    assert run_with_db(run) == 400
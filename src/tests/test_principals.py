@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.api import deps
+from app.core import security
+from app.core.resp import RespClient
+from app.models.user import User
+from app.utils.principals import Principal, PrincipalCache, principals
+from app.schemas import TokenPayload
+from tests.conftest import run_with_db, serve_resp
+
+
+@pytest.fixture(autouse=True)
+def fresh_principals():
+    """Forget what other tests saved as user 1, and this one."""
+    principals._principals.clear()
+    principals._revoked.clear()
+    yield
+    principals._principals.clear()
+    principals._revoked.clear()
+
+
+def _credentials(user: User) -> HTTPAuthorizationCredentials:
+    token = security.create_access_token(
+        user.id,
+        claims={"is_active": user.is_active, "is_superuser": user.is_superuser},
+    )
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_principals_are_read_once_until_invalidated():
+    async def run():
+        cache = PrincipalCache(ttl=60, negative_ttl=60, maxsize=10, revoked_ttl=60)
+        user = await User.create(username="a", email="a@b.co")
+        first = await asyncio.gather(*(cache.get(user.id) for _ in range(3)))
+        # neither a save nor a delete: nothing tells the cache
+        await User.filter(id=user.id).update(is_active=False)
+        cached = await cache.get(user.id)
+        await cache.invalidate(user.id)
+        return first, cached, await cache.get(user.id)
+
+    first, cached, reloaded = run_with_db(run)
+    assert set(first) == {cached} == {Principal(1, True, False)}
+    assert reloaded == Principal(1, False, False)
+
+
+def test_missing_users_are_remembered_for_the_negative_ttl():
+    async def run():
+        cache = PrincipalCache(ttl=60, negative_ttl=0.05, maxsize=10, revoked_ttl=60)
+        missing = await cache.get(7)
+        await User.bulk_create([User(id=7, username="a", email="a@b.co")])
+        remembered = await cache.get(7)
+        await asyncio.sleep(0.06)
+        return missing, remembered, await cache.get(7)
+
+    missing, remembered, found = run_with_db(run)
+    assert missing is None and remembered is None
+    assert found == Principal(7, True, False)
+
+
+def test_token_claims_are_trusted_until_the_user_is_invalidated(monkeypatch):
+    monkeypatch.setattr(deps.settings, "AUTH_TOKEN_CLAIMS", True)
+
+    async def run():
+        # no save signal: it would revoke the claims issued in the same second
+        await User.bulk_create([User(id=1, username="a", email="a@b.co")])
+        user = await User.get(id=1)
+        credentials = _credentials(user)
+        await User.filter(id=user.id).update(is_active=False)
+        # the claims, not the row
+        trusted = await deps.get_current_active_user(
+            await deps.get_current_user(credentials)
+        )
+        await user.delete()
+        with pytest.raises(HTTPException) as deleted:
+            await deps.get_current_user(credentials)
+        return trusted, deleted.value
+
+    trusted, deleted = run_with_db(run)
+    assert trusted == Principal(1, True, False)
+    assert deleted.status_code == 401
+
+
+def test_superusers_are_checked_beyond_their_token():
+    async def run():
+        admin = await User.create(username="a", email="a@b.co", is_superuser=True)
+        credentials = _credentials(admin)
+        allowed = await deps.get_current_super_user(
+            await deps.get_current_user(credentials)
+        )
+        admin.is_superuser = False
+        await admin.save()
+        with pytest.raises(HTTPException) as demoted:
+            await deps.get_current_super_user(
+                Principal(admin.id, is_active=True, is_superuser=True)
+            )
+        return allowed, demoted.value
+
+    allowed, demoted = run_with_db(run)
+    assert allowed == Principal(1, True, True)
+    assert demoted.status_code == 400
+
+
+def test_invalidations_reach_the_other_processes():
+    async def run():
+        server = await serve_resp()
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        first, second = [
+            PrincipalCache(
+                ttl=60,
+                negative_ttl=60,
+                maxsize=10,
+                revoked_ttl=60,
+                shared=RespClient(url),
+            )
+            for _ in range(2)
+        ]
+        await User.bulk_create([User(id=1, username="a", email="a@b.co")])
+        claims = TokenPayload(
+            sub=1, iat=int(time.time()) - 1, is_active=True, is_superuser=False
+        )
+        before = await first.get(1), await first.from_claims(claims)
+        # deleted through the other process
+        await User.filter(id=1).delete()
+        await second.invalidate(1)
+        after = await first.get(1), await first.from_claims(claims)
+        for cache in (first, second):
+            await cache.close()
+        server.close()
+        return before, after
+
+    before, after = run_with_db(run)
+    assert before == (Principal(1, True, False), Principal(1, True, False))
+    assert after == (None, None)
@@ -0,0 +1,75 @@
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.models.comment import Comment, CommentModel
+from app.models.user import User, UserFollowing, UserModel
+from app.models.video import Category, Tag, Video, VideoModel
+from app.utils.counters import counter_buffer
+from app.utils.paginator import CursorPage, load_items, paginate
+from app.utils.projection import render_json
+from tests.conftest import params, run_with_db
+
+
+def _pydantic_json(content) -> bytes:
+    """What FastAPI sends for `content` through the response model."""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+async def _models(model, ids):
+    orig_model = model.__config__.orig_model
+    items = await model.from_queryset(orig_model.filter(pk__in=ids))
+    by_pk = {str(item.id): counter_buffer.overlay(orig_model, item) for item in items}
+    return [by_pk[str(pk)] for pk in ids]
+
+
+def test_projected_items_render_like_the_pydantic_models():
+    async def run():
+        user = await User.create(username="ä", email="a@b.co", full_name="Ünï")
+        other = await User.create(username="b", email="b@b.co")
+        await UserFollowing.create(user=other, following_user=user)
+        music = await Category.create(name="music")
+        tagged = await Video.create(title="x", user=user, duration=1.5, category=music)
+        bare = await Video.create(title="y", user=other)
+        for name in ("b", "a"):
+            await tagged.tags.add(await Tag.create(name=name))
+        comment = await Comment.create(text="hi", user=user, video=tagged)
+        await Comment.create(text="re", user=other, video=tagged, reply_to=comment)
+        counter_buffer.incr(Video, bare.id, "views", 2)
+
+        pairs = []
+        for model, ids in (
+            (VideoModel, [bare.id, tagged.id]),
+            (UserModel, [other.id, user.id]),
+            (CommentModel, [2, 1]),
+        ):
+            pairs.append(
+                (
+                    render_json(await load_items(model, ids)),
+                    _pydantic_json(await _models(model, ids)),
+                )
+            )
+        counter_buffer._pending.clear()
+        return pairs
+
+    for projected, validated in run_with_db(run):
+        assert projected == validated
+
+
+def test_pages_render_like_the_validated_pages():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        for i in range(3):
+            await Video.create(title=f"v{i}", user=user)
+        page = await paginate(
+            Video.all(), params(size=2, include_total=True), VideoModel
+        )
+        validated = CursorPage[VideoModel](
+            **{
+                **page.dict(),
+                "items": await _models(VideoModel, [item["id"] for item in page.items]),
+            }
+        )
+        return render_json(page), _pydantic_json(validated)
+
+    projected, validated = run_with_db(run)
+    assert projected == validated
@@ -0,0 +1,61 @@
+from app.models.user import User
+from app.models.video import Reaction, Video
+from app.utils.reactions import react, remove_reactions, user_reactions
+from tests.conftest import run_with_db
+
+LIKE, DISLIKE = Reaction.Kind.LIKE, Reaction.Kind.DISLIKE
+
+
+async def counts(video):
+    video = await Video.get(id=video.id)
+    return video.likes, video.dislikes
+
+
+def test_reactions_toggle_and_replace_each_other():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        video = await Video.create(title="one", user=user)
+        steps = []
+        for kind in (LIKE, LIKE, LIKE, DISLIKE, LIKE):
+            steps.append((await react(user.id, video.id, kind), await counts(video)))
+        return steps, await Reaction.all().count()
+
+    steps, rows = run_with_db(run)
+    assert steps == [
+        (LIKE, (1, 0)),
+        (None, (0, 0)),
+        (LIKE, (1, 0)),
+        (DISLIKE, (0, 1)),
+        (LIKE, (1, 0)),
+    ]
+    assert rows == 1
+
+
+def test_reactions_of_a_page_in_one_lookup():
+    async def run():
+        a = await User.create(username="a", email="a@b.co")
+        b = await User.create(username="b", email="b@b.co")
+        one, two, three = [await Video.create(title=t, user=a) for t in "123"]
+        await react(a.id, one.id, LIKE)
+        await react(a.id, two.id, DISLIKE)
+        await react(b.id, three.id, LIKE)
+        return (
+            await user_reactions(a.id, [one.id, two.id, three.id]),
+            {str(one.id): LIKE, str(two.id): DISLIKE},
+        )
+
+    found, expected = run_with_db(run)
+    assert found == expected
+
+
+def test_removing_a_user_takes_their_reactions_back():
+    async def run():
+        a = await User.create(username="a", email="a@b.co")
+        b = await User.create(username="b", email="b@b.co")
+        video = await Video.create(title="one", user=a)
+        await react(a.id, video.id, LIKE)
+        await react(b.id, video.id, LIKE)
+        await remove_reactions(b.id)
+        return await counts(video), await Reaction.filter(user=b).count()
+
+    assert run_with_db(run) == ((1, 0), 0)
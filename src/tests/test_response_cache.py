@@ -0,0 +1,105 @@
+import asyncio
+
+from starlette.requests import Request
+
+from app.core.resp import RespClient
+from app.utils.response_cache import ResponseCache
+from tests.conftest import serve_resp
+
+
+def _request(path="/videos/", query=b""):
+    return Request({"type": "http", "path": path, "query_string": query, "headers": []})
+
+
+class _Counter:
+    """An endpoint returning how often it was computed."""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"calls": self.calls}
+
+
+def test_concurrent_misses_are_computed_once():
+    async def run():
+        cache = ResponseCache({"videos": 10}, stale=10, maxsize=10)
+        compute = _Counter(delay=0.01)
+        responses = await asyncio.gather(
+            *(
+                cache.respond(_request(), "videos", ["videos"], compute)
+                for _ in range(5)
+            )
+        )
+        hit = await cache.respond(_request(), "videos", ["videos"], compute)
+        other = await cache.respond(
+            _request(query=b"size=2"), "videos", ["videos"], compute
+        )
+        return compute.calls, responses, hit, other
+
+    calls, responses, hit, other = asyncio.run(run())
+    assert calls == 2
+    assert {response.body for response in responses} == {b'{"calls":1}'}
+    assert (hit.headers["X-Cache"], hit.body) == ("HIT", b'{"calls":1}')
+    assert other.body == b'{"calls":2}'
+
+
+def test_stale_pages_are_served_while_recomputed():
+    async def run():
+        cache = ResponseCache({"videos": 0.05}, stale=10, maxsize=10)
+        compute = _Counter()
+        await cache.respond(_request(), "videos", ["videos"], compute)
+        await asyncio.sleep(0.06)
+        stale = await cache.respond(_request(), "videos", ["videos"], compute)
+        await asyncio.sleep(0.01)
+        fresh = await cache.respond(_request(), "videos", ["videos"], compute)
+        return stale, fresh
+
+    stale, fresh = asyncio.run(run())
+    assert (stale.headers["X-Cache"], stale.body) == ("STALE", b'{"calls":1}')
+    assert (fresh.headers["X-Cache"], fresh.body) == ("HIT", b'{"calls":2}')
+
+
+def test_invalidation_reaches_other_processes_through_the_shared_server():
+    async def run():
+        server = await serve_resp()
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        first, second = [
+            ResponseCache({"video": 10}, stale=10, maxsize=10, shared=RespClient(url))
+            for _ in range(2)
+        ]
+        compute = _Counter()
+        scopes = ["video:1"]
+        computed = await first.respond(_request("/v/1"), "video", scopes, compute)
+        shared = await second.respond(_request("/v/1"), "video", scopes, compute)
+        await second.invalidate("video:1")
+        again = await first.respond(_request("/v/1"), "video", scopes, compute)
+        for cache in (first, second):
+            await cache.close()
+        server.close()
+        return computed, shared, again
+
+    computed, shared, again = asyncio.run(run())
+    assert computed.headers["X-Cache"] == "MISS"
+    assert (shared.headers["X-Cache"], shared.body) == ("HIT", b'{"calls":1}')
+    assert (again.headers["X-Cache"], again.body) == ("MISS", b'{"calls":2}')
+
+
+def test_unreachable_shared_server_only_costs_its_hits():
+    async def run():
+        cache = ResponseCache(
+            {"videos": 10},
+            stale=10,
+            maxsize=10,
+            shared=RespClient("redis://127.0.0.1:1", timeout=0.1),
+        )
+        compute = _Counter()
+        first = await cache.respond(_request(), "videos", ["videos"], compute)
+        second = await cache.respond(_request(), "videos", ["videos"], compute)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.body == second.body == b'{"calls":1}'
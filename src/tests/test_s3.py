@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+import pytest
+import requests
+
+from app.core import s3 as s3_module
+from app.core.config import get_settings
+from tests.conftest import BUCKET, MiB, write_random
+
+settings = get_settings()
+
+
+async def _read(key):
+    async with s3_module.s3_client() as s3:
+        obj = await s3.get_object(Bucket=BUCKET, Key=key)
+        async with obj["Body"] as stream:
+            return await stream.read()
+
+
+def test_upload_small_file_with_put_object(storage, tmp_path):
+    path = str(tmp_path / "small.mp4")
+    data = write_random(path, 1024)
+
+    async def run():
+        async with s3_module.s3_client() as s3:
+            await s3_module.upload_file(s3, BUCKET, "small.mp4", path, len(data))
+        return await _read("small.mp4")
+
+    assert asyncio.run(run()) == data
+
+
+def test_upload_large_file_in_parts(storage, tmp_path):
+    path = str(tmp_path / "large.mp4")
+    data = write_random(path, 11 * MiB)
+
+    async def run():
+        async with s3_module.s3_client() as s3:
+            await s3_module.upload_file(s3, BUCKET, "large.mp4", path, len(data))
+            head = await s3.head_object(Bucket=BUCKET, Key="large.mp4")
+        return head, await _read("large.mp4")
+
+    head, body = asyncio.run(run())
+    assert body == data
+    # multipart ETags carry the part count
+    assert head["ETag"].strip('"').endswith("-3")
+
+
+def test_failed_part_aborts_upload(storage, tmp_path):
+    path = str(tmp_path / "broken.mp4")
+    data = write_random(path, 11 * MiB)
+
+    class FailingPart:
+        def __init__(self, s3):
+            self._s3 = s3
+
+        def __getattr__(self, name):
+            return getattr(self._s3, name)
+
+        async def upload_part(self, **kwargs):
+            if kwargs["PartNumber"] == 2:
+                raise RuntimeError("connection reset")
+            return await self._s3.upload_part(**kwargs)
+
+    async def run():
+        async with s3_module.s3_client() as s3:
+            with pytest.raises(RuntimeError):
+                await s3_module.upload_file(
+                    FailingPart(s3), BUCKET, "broken.mp4", path, len(data)
+                )
+            uploads = await s3.list_multipart_uploads(Bucket=BUCKET)
+            objects = await s3.list_objects_v2(Bucket=BUCKET, Prefix="broken")
+        return uploads, objects
+
+    uploads, objects = asyncio.run(run())
+    assert not uploads.get("Uploads")
+    assert objects["KeyCount"] == 0
+
+
+def test_shared_client_is_reused(storage):
+    async def run():
+        client = await s3_module.open_s3_client()
+        try:
+            async with s3_module.s3_client() as first:
+                async with s3_module.s3_client() as second:
+                    return client, first, second
+        finally:
+            await s3_module.close_s3_client()
+
+    client, first, second = asyncio.run(run())
+    assert first is client and second is client
+
+
+def test_presigned_url_is_cached_and_served_by_storage(storage, tmp_path):
+    path = str(tmp_path / "play.mp4")
+    data = write_random(path, 2048)
+    s3_module._presigned_urls.clear()
+
+    async def run():
+        async with s3_module.s3_client() as s3:
+            await s3_module.upload_file(s3, BUCKET, "play.mp4", path, len(data))
+        return (
+            await s3_module.presigned_url("play.mp4"),
+            await s3_module.presigned_url("play.mp4"),
+        )
+
+    (url, expires_in), (cached_url, _) = asyncio.run(run())
+    assert cached_url == url
+    assert 0 < expires_in <= settings.S3_PRESIGN_EXPIRES
+
+    response = requests.get(url, headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.content == data[:100]
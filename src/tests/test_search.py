@@ -0,0 +1,95 @@
+from app.models.user import User
+from app.models.video import Tag, Video
+from app.utils.search import Autocomplete, SearchKind, Trie, search
+from tests.conftest import run_with_db
+
+SUCCESS = Video.LoadingStatus.SUCCESS
+
+
+def test_search_ranks_whole_and_prefix_matches_first():
+    async def run():
+        user = await User.create(username="catlover", email="a@b.co")
+        await User.create(username="dog", email="d@b.co", full_name="Cat Person")
+        for title, views in (
+            ("my funny cat", 100),
+            ("cat", 1),
+            ("catching waves", 50),
+            ("black cats", 10),
+        ):
+            await Video.create(
+                title=title, user=user, views=views, loading_status=SUCCESS
+            )
+        await Video.create(title="cat pending", user=user)
+        await Tag.create(name="cats", views=5)
+        await Tag.create(name="bobcat", views=50)
+        return await search("Cat", SearchKind.ALL, limit=10)
+
+    results = run_with_db(run)
+    assert [video["title"] for video in results["videos"]] == [
+        "cat",
+        "catching waves",
+        "my funny cat",
+        "black cats",
+    ]
+    assert [tag["name"] for tag in results["tags"]] == ["cats", "bobcat"]
+    assert [user["username"] for user in results["users"]] == ["catlover", "dog"]
+
+
+def test_search_requires_every_word():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await Video.create(title="funny cat", user=user, loading_status=SUCCESS)
+        await Video.create(title="funny dog", user=user, loading_status=SUCCESS)
+        return await search("cat funny", SearchKind.VIDEOS)
+
+    results = run_with_db(run)
+    assert [video["title"] for video in results["videos"]] == ["funny cat"]
+    assert results["tags"] == results["users"] == []
+
+
+def test_whole_and_prefix_matches_are_never_crowded_out(monkeypatch):
+    monkeypatch.setattr("app.utils.search.settings.SEARCH_CANDIDATES", 2)
+
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        for title, views in (
+            ("my cat", 300),
+            ("black cat", 200),
+            ("cat videos", 2),
+            ("Cat", 1),
+        ):
+            await Video.create(
+                title=title, user=user, views=views, loading_status=SUCCESS
+            )
+        return await search("cat", SearchKind.VIDEOS)
+
+    results = run_with_db(run)
+    assert [video["title"] for video in results["videos"]] == [
+        "Cat",
+        "cat videos",
+        "my cat",
+        "black cat",
+    ]
+
+
+def test_trie_completes_by_weight_within_bounds():
+    trie = Trie(max_terms=4, depth=3, top=2)
+    for term, weight in (("cats", 1), ("catalog", 5), ("Cathedral", 3), ("dog", 9)):
+        trie.insert(term, weight)
+    trie.insert("catnip", 100)
+
+    assert trie.complete("CA", 10) == ["catalog", "Cathedral"]
+    assert trie.complete("cath", 10) == ["Cathedral"]
+    assert trie.complete("x", 10) == []
+    # over max_terms
+    assert "catnip" not in trie.terms
+
+
+def test_autocomplete_loads_tags_and_usernames():
+    async def run():
+        await User.create(username="tagger", email="a@b.co")
+        await Tag.create(name="tatoo", views=1)
+        await Tag.create(name="tago", views=7)
+        return await Autocomplete(refresh_interval=60).suggest("ta", 5)
+
+    assert run_with_db(run) == (["tago", "tatoo"], ["tagger"])
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+
+from app.core import security
+from app.core.security import HashingPool
+
+
+def test_passwords_of_another_cost_are_rehashed():
+    async def run():
+        old = bcrypt.using(rounds=5).hash("secret")
+        return (
+            await security.verify_password("secret", old),
+            await security.verify_password("wrong", old),
+            await security.verify_password(
+                "secret", await security.get_password_hash("secret")
+            ),
+        )
+
+    (matches, new_hash), wrong, current = asyncio.run(run())
+    assert matches and bcrypt.from_string(new_hash).rounds == 4
+    assert bcrypt.verify("secret", new_hash)
+    assert wrong == (False, None) and current == (True, None)
+
+
+def test_hashing_beyond_the_queue_is_refused():
+    release = threading.Event()
+
+    async def run():
+        pool = HashingPool(workers=1, queue=1)
+        busy = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as refused:
+            await pool.run(release.wait)
+        release.set()
+        done = await asyncio.gather(*busy)
+        again = await pool.run(lambda: "hashed")
+        pool.close()
+        return refused.value, done, again
+
+    refused, done, again = asyncio.run(run())
+    assert refused.status_code == 503 and refused.headers == {"Retry-After": "1"}
+    assert done == [True, True] and again == "hashed"
+
+
+def test_hashing_leaves_the_event_loop_responsive():
+    hashed = bcrypt.using(rounds=10).hash("secret")
+
+    async def run():
+        pool = HashingPool(workers=2, queue=8)
+        lags = []
+
+        async def tick():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0)
+                lags.append(time.perf_counter() - started)
+
+        ticking = asyncio.ensure_future(tick())
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(pool.run(bcrypt.verify, "secret", hashed) for _ in range(8))
+        )
+        took = time.perf_counter() - started
+        ticking.cancel()
+        pool.close()
+        return took, max(lags)
+
+    took, lag = asyncio.run(run())
+    # inline, the loop would stall for the whole burst
+    assert lag < took / 4
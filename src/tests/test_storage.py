@@ -0,0 +1,188 @@
+import asyncio
+from datetime import timedelta
+from email.utils import formatdate
+
+import pytest
+
+from app.core import storage as storage_module
+from app.core.config import Storages
+from app.core.storage import (
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    StorageBackend,
+    StorageNotFound,
+)
+from app.utils.media_cache import DiskCache
+from app.utils.streaming import MediaRequestHeaders, conditional_response
+from tests.conftest import BUCKET, write_random
+
+
+@pytest.fixture(params=["local", "memory", "s3"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path / "media"))
+    if request.param == "memory":
+        return MemoryStorage()
+    request.getfixturevalue("storage")
+    return S3Storage(BUCKET)
+
+
+async def _collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+def test_backends_behave_alike(backend, tmp_path):
+    data = write_random(str(tmp_path / "video.mp4"), 3000)
+
+    async def run():
+        await backend.put("videos/video.mp4", str(tmp_path / "video.mp4"))
+        await backend.put("hls/1/master.m3u8", str(tmp_path / "video.mp4"))
+        stat = await backend.stat("videos/video.mp4")
+        whole = await backend.get("videos/video.mp4")
+        part = await _collect(backend.stream("videos/video.mp4", 10, 19))
+        opened, streamer = await backend.open("videos/video.mp4")
+        tail = await _collect(streamer(2990, 2999))
+
+        await backend.delete("videos/video.mp4")
+        await backend.delete("videos/video.mp4")
+        await backend.delete_prefix("hls/1")
+        missing = []
+        for key in ("videos/video.mp4", "hls/1/master.m3u8"):
+            with pytest.raises(StorageNotFound):
+                await backend.stat(key)
+            missing.append(key)
+        return stat, opened, whole, part, tail, missing
+
+    stat, opened, whole, part, tail, missing = asyncio.run(run())
+    assert stat == opened
+    assert stat.size == len(data)
+    assert stat.etag.startswith('"') and stat.etag.endswith('"')
+    assert whole == data
+    assert part == data[10:20]
+    assert tail == data[2990:]
+    assert len(missing) == 2
+
+
+def test_local_storage_stays_inside_its_root(tmp_path):
+    backend = LocalStorage(str(tmp_path / "media"))
+    with pytest.raises(StorageNotFound):
+        asyncio.run(backend.stat("../outside.mp4"))
+
+
+def test_backends_must_implement_every_operation():
+    class Incomplete(StorageBackend):
+        async def put(self, key, path):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def _headers(**values):
+    fields = ("range_header", "if_range", "if_none_match", "if_modified_since")
+    return MediaRequestHeaders(**{field: values.get(field) for field in fields})
+
+
+@pytest.fixture
+def stored(tmp_path):
+    backend = MemoryStorage(Storages.LOCAL)
+    path = str(tmp_path / "video.mp4")
+    write_random(path, 1000)
+    asyncio.run(backend.put("videos/video.mp4", path))
+    return asyncio.run(backend.open("videos/video.mp4"))
+
+
+def _respond(stored, **headers):
+    stat, streamer = stored
+    return conditional_response(
+        _headers(**headers), streamer, stat.size, stat.etag, stat.last_modified
+    )
+
+
+def test_response_carries_validators_and_cache_policy(stored):
+    stat, _ = stored
+    response = _respond(stored)
+    assert response.status_code == 200
+    assert response.headers["etag"] == stat.etag
+    assert response.headers["last-modified"] == formatdate(
+        stat.last_modified.timestamp(), usegmt=True
+    )
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_matching_etag_is_not_modified(stored):
+    stat, _ = stored
+    assert _respond(stored, if_none_match=stat.etag).status_code == 304
+    assert _respond(stored, if_none_match=f'"other", {stat.etag}').status_code == 304
+    assert _respond(stored, if_none_match='"other"').status_code == 200
+
+
+def test_if_modified_since(stored):
+    stat, _ = stored
+    same = formatdate(stat.last_modified.timestamp(), usegmt=True)
+    older = formatdate(
+        (stat.last_modified - timedelta(hours=1)).timestamp(), usegmt=True
+    )
+    assert _respond(stored, if_modified_since=same).status_code == 304
+    assert _respond(stored, if_modified_since=older).status_code == 200
+    assert _respond(stored, if_modified_since="garbage").status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    assert (
+        _respond(stored, if_none_match='"other"', if_modified_since=same).status_code
+        == 200
+    )
+
+
+def test_if_range_only_applies_ranges_to_the_same_version(stored):
+    stat, _ = stored
+    ranged = _respond(stored, range_header="bytes=0-9", if_range=stat.etag)
+    assert ranged.status_code == 206
+    assert ranged.headers["etag"] == stat.etag
+    stale = _respond(stored, range_header="bytes=0-9", if_range='"other"')
+    assert stale.status_code == 200
+
+
+def test_s3_disk_cache_keeps_the_object_validators(storage, tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache"), 1024 * 1024, 1024 * 1024)
+    monkeypatch.setattr(storage_module, "video_cache", cache)
+    monkeypatch.setattr(storage_module.settings, "S3_CACHE", True)
+    path = str(tmp_path / "video.mp4")
+    data = write_random(path, 2000)
+    backend = S3Storage(BUCKET)
+
+    async def run():
+        await backend.put("videos/cached.mp4", path)
+        opened, streamer = await backend.open("videos/cached.mp4")
+        return (
+            opened,
+            await backend.stat("videos/cached.mp4"),
+            await _collect(streamer(0, 1999)),
+        )
+
+    opened, stat, body = asyncio.run(run())
+    assert cache.misses == 1
+    assert opened == stat
+    assert body == data
+
+
+def test_s3_disk_cache_misses_fall_back_to_s3(storage, tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache"), 1024 * 1024, 1024 * 1024)
+    monkeypatch.setattr(storage_module, "video_cache", cache)
+    monkeypatch.setattr(storage_module.settings, "S3_CACHE", True)
+    path = str(tmp_path / "video.mp4")
+    data = write_random(path, 2000)
+    backend = S3Storage(BUCKET)
+
+    async def evicted_elsewhere(key):
+        raise FileNotFoundError(key)
+
+    async def run():
+        await backend.put("videos/evicted.mp4", path)
+        monkeypatch.setattr(cache, "open", evicted_elsewhere)
+        opened, streamer = await backend.open("videos/evicted.mp4")
+        return opened, await _collect(streamer(0, 1999))
+
+    opened, body = asyncio.run(run())
+    assert opened.size == len(data)
+    assert body == data
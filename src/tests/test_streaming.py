@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.core.config import get_settings
+from app.utils.streaming import (
+    MediaFiles,
+    file_streamer,
+    parse_range_header,
+    ranged_response,
+)
+from tests.conftest import write_random
+
+settings = get_settings()
+
+DATA = bytes(range(256)) * 4
+
+
+async def _streamer(start, end):
+    yield DATA[start : end + 1]
+
+
+async def _body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.mark.parametrize(
+    "header,ranges",
+    [
+        ("bytes=0-99", [(0, 99)]),
+        ("bytes=1000-", [(1000, 1023)]),
+        ("bytes=-24", [(1000, 1023)]),
+        ("bytes=-5000", [(0, 1023)]),
+        ("bytes=0-5000", [(0, 1023)]),
+        ("bytes=500-599,0-9,590-700", [(0, 9), (500, 700)]),
+        ("bytes=0-9,10-19", [(0, 19)]),
+        ("bytes=0-9,2000-", [(0, 9)]),
+        # the whole file: no header, other units, malformed ranges
+        (None, []),
+        ("items=0-9", []),
+        ("bytes=abc", []),
+        ("bytes=9-0", []),
+        ("bytes=0-1,x-y", []),
+    ],
+)
+def test_range_headers(header, ranges):
+    assert parse_range_header(header, len(DATA)) == ranges
+
+
+def test_too_many_ranges_serve_the_whole_file():
+    header = "bytes=" + ",".join(
+        f"{i * 10}-{i * 10 + 1}" for i in range(settings.STREAM_MAX_RANGES + 1)
+    )
+    assert parse_range_header(header, len(DATA)) == []
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(HTTPException) as raised:
+        parse_range_header(header, len(DATA))
+    assert raised.value.status_code == 416
+    assert raised.value.headers == {"Content-Range": f"bytes */{len(DATA)}"}
+
+
+def test_whole_and_single_range_responses():
+    whole = ranged_response(_streamer, len(DATA), None)
+    single = ranged_response(_streamer, len(DATA), "bytes=-10")
+
+    async def run():
+        return await _body(whole), await _body(single)
+
+    bodies = asyncio.run(run())
+
+    assert whole.status_code == 200 and bodies[0] == DATA
+    assert whole.headers["Accept-Ranges"] == "bytes"
+    assert whole.headers["Content-Length"] == str(len(DATA))
+    assert single.status_code == 206 and bodies[1] == DATA[-10:]
+    assert single.headers["Content-Range"] == "bytes 1014-1023/1024"
+    assert single.headers["Content-Length"] == "10"
+
+
+def test_multipart_byteranges_framing():
+    response = ranged_response(_streamer, len(DATA), "bytes=0-4,100-109", "video/mp4")
+    body = asyncio.run(_body(response))
+    boundary = response.media_type.split("boundary=")[1]
+
+    assert response.status_code == 206
+    assert response.media_type.startswith("multipart/byteranges; ")
+    assert response.headers["Content-Length"] == str(len(body))
+    assert body == (
+        f"--{boundary}\r\n"
+        "Content-Type: video/mp4\r\n"
+        "Content-Range: bytes 0-4/1024\r\n\r\n".encode()
+        + DATA[0:5]
+        + f"\r\n--{boundary}\r\n"
+        "Content-Type: video/mp4\r\n"
+        "Content-Range: bytes 100-109/1024\r\n\r\n".encode()
+        + DATA[100:110]
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+
+def test_file_streamer_reads_only_the_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_CHUNK_SIZE", 7)
+    data = write_random(str(tmp_path / "video.mp4"), 100)
+
+    async def run():
+        path = str(tmp_path / "video.mp4")
+        chunks = [chunk async for chunk in file_streamer(path, 10, 29)]
+        rest = b"".join([chunk async for chunk in file_streamer(path, 95)])
+        return chunks, rest
+
+    chunks, rest = asyncio.run(run())
+    assert b"".join(chunks) == data[10:30]
+    assert max(map(len, chunks)) == 7
+    assert rest == data[95:]
+
+
+def test_media_files_hide_uploads_and_the_disk_cache(tmp_path):
+    for name in ("videos", "tmp", "cache"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "a.mp4").write_bytes(b"x")
+    app = Starlette(routes=[Mount("/media", MediaFiles(directory=str(tmp_path)))])
+    client = TestClient(app)
+
+    served = client.get("/media/videos/a.mp4")
+    assert served.status_code == 200
+    assert "immutable" in served.headers["Cache-Control"]
+    for path in ("tmp/a.mp4", "cache/a.mp4", "videos/../tmp/a.mp4", "tmp"):
+        assert client.get(f"/media/{path}").status_code == 404
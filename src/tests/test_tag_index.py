@@ -0,0 +1,88 @@
+from tortoise.timezone import now
+
+from app.models.user import User
+from app.models.video import EncodingJob, Tag, Video
+from app.utils.tag_index import TagIndex, TagMatch, tagged_page
+from tests.conftest import params, run_with_db
+
+SUCCESS = Video.LoadingStatus.SUCCESS
+
+
+def titles(page):
+    return [item["title"] for item in page.items]
+
+
+async def tagged(user, title, *names, status=SUCCESS):
+    video = await Video.create(title=title, user=user, loading_status=status)
+    for name in names:
+        tag, _ = await Tag.get_or_create(name=name)
+        await video.tags.add(tag)
+    return video
+
+
+def test_all_and_any_match_over_the_index(monkeypatch):
+    index = TagIndex(refresh_interval=60, rebuild_interval=600)
+    monkeypatch.setattr("app.utils.tag_index.tag_index", index)
+
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await tagged(user, "a", "cats")
+        b = await tagged(user, "b", "cats", "dogs")
+        await tagged(user, "c", "dogs")
+        await tagged(user, "d", "cats", "dogs", status=Video.LoadingStatus.PENDING)
+        await tagged(user, "e", "cats", "dogs", "birds")
+        both = await tagged_page(
+            ["cats", "dogs"], TagMatch.ALL, params(include_total=True)
+        )
+        either = await tagged_page(["cats", "dogs"], TagMatch.ANY, params())
+        index.discard(b.id)
+        after_delete = await tagged_page(["cats", "dogs"], TagMatch.ALL, params())
+        unknown = await tagged_page(["cats", "fish"], TagMatch.ALL, params())
+        return (
+            titles(both),
+            both.total,
+            titles(either),
+            titles(after_delete),
+            titles(unknown),
+        )
+
+    assert run_with_db(run) == (["e", "b"], 2, ["e", "c", "b", "a"], ["e"], [])
+
+
+def test_pages_follow_the_cursors(monkeypatch):
+    index = TagIndex(refresh_interval=60, rebuild_interval=600)
+    monkeypatch.setattr("app.utils.tag_index.tag_index", index)
+
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        for title in "abcde":
+            await tagged(user, title, "cats")
+        first = await tagged_page(["cats"], TagMatch.ALL, params(size=2))
+        second = await tagged_page(["cats"], TagMatch.ALL, params(first.next, 2))
+        last = await tagged_page(["cats"], TagMatch.ALL, params(second.next, 2))
+        back = await tagged_page(["cats"], TagMatch.ALL, params(second.previous, 2))
+        return titles(first), titles(second), titles(last), last.next, titles(back)
+
+    assert run_with_db(run) == (["e", "d"], ["c", "b"], ["a"], None, ["e", "d"])
+
+
+def test_videos_finished_by_the_worker_are_caught_up(monkeypatch):
+    index = TagIndex(refresh_interval=0, rebuild_interval=600)
+    monkeypatch.setattr("app.utils.tag_index.tag_index", index)
+
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await tagged(user, "a", "cats")
+        await index.ensure_fresh()
+        video = await tagged(user, "b", "cats")
+        await EncodingJob.create(
+            video=video,
+            input_path="in",
+            filename="b.mp4",
+            upload_to="videos",
+            status=EncodingJob.Status.DONE,
+            finished=now(),
+        )
+        return titles(await tagged_page(["cats"], TagMatch.ANY, params()))
+
+    assert run_with_db(run) == ["b", "a"]
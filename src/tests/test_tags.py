@@ -0,0 +1,71 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models.user import User
+from app.models.video import Tag, Video
+from app.schemas import VideoImport
+from app.utils.video import create_video_with_tags, import_videos, parse_tags
+from tests.conftest import run_with_db
+
+
+def test_tags_are_normalized_and_deduplicated():
+    assert parse_tags(" a, a,b ,, #Funny  Cats,FUNNY cats") == ["a", "b", "funny cats"]
+    assert parse_tags(["x" * 100]) == ["x" * 64]
+
+
+def test_too_many_tags_are_refused():
+    with pytest.raises(HTTPException) as error:
+        parse_tags(",".join(str(i) for i in range(21)))
+    assert error.value.status_code == 400
+
+
+def test_video_is_created_with_new_and_existing_tags():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        await Tag.create(name="old")
+        video = await create_video_with_tags(
+            parse_tags("old, new"), title="one", user=user
+        )
+        tags = await video.tags.all().order_by("name").values_list("name", flat=True)
+        return tags, await Tag.all().count()
+
+    assert run_with_db(run) == (["new", "old"], 2)
+
+
+def test_import_creates_videos_and_tags_in_bulk():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        ids = await import_videos(
+            [
+                VideoImport(
+                    title="one", user_id=user.id, path="videos/1.mp4", tags=["a", "b"]
+                ),
+                VideoImport(
+                    title="two", user_id=user.id, path="videos/2.mp4", tags=["B"]
+                ),
+                VideoImport(title="three", user_id=user.id, path="videos/3.mp4"),
+            ]
+        )
+        videos = (
+            await Video.filter(id__in=ids).order_by("title").prefetch_related("tags")
+        )
+        return [
+            (video.title, video.loading_status, sorted(tag.name for tag in video.tags))
+            for video in videos
+        ]
+
+    SUCCESS = Video.LoadingStatus.SUCCESS
+    assert run_with_db(run) == [
+        ("one", SUCCESS, ["a", "b"]),
+        ("three", SUCCESS, []),
+        ("two", SUCCESS, ["b"]),
+    ]
+
+
+def test_import_refuses_unknown_users():
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await import_videos([VideoImport(title="one", user_id=7, path="x.mp4")])
+        return error.value.detail, await Video.all().count()
+
+    assert run_with_db(run) == ("Unknown user ids: [7]", 0)
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+import pytest
+
+from app.models.user import User
+from app.models.video import Category, Tag, Video
+from app.utils import trending
+from app.utils.trending import refresh_scores, score, trending_page
+from tests.conftest import params, run_with_db
+
+SUCCESS = Video.LoadingStatus.SUCCESS
+
+
+def test_score_halves_engagement_every_half_life(monkeypatch):
+    monkeypatch.setattr(trending.settings, "TRENDING_HALF_LIFE", 3600)
+    created = trending.EPOCH + timedelta(days=100)
+    older = score(200, 0, 0, created - timedelta(hours=1))
+    assert score(100, 0, 0, created) == pytest.approx(older)
+    assert score(100, 0, 0, created) > score(100, 0, 0, created - timedelta(hours=2))
+    assert score(10, 0, 0, created) > score(10, 0, 100, created)
+
+
+def titles(page):
+    return [item["title"] for item in page.items]
+
+
+def test_only_changed_scores_are_stored():
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        video = await Video.create(title="a", user=user, loading_status=SUCCESS)
+        await Video.create(title="pending", user=user)
+        first = await refresh_scores()
+        again = await refresh_scores()
+        await Video.filter(id=video.id).update(likes=3)
+        changed = await refresh_scores()
+        unscored = await Video.filter(score__isnull=True).count()
+        return first, again, changed, unscored
+
+    assert run_with_db(run) == (1, 0, 1, 1)
+
+
+def test_trending_pages_and_slices():
+    trending._rankings.clear()
+
+    async def run():
+        user = await User.create(username="a", email="a@b.co")
+        cats = await Tag.create(name="cats")
+        music = await Category.create(name="music")
+        for i, title in enumerate("abcde"):
+            video = await Video.create(
+                title=title, user=user, loading_status=SUCCESS, views=10**i
+            )
+            if title in "bd":
+                await video.tags.add(cats)
+                video.category = music
+                await video.save()
+        await refresh_scores()
+
+        first = await trending_page(params(size=2))
+        second = await trending_page(params(first.next, size=2))
+        back = await trending_page(params(second.previous, size=2))
+        return (
+            titles(first),
+            titles(second),
+            titles(back),
+            back.previous,
+            titles(await trending_page(params(), tag="cats")),
+            titles(await trending_page(params(), category=music.id)),
+            titles(await trending_page(params(), tag="dogs")),
+        )
+
+    first, second, back, previous, cats, music, dogs = run_with_db(run)
+    assert first == ["e", "d"]
+    assert second == ["c", "b"]
+    assert back == ["e", "d"] and previous is None
+    assert cats == music == ["d", "b"]
+    assert dogs == []
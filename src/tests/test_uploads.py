@@ -0,0 +1,118 @@
+import os
+from datetime import timedelta
+
+import pytest
+from starlette.requests import ClientDisconnect
+from tortoise.timezone import now
+
+from app.core.config import get_settings
+from app.models.user import User
+from app.models.video import UploadSession, Video
+from app.utils.video import (
+    UploadSizeExceeded,
+    expire_upload_sessions,
+    upload_session_expiry,
+    upload_session_path,
+    write_upload_chunk,
+)
+from tests.conftest import run_with_db
+
+settings = get_settings()
+
+
+@pytest.fixture(autouse=True)
+def media_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MEDIA_ROOT", str(tmp_path))
+
+
+async def _session(size=10, expires=None) -> UploadSession:
+    user = await User.create(username="a", email="a@b.co")
+    video = await Video.create(title="x", user=user)
+    session = await UploadSession.create(
+        user=user,
+        video=video,
+        content_type="video/mp4",
+        size=size,
+        expires=expires or upload_session_expiry(),
+    )
+    open(upload_session_path(session), "wb").close()
+    return session
+
+
+async def _body(*chunks, disconnect=False):
+    for chunk in chunks:
+        yield chunk
+    if disconnect:
+        raise ClientDisconnect()
+
+
+def _read(session):
+    with open(upload_session_path(session), "rb") as f:
+        return f.read()
+
+
+def test_chunks_are_committed_and_resumed():
+    async def run():
+        session = await _session()
+        first = await write_upload_chunk(session, 0, _body(b"abc", disconnect=True))
+        resumed = await write_upload_chunk(session, session.offset, _body(b"defghij"))
+        stored = await UploadSession.get(id=session.id)
+        return first, resumed, session, stored.offset
+
+    first, resumed, session, stored = run_with_db(run)
+    assert (first, resumed) == (3, 7)
+    assert session.offset == stored == 10
+    assert _read(session) == b"abcdefghij"
+
+
+def test_a_stale_offset_commits_nothing():
+    async def run():
+        session = await _session()
+        stale = await UploadSession.get(id=session.id)
+        await write_upload_chunk(session, 0, _body(b"abcd"))
+        written = await write_upload_chunk(stale, 0, _body(b"wxyz"))
+        return written, stale, (await UploadSession.get(id=session.id)).offset
+
+    written, stale, stored = run_with_db(run)
+    # the bytes reached the file but the offset only moves for its writer
+    assert written == 4
+    assert stale.offset == 0 and stored == 4
+
+
+def test_writing_past_the_declared_size_is_refused():
+    async def run():
+        session = await _session(size=10)
+        await write_upload_chunk(session, 0, _body(b"abcdef"))
+        with pytest.raises(UploadSizeExceeded):
+            await write_upload_chunk(session, 6, _body(b"ghij", b"k"))
+        return session, (await UploadSession.get(id=session.id)).offset
+
+    session, stored = run_with_db(run)
+    # what fitted is kept, the overflowing chunk never reaches the file
+    assert session.offset == stored == 10
+    assert _read(session) == b"abcdefghij"
+
+
+def test_abandoned_sessions_expire():
+    async def run():
+        expired = await _session(expires=now() - timedelta(seconds=1))
+        user = await User.get(id=expired.user_id)
+        video = await Video.create(title="y", user=user)
+        alive = await UploadSession.create(
+            user=user,
+            video=video,
+            content_type="video/mp4",
+            size=1,
+            expires=upload_session_expiry(),
+        )
+        removed = await expire_upload_sessions()
+        return (
+            removed,
+            expired,
+            await UploadSession.filter(id=alive.id).exists(),
+            await Video.filter(id=expired.video_id).exists(),
+        )
+
+    removed, expired, alive_kept, video_kept = run_with_db(run)
+    assert removed == 1 and alive_kept and not video_kept
+    assert not os.path.exists(upload_session_path(expired))